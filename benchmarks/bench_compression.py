@@ -1,7 +1,8 @@
 """Script comparing different pickling strategies."""
 
 from joblib.numpy_pickle import NumpyPickler, NumpyUnpickler
-from joblib.numpy_pickle_utils import BinaryZlibFile, BinaryGzipFile
+from joblib.compressor import BinaryZlibFile, BinaryGzipFile
+from joblib.compressor import ZstdFile, zstandard
 from pickle import _Pickler, _Unpickler, Pickler, Unpickler
 import numpy as np
 import bz2
@@ -237,6 +238,12 @@ compressors = OrderedDict([
     ("Lzma", (lzma.LZMAFile, '/tmp/test_lzma', 'wb',
                              {'preset': 3, 'format': lzma.FORMAT_ALONE})), ])
 
+if zstandard is not None:
+    compressors["Zstd"] = (ZstdFile, '/tmp/test_zstd', 'wb',
+                           {'compresslevel': 3})
+    compressors["Zstd-mt"] = (ZstdFile, '/tmp/test_zstd_mt', 'wb',
+                              {'compresslevel': 3, 'threads': -1})
+
 # Test 3 buffering strategies
 bufs = OrderedDict([
     ("None", (None, None)),
@@ -0,0 +1,60 @@
+"""
+Benching joblib hashing of Python objects.
+
+Compare the default hasher, built on the pure Python pickler, with the
+hasher built on the C pickler (``c_pickler=True``) and with pickle.dumps,
+which gives a lower bound of the time spent serializing the objects.
+"""
+from __future__ import print_function
+
+import pickle
+import sys
+import time
+
+import numpy as np
+
+from joblib.hashing import hash
+
+
+def timeit(func, *args, **kwargs):
+    """Return the best time of a few runs of func."""
+    times = []
+    for _ in range(5):
+        t0 = time.time()
+        func(*args, **kwargs)
+        times.append(time.time() - t0)
+    return min(times)
+
+
+def make_records(n_records):
+    """A list of small dicts of strings, as found in metadata."""
+    return [{'name': 'subject_%d' % i,
+             'group': 'patients' if i % 2 else 'controls',
+             'files': ['s%d_run%d.nii.gz' % (i, run) for run in range(3)],
+             'age': 20 + i % 50,
+             'tags': set(['t%d' % (i % 7), 't%d' % (i % 5)])}
+            for i in range(n_records)]
+
+
+def run_bench(name, obj):
+    dumps_time = timeit(pickle.dumps, obj, protocol=4)
+    hash_time = timeit(hash, obj)
+    print('{:<30} pickle.dumps: {:.4f}s  hash: {:.4f}s'.format(
+        name, dumps_time, hash_time), end='')
+    if sys.version_info >= (3, 8):
+        c_hash_time = timeit(hash, obj, c_pickler=True)
+        print('  hash(c_pickler=True): {:.4f}s (x{:.1f})'.format(
+            c_hash_time, hash_time / c_hash_time))
+    else:
+        print()
+
+
+if __name__ == "__main__":
+    rnd = np.random.RandomState(0)
+    run_bench('1e4 records', make_records(int(1e4)))
+    run_bench('1e5 records', make_records(int(1e5)))
+    run_bench('1e5 strings', ['string_%d' % i for i in range(int(1e5))])
+    run_bench('dict of 1e3 arrays',
+              dict(('array_%d' % i, rnd.random_sample(100))
+                   for i in range(int(1e3))))
+    run_bench('large array', rnd.random_sample(int(1e7)))
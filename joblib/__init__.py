@@ -113,6 +113,7 @@ from .memory import Memory, MemorizedResult, register_store_backend
 from .logger import PrintTime
 from .logger import Logger
 from .hashing import hash
+from .hashing import register_hasher
 from .numpy_pickle import dump
 from .numpy_pickle import load
 from .compressor import register_compressor
@@ -130,4 +131,4 @@ __all__ = ['Memory', 'MemorizedResult', 'PrintTime', 'Logger', 'hash', 'dump',
            'load', 'Parallel', 'delayed', 'cpu_count', 'effective_n_jobs',
            'register_parallel_backend', 'parallel_backend',
            'register_store_backend', 'register_compressor',
-           'wrap_non_picklable_objects']
+           'register_hasher', 'wrap_non_picklable_objects']
@@ -9,11 +9,11 @@ from mmap import mmap
 import errno
 import os
 import stat
+import sys
 import threading
 import atexit
 import tempfile
 import warnings
-import weakref
 from uuid import uuid4
 
 try:
@@ -30,7 +30,7 @@ except ImportError:
     from pickle import loads
     from pickle import dumps
 
-from pickle import HIGHEST_PROTOCOL, PicklingError
+from pickle import HIGHEST_PROTOCOL
 
 try:
     import numpy as np
@@ -42,6 +42,7 @@ from .numpy_pickle import load
 from .numpy_pickle import dump
 from .backports import make_memmap
 from .disk import delete_folder
+from ._utils import _WeakArrayKeyMap
 
 # Some system have a ramdisk mounted by default, we can use it instead of /tmp
 # as the default folder to dump big arrays to share with subprocesses.
@@ -57,45 +58,14 @@ SYSTEM_SHARED_MEM_FS_MIN_SIZE = int(2e9)
 FOLDER_PERMISSIONS = stat.S_IRUSR | stat.S_IWUSR | stat.S_IXUSR
 FILE_PERMISSIONS = stat.S_IRUSR | stat.S_IWUSR
 
+# Size of the chunks read to pull a newly dumped file in the OS cache.
+_PREWARM_CHUNK_SIZE = 1024 ** 2
 
-class _WeakArrayKeyMap:
-    """A variant of weakref.WeakKeyDictionary for unhashable numpy arrays.
-
-    This datastructure will be used with numpy arrays as obj keys, therefore we
-    do not use the __get__ / __set__ methods to avoid any conflict with the
-    numpy fancy indexing syntax.
-    """
-
-    def __init__(self):
-        self._data = {}
-
-    def get(self, obj):
-        ref, val = self._data[id(obj)]
-        if ref() is not obj:
-            # In case of race condition with on_destroy: could never be
-            # triggered by the joblib tests with CPython.
-            raise KeyError(obj)
-        return val
-
-    def set(self, obj, value):
-        key = id(obj)
-        try:
-            ref, _ = self._data[key]
-            if ref() is not obj:
-                # In case of race condition with on_destroy: could never be
-                # triggered by the joblib tests with CPython.
-                raise KeyError(obj)
-        except KeyError:
-            # Insert the new entry in the mapping along with a weakref
-            # callback to automatically delete the entry from the mapping
-            # as soon as the object used as key is garbage collected.
-            def on_destroy(_):
-                del self._data[key]
-            ref = weakref.ref(obj, on_destroy)
-        self._data[key] = ref, value
-
-    def __getstate__(self):
-        raise PicklingError("_WeakArrayKeyMap is not pickleable")
+# The scipy.sparse classes whose components are numpy arrays. The sparse
+# arrays are only available with recent scipy versions.
+_SPARSE_CLASSES = tuple('{}_{}'.format(fmt, kind)
+                        for kind in ('matrix', 'array')
+                        for fmt in ('csr', 'csc', 'coo', 'bsr', 'dia'))
 
 
 ###############################################################################
@@ -305,53 +275,8 @@ class ArrayMemmapReducer(object):
 
         if (not a.dtype.hasobject and self._max_nbytes is not None and
                 a.nbytes > self._max_nbytes):
-            # check that the folder exists (lazily create the pool temp folder
-            # if required)
-            try:
-                os.makedirs(self._temp_folder)
-                os.chmod(self._temp_folder, FOLDER_PERMISSIONS)
-            except OSError as e:
-                if e.errno != errno.EEXIST:
-                    raise e
-
-            try:
-                basename = self._memmaped_arrays.get(a)
-            except KeyError:
-                # Generate a new unique random filename. The process and thread
-                # ids are only useful for debugging purpose and to make it
-                # easier to cleanup orphaned files in case of hard process
-                # kill (e.g. by "kill -9" or segfault).
-                basename = "{}-{}-{}.pkl".format(
-                    os.getpid(), id(threading.current_thread()), uuid4().hex)
-                self._memmaped_arrays.set(a, basename)
-            filename = os.path.join(self._temp_folder, basename)
-
-            # In case the same array with the same content is passed several
-            # times to the pool subprocess children, serialize it only once
-
-            # XXX: implement an explicit reference counting scheme to make it
-            # possible to delete temporary files as soon as the workers are
-            # done processing this data.
-            if not os.path.exists(filename):
-                if self.verbose > 0:
-                    print("Memmapping (shape={}, dtype={}) to new file {}"
-                          .format(a.shape, a.dtype, filename))
-                for dumped_filename in dump(a, filename):
-                    os.chmod(dumped_filename, FILE_PERMISSIONS)
-
-                if self._prewarm:
-                    # Warm up the data by accessing it. This operation ensures
-                    # that the disk access required to create the memmapping
-                    # file are performed in the reducing process and avoids
-                    # concurrent memmap creation in multiple children
-                    # processes.
-                    load(filename, mmap_mode=self._mmap_mode).max()
-            elif self.verbose > 1:
-                print("Memmapping (shape={}, dtype={}) to old file {}"
-                      .format(a.shape, a.dtype, filename))
-
-            # The worker process will use joblib.load to memmap the data
-            return (load, (filename, self._mmap_mode))
+            return self._reduce_to_file(
+                a, "(shape={}, dtype={})".format(a.shape, a.dtype))
         else:
             # do not convert a into memmap, let pickler do its usual copy with
             # the default system pickler
@@ -360,6 +285,170 @@ class ArrayMemmapReducer(object):
                       .format(a.shape, a.dtype))
             return (loads, (dumps(a, protocol=HIGHEST_PROTOCOL),))
 
+    def _reduce_to_file(self, obj, description, signature=None):
+        """Dump obj to a file of the temp folder memmapped by the workers.
+
+        The file is reused for the later reductions of obj with the same
+        signature, which identifies the state of a mutable obj.
+        """
+        # check that the folder exists (lazily create the pool temp folder
+        # if required)
+        try:
+            os.makedirs(self._temp_folder)
+            os.chmod(self._temp_folder, FOLDER_PERMISSIONS)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise e
+
+        try:
+            cached_signature, basename = self._memmaped_arrays.get(obj)
+        except KeyError:
+            basename = None
+        if basename is None or cached_signature != signature:
+            # Generate a new unique random filename. The process and thread
+            # ids are only useful for debugging purpose and to make it
+            # easier to cleanup orphaned files in case of hard process
+            # kill (e.g. by "kill -9" or segfault).
+            basename = "{}-{}-{}.pkl".format(
+                os.getpid(), id(threading.current_thread()), uuid4().hex)
+            self._memmaped_arrays.set(obj, (signature, basename))
+        filename = os.path.join(self._temp_folder, basename)
+
+        # In case the same array with the same content is passed several
+        # times to the pool subprocess children, serialize it only once
+
+        # XXX: implement an explicit reference counting scheme to make it
+        # possible to delete temporary files as soon as the workers are
+        # done processing this data.
+        if not os.path.exists(filename):
+            if self.verbose > 0:
+                print("Memmapping {} to new file {}"
+                      .format(description, filename))
+            for dumped_filename in dump(obj, filename):
+                os.chmod(dumped_filename, FILE_PERMISSIONS)
+
+            if self._prewarm:
+                # Warm up the data by accessing it. This operation ensures
+                # that the disk access required to create the memmapping
+                # file are performed in the reducing process and avoids
+                # concurrent memmap creation in multiple children
+                # processes.
+                self._warm_up(filename)
+        elif self.verbose > 1:
+            print("Memmapping {} to old file {}".format(description, filename))
+
+        # The worker process will use joblib.load to memmap the data
+        return (load, (filename, self._mmap_mode))
+
+    def _warm_up(self, filename):
+        """Pull a newly dumped file in the OS cache."""
+        load(filename, mmap_mode=self._mmap_mode).max()
+
+
+class ComponentsMemmapReducer(ArrayMemmapReducer):
+    """Reducer callable to dump objects made of arrays to memmap files.
+
+    The component arrays of such objects are each memmapped by
+    ArrayMemmapReducer only when larger than max_nbytes, which misses the
+    objects made of many small arrays. This reducer dumps a whole object to a
+    single file when its components, not already backed by a memmap, add up
+    to more than max_nbytes. The workers load it with all its components
+    memmapped. Smaller objects are reduced as usual, their components going
+    through the array reducers.
+
+    Parameters
+    ----------
+    max_nbytes, temp_folder, mmap_mode:
+        See ArrayMemmapReducer.
+    get_components: callable
+        Return the arrays, or array-likes with a shape and nbytes, making an
+        object, e.g. _dataframe_components.
+    describe: callable
+        Return the description of an object printed in verbose mode.
+    verbose, prewarm:
+        See ArrayMemmapReducer.
+    """
+
+    def __init__(self, max_nbytes, temp_folder, mmap_mode, get_components,
+                 describe, verbose=0, prewarm=True):
+        ArrayMemmapReducer.__init__(self, max_nbytes, temp_folder, mmap_mode,
+                                    verbose=verbose, prewarm=prewarm)
+        self._get_components = get_components
+        self._describe = describe
+
+    def __reduce__(self):
+        args = (self._max_nbytes, self._temp_folder, self._mmap_mode,
+                self._get_components, self._describe)
+        kwargs = {
+            'verbose': self.verbose,
+            'prewarm': self._prewarm,
+        }
+        return ComponentsMemmapReducer, args, kwargs
+
+    def __call__(self, obj):
+        components = self._get_components(obj)
+        nbytes = 0
+        for component in components:
+            if (isinstance(component, np.ndarray) and
+                    _get_backing_memmap(component) is not None):
+                # The component is reduced as a view on its memmap.
+                continue
+            nbytes += component.nbytes
+
+        if self._max_nbytes is not None and nbytes > self._max_nbytes:
+            # Unlike arrays, such objects change when components are added
+            # or replaced, e.g. columns of a DataFrame, in which case the
+            # file dumped for a previous call is stale.
+            signature = [(id(component), component.shape)
+                         for component in components]
+            return self._reduce_to_file(obj, self._describe(obj),
+                                        signature=signature)
+        return obj.__reduce_ex__(HIGHEST_PROTOCOL)
+
+    def _warm_up(self, filename):
+        with open(filename, 'rb') as f:
+            while f.read(_PREWARM_CHUNK_SIZE):
+                pass
+
+
+def _dataframe_components(df):
+    """Return the values of the blocks of a pandas DataFrame.
+
+    The blocks held by numpy arrays are memmapped, e.g. in frames built column
+    by column. The strings of object columns are decoded at once on load.
+    """
+    manager = getattr(df, '_mgr', None)
+    if manager is None:
+        manager = df._data
+    return [block.values for block in manager.blocks]
+
+
+def _describe_dataframe(df):
+    return "DataFrame (shape={}, blocks={})".format(
+        df.shape, len(_dataframe_components(df)))
+
+
+def _sparse_matrix_components(matrix):
+    """Return the numpy arrays of a scipy.sparse matrix.
+
+    These are the arrays of its format, e.g. data, indices and indptr for the
+    CSR and CSC formats. Recent scipy versions hold the row and column
+    indices of the COO format in a coords tuple.
+    """
+    components = []
+    for value in vars(matrix).values():
+        if isinstance(value, (tuple, list)):
+            components.extend(item for item in value
+                              if isinstance(item, np.ndarray))
+        elif isinstance(value, np.ndarray):
+            components.append(value)
+    return components
+
+
+def _describe_sparse_matrix(matrix):
+    return "{} (shape={}, nnz={})".format(
+        matrix.__class__.__name__, matrix.shape, matrix.nnz)
+
 
 def get_memmapping_reducers(
         pool_id, forward_reducers=None, backward_reducers=None,
@@ -422,6 +511,24 @@ def get_memmapping_reducers(
         forward_reducers[np.ndarray] = forward_reduce_ndarray
         forward_reducers[np.memmap] = reduce_memmap
 
+        # pandas and scipy are not imported only to register these reducers:
+        # executors created before they are imported reduce DataFrames and
+        # sparse matrices array by array.
+        pd = sys.modules.get('pandas')
+        if pd is not None:
+            forward_reducers[pd.DataFrame] = ComponentsMemmapReducer(
+                max_nbytes, pool_folder, mmap_mode, _dataframe_components,
+                _describe_dataframe, verbose, prewarm=prewarm)
+        sparse = sys.modules.get('scipy.sparse')
+        if sparse is not None:
+            reduce_sparse = ComponentsMemmapReducer(
+                max_nbytes, pool_folder, mmap_mode,
+                _sparse_matrix_components, _describe_sparse_matrix, verbose,
+                prewarm=prewarm)
+            for name in _SPARSE_CLASSES:
+                if hasattr(sparse, name):
+                    forward_reducers[getattr(sparse, name)] = reduce_sparse
+
         # Communication from child process to the parent process always
         # pickles in-memory numpy.ndarray without dumping them as memmap
         # to avoid confusing the caller and make it tricky to collect the
@@ -16,10 +16,22 @@ from ._compat import with_metaclass, _basestring
 from .backports import concurrency_safe_rename
 from .disk import mkdirp, memstr_to_bytes, rm_subdirs
 from . import numpy_pickle
+from .numpy_pickle_utils import _read_fileobject
+from .compressor import (_COMPRESSORS, ZstdCompressorWrapper,
+                         _train_zstd_dictionary, _load_zstd_dictionary,
+                         _get_zstd_dict_compressor)
 
 CacheItemInfo = collections.namedtuple('CacheItemInfo',
                                        'path size last_access')
 
+# Size of the chunks read when warming up an item that cannot be prefetched
+# with an OS-level hint.
+_PREFETCH_CHUNK_SIZE = 1024 ** 2
+
+# The zstandard dictionary of a store is saved in this file, at the root of
+# the store, which clearing the store preserves.
+_ZSTD_DICT_FILENAME = 'zstd.dict'
+
 
 def concurrency_safe_write(object_to_write, filename, write_func):
     """Writes an object into a unique file in a concurrency-safe way."""
@@ -173,6 +185,30 @@ class StoreBackendMixin(object):
             item = numpy_pickle.load(filename, mmap_mode=mmap_mode)
         return item
 
+    def prefetch_item(self, path):
+        """Warm up the item at the path, given as a list of strings.
+
+        The item is read and discarded so that a subsequent call to
+        load_item is served from the OS page cache instead of blocking on
+        cold storage reads.
+
+        Returns
+        -------
+        True if the item exists, False otherwise
+        """
+        filename = os.path.join(self.location, *path + ['output.pkl'])
+        if not self._item_exists(filename):
+            return False
+        try:
+            with self._open_item(filename, 'rb') as f:
+                while f.read(_PREFETCH_CHUNK_SIZE):
+                    pass
+        except (IOError, OSError):
+            # The item may have been cleared concurrently: prefetching is
+            # only a hint.
+            return False
+        return True
+
     def dump_item(self, path, item, verbose=1):
         """Dump an item in the store at the path given as a list of
            strings."""
@@ -187,12 +223,79 @@ class StoreBackendMixin(object):
             def write_func(to_write, dest_filename):
                 with self._open_item(dest_filename, "wb") as f:
                     numpy_pickle.dump(to_write, f,
-                                      compress=self.compress)
+                                      compress=self._get_item_compress())
 
             self._concurrency_safe_write(item, filename, write_func)
         except:  # noqa: E722
             " Race condition in the creation of the directory "
 
+    def _get_item_compress(self):
+        """Return the compress argument of dump for the items.
+
+        Items compressed with zstandard use the dictionary of the store, if
+        any.
+        """
+        compress = self.compress
+        dict_data = getattr(self, 'compression_dictionary', None)
+        if dict_data is None:
+            return compress
+        method, level = compress, None
+        if isinstance(compress, tuple):
+            method, level = compress
+        if not isinstance(_COMPRESSORS.get(method), ZstdCompressorWrapper):
+            return compress
+        return (_get_zstd_dict_compressor(method, dict_data), level)
+
+    def train_compression_dictionary(self, dict_size, max_item_size):
+        """Train a zstandard dictionary on the small items of the store.
+
+        The dictionary is saved in the store, and used from then on to
+        compress the items dumped with zstandard.
+
+        Parameters
+        ----------
+        dict_size: int
+            The size in bytes of the dictionary.
+        max_item_size: int
+            Only the items whose size on disk is at most max_item_size
+            bytes are used as training samples.
+        """
+        samples = []
+        for item in self.get_items():
+            if item.size > max_item_size:
+                continue
+            filename = os.path.join(item.path, 'output.pkl')
+            try:
+                with self._open_item(filename, 'rb') as f:
+                    with _read_fileobject(f, filename) as fobj:
+                        if not isinstance(fobj, _basestring):
+                            samples.append(fobj.read())
+            except (IOError, OSError):
+                # The item may have been cleared concurrently.
+                continue
+        if not samples:
+            raise ValueError('No item of at most {} bytes to train a '
+                             'compression dictionary on.'
+                             .format(max_item_size))
+        dict_data = _train_zstd_dictionary(samples, dict_size)
+
+        def write_func(to_write, dest_filename):
+            with self._open_item(dest_filename, 'wb') as f:
+                f.write(to_write)
+
+        self._concurrency_safe_write(
+            dict_data.as_bytes(),
+            os.path.join(self.location, _ZSTD_DICT_FILENAME), write_func)
+        self.compression_dictionary = dict_data
+
+    def _load_compression_dictionary(self):
+        """Load the zstandard dictionary saved in the store, if any."""
+        filename = os.path.join(self.location, _ZSTD_DICT_FILENAME)
+        if not self._item_exists(filename):
+            return None
+        with self._open_item(filename, 'rb') as f:
+            return _load_zstd_dictionary(f.read())
+
     def clear_item(self, path):
         """Clear the item at the path, given as a list of strings."""
         item_path = os.path.join(self.location, *path)
@@ -351,6 +454,28 @@ class FileSystemStoreBackend(StoreBackendBase, StoreBackendMixin):
         """Create object location on store"""
         mkdirp(location)
 
+    def prefetch_item(self, path):
+        """Warm up the item at the path, given as a list of strings.
+
+        When available, posix_fadvise is used to let the kernel read the
+        item ahead asynchronously without copying it in user space.
+        """
+        if not hasattr(os, 'posix_fadvise'):
+            return StoreBackendMixin.prefetch_item(self, path)
+
+        filename = os.path.join(self.location, *path + ['output.pkl'])
+        try:
+            fd = os.open(filename, os.O_RDONLY)
+        except OSError:
+            return False
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        except OSError:
+            return False
+        finally:
+            os.close(fd)
+        return True
+
     def get_items(self):
         """Returns the whole list of items available in the store."""
         items = []
@@ -406,10 +531,18 @@ class FileSystemStoreBackend(StoreBackendBase, StoreBackendMixin):
         # FileSystemStoreBackend can be used with mmap_mode options under
         # certain conditions.
         mmap_mode = backend_options.get('mmap_mode')
-        if self.compress and mmap_mode is not None:
+        if (self.compress and self.compress != 'auto' and
+                mmap_mode is not None):
             warnings.warn('Compressed items cannot be memmapped in a '
                           'filesystem store. Option will be ignored.',
                           stacklevel=2)
 
         self.mmap_mode = mmap_mode
         self.verbose = verbose
+
+        # The items written with zstandard use the dictionary of the store.
+        try:
+            self.compression_dictionary = self._load_compression_dictionary()
+        except ValueError:
+            # zstandard is not installed: no item can use the dictionary.
+            self.compression_dictionary = None
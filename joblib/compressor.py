@@ -3,6 +3,9 @@
 import sys
 import io
 import zlib
+import struct
+import bisect
+import collections
 from pkg_resources import parse_version
 
 from ._compat import _basestring, PY3_OR_LATER
@@ -25,13 +28,23 @@ except ImportError:
 try:
     import lz4
     if PY3_OR_LATER:
+        import lz4.block
         from lz4.frame import LZ4FrameFile
 except ImportError:
     lz4 = None
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 LZ4_NOT_INSTALLED_ERROR = ('LZ4 is not installed. Install it with pip: '
                            'https://python-lz4.readthedocs.io/')
 
+ZSTD_NOT_INSTALLED_ERROR = ('zstandard 0.15 or later is not installed. '
+                            'Install it with pip: '
+                            'https://python-zstandard.readthedocs.io/')
+
 # Registered compressors
 _COMPRESSORS = {}
 
@@ -43,6 +56,10 @@ _BZ2_PREFIX = b'BZ'
 _XZ_PREFIX = b'\xfd\x37\x7a\x58\x5a'
 _LZMA_PREFIX = b'\x5d\x00'
 _LZ4_PREFIX = b'\x04\x22\x4D\x18'
+_ZSTD_PREFIX = b'\x28\xb5\x2f\xfd'
+# Block compressed files start with this prefix followed by a byte
+# identifying the codec of the blocks.
+_BLOCK_PREFIX = b'JBLK'
 
 
 def register_compressor(compressor_name, compressor,
@@ -253,6 +270,12 @@ _MODE_READ = 1
 _MODE_READ_EOF = 2
 _MODE_WRITE = 3
 _BUFFER_SIZE = 8192
+# Compressed data is read by chunks growing from _BUFFER_SIZE up to this size,
+# so that small files are read in few bytes and large ones in few calls.
+_MAX_READ_SIZE = 1024 ** 2
+# Maximum size of the decompressed chunks, bounding the memory used by
+# highly compressible data.
+_MAX_DECOMPRESSED_SIZE = 4 * 1024 ** 2
 
 
 class BinaryZlibFile(io.BufferedIOBase):
@@ -279,6 +302,7 @@ class BinaryZlibFile(io.BufferedIOBase):
     """
 
     wbits = zlib.MAX_WBITS
+    max_compresslevel = 9
 
     def __init__(self, filename, mode="rb", compresslevel=3):
         # This lock must be recursive, so that BufferedIOBase's
@@ -291,21 +315,22 @@ class BinaryZlibFile(io.BufferedIOBase):
         self._size = -1
         self.compresslevel = compresslevel
 
-        if not isinstance(compresslevel, int) or not (1 <= compresslevel <= 9):
+        if (not isinstance(compresslevel, int) or
+                not (1 <= compresslevel <= self.max_compresslevel)):
             raise ValueError("'compresslevel' must be an integer "
-                             "between 1 and 9. You provided 'compresslevel={}'"
-                             .format(compresslevel))
+                             "between 1 and {}. You provided "
+                             "'compresslevel={}'"
+                             .format(self.max_compresslevel, compresslevel))
 
         if mode == "rb":
             self._mode = _MODE_READ
-            self._decompressor = zlib.decompressobj(self.wbits)
+            self._decompressor = self._new_decompressor()
             self._buffer = b""
             self._buffer_offset = 0
+            self._read_size = _BUFFER_SIZE
         elif mode == "wb":
             self._mode = _MODE_WRITE
-            self._compressor = zlib.compressobj(self.compresslevel,
-                                                zlib.DEFLATED, self.wbits,
-                                                zlib.DEF_MEM_LEVEL, 0)
+            self._compressor = self._new_compressor()
         else:
             raise ValueError("Invalid mode: %r" % (mode,))
 
@@ -318,6 +343,16 @@ class BinaryZlibFile(io.BufferedIOBase):
             raise TypeError("filename must be a str or bytes object, "
                             "or a file")
 
+    def _new_compressor(self):
+        """Return a compressor object, with compress and flush methods."""
+        return zlib.compressobj(self.compresslevel, zlib.DEFLATED, self.wbits,
+                                zlib.DEF_MEM_LEVEL, 0)
+
+    def _new_decompressor(self):
+        """Return a decompressor object, with a decompress(data, max_length)
+        method and unconsumed_tail and unused_data attributes."""
+        return zlib.decompressobj(self.wbits)
+
     def close(self):
         """Flush and close the file.
 
@@ -405,34 +440,34 @@ class BinaryZlibFile(io.BufferedIOBase):
         # Depending on the input data, our call to the decompressor may not
         # return any data. In this case, try again after reading another block.
         while self._buffer_offset == len(self._buffer):
-            try:
-                rawblock = (self._decompressor.unused_data or
-                            self._fp.read(_BUFFER_SIZE))
-                if not rawblock:
-                    raise EOFError
-            except EOFError:
+            rawblock = self._decompressor.unconsumed_tail
+            if not rawblock and not getattr(self._decompressor, 'eof', False):
+                rawblock = self._fp.read(self._read_size)
+                # Double the size of the following read, up to
+                # _MAX_READ_SIZE: small files are read in small chunks and
+                # large ones in few calls.
+                self._read_size = min(2 * self._read_size, _MAX_READ_SIZE)
+            if not rawblock:
                 # End-of-stream marker and end of file. We're good.
                 self._mode = _MODE_READ_EOF
                 self._size = self._pos
                 return False
-            else:
-                self._buffer = self._decompressor.decompress(rawblock)
+            self._buffer = self._decompressor.decompress(
+                rawblock, _MAX_DECOMPRESSED_SIZE)
             self._buffer_offset = 0
         return True
 
     # Read data until EOF.
     # If return_data is false, consume the data without returning it.
     def _read_all(self, return_data=True):
-        # The loop assumes that _buffer_offset is 0. Ensure that this is true.
-        self._buffer = self._buffer[self._buffer_offset:]
-        self._buffer_offset = 0
-
-        blocks = []
+        blocks = [self._buffer[self._buffer_offset:]]
+        self._pos += len(self._buffer) - self._buffer_offset
+        self._buffer_offset = len(self._buffer)
         while self._fill_buffer():
             if return_data:
                 blocks.append(self._buffer)
             self._pos += len(self._buffer)
-            self._buffer = b""
+            self._buffer_offset = len(self._buffer)
         if return_data:
             return b"".join(blocks)
 
@@ -447,25 +482,36 @@ class BinaryZlibFile(io.BufferedIOBase):
             self._pos += len(data)
             return data if return_data else None
 
-        # The loop assumes that _buffer_offset is 0. Ensure that this is true.
-        self._buffer = self._buffer[self._buffer_offset:]
-        self._buffer_offset = 0
-
+        # The buffer is not preallocated to n_bytes, which may be much
+        # larger than the rest of the file. The decompressed chunks are
+        # joined instead, the fully consumed ones without copies.
         blocks = []
         while n_bytes > 0 and self._fill_buffer():
-            if n_bytes < len(self._buffer):
-                data = self._buffer[:n_bytes]
-                self._buffer_offset = n_bytes
-            else:
-                data = self._buffer
-                self._buffer = b""
+            size = min(n_bytes, len(self._buffer) - self._buffer_offset)
             if return_data:
-                blocks.append(data)
-            self._pos += len(data)
-            n_bytes -= len(data)
+                blocks.append(self._buffer[
+                    self._buffer_offset:self._buffer_offset + size])
+            self._buffer_offset += size
+            self._pos += size
+            n_bytes -= size
         if return_data:
             return b"".join(blocks)
 
+    # Copy up to len(view) bytes into the memoryview, straight from the
+    # decompressed chunks.
+    def _readinto(self, view):
+        n_bytes = len(view)
+        filled = 0
+        while filled < n_bytes and self._fill_buffer():
+            size = min(n_bytes - filled,
+                       len(self._buffer) - self._buffer_offset)
+            view[filled:filled + size] = memoryview(self._buffer)[
+                self._buffer_offset:self._buffer_offset + size]
+            self._buffer_offset += size
+            filled += size
+        self._pos += filled
+        return filled
+
     def read(self, size=-1):
         """Read up to size uncompressed bytes from the file.
 
@@ -487,7 +533,8 @@ class BinaryZlibFile(io.BufferedIOBase):
         Returns the number of bytes read (0 for EOF).
         """
         with self._lock:
-            return io.BufferedIOBase.readinto(self, b)
+            self._check_can_read()
+            return self._readinto(_byte_view(b))
 
     def write(self, data):
         """Write a byte string to the file.
@@ -498,23 +545,31 @@ class BinaryZlibFile(io.BufferedIOBase):
         """
         with self._lock:
             self._check_can_write()
-            # Convert data type if called by io.BufferedWriter.
             if isinstance(data, memoryview):
-                data = data.tobytes()
+                if PY3_OR_LATER:
+                    # zlib compresses any bytes-like object in place.
+                    size = data.nbytes
+                else:
+                    # Convert data type if called by io.BufferedWriter.
+                    data = data.tobytes()
+                    size = len(data)
+            else:
+                size = len(data)
 
             compressed = self._compressor.compress(data)
             self._fp.write(compressed)
-            self._pos += len(data)
-            return len(data)
+            self._pos += size
+            return size
 
     # Rewind the file to the beginning of the data stream.
     def _rewind(self):
         self._fp.seek(0, 0)
         self._mode = _MODE_READ
         self._pos = 0
-        self._decompressor = zlib.decompressobj(self.wbits)
+        self._decompressor = self._new_decompressor()
         self._buffer = b""
         self._buffer_offset = 0
+        self._read_size = _BUFFER_SIZE
 
     def seek(self, offset, whence=0):
         """Change the file position.
@@ -594,3 +649,760 @@ class GzipCompressorWrapper(CompressorWrapper):
     def __init__(self):
         CompressorWrapper.__init__(self, obj=BinaryGzipFile,
                                    prefix=_GZIP_PREFIX, extension='.gz')
+
+
+###############################################################################
+#  zstandard file object definition
+
+# Zstandard dictionaries known to this process, by dictionary id. The id of
+# the dictionary used to compress a frame is recorded in its header.
+_ZSTD_DICTIONARIES = {}
+
+
+def _check_zstd_version():
+    if zstandard is None or (
+        parse_version(zstandard.__version__) < parse_version('0.15')
+    ):
+        raise ValueError(ZSTD_NOT_INSTALLED_ERROR)
+
+
+class _ZstdDecompressor(object):
+    """A zlib like decompressor object for a zstandard frame.
+
+    The decompression context is created with the first bytes of the frame,
+    using the dictionary identified in its header.
+    """
+
+    def __init__(self, dict_data=None):
+        self._dict_data = dict_data
+        self._decompressobj = None
+        self.unconsumed_tail = b""
+
+    @property
+    def unused_data(self):
+        if self._decompressobj is None:
+            return b""
+        return self._decompressobj.unused_data
+
+    @property
+    def eof(self):
+        return self._decompressobj is not None and self._decompressobj.eof
+
+    def decompress(self, data, max_length=0):
+        if max_length:
+            # Zstandard cannot bound the size of the decompressed data: bound
+            # the size of the compressed data decompressed at once instead.
+            max_input = max(max_length // 32, _BUFFER_SIZE)
+            data, self.unconsumed_tail = data[:max_input], data[max_input:]
+        if self._decompressobj is None:
+            dict_id = zstandard.get_frame_parameters(data).dict_id
+            dict_data = None
+            if dict_id:
+                dict_data = self._dict_data
+                if dict_data is None or dict_data.dict_id() != dict_id:
+                    dict_data = _ZSTD_DICTIONARIES.get(dict_id)
+                if dict_data is None:
+                    raise ValueError("The data was compressed with the "
+                                     "unknown zstandard dictionary {}."
+                                     .format(dict_id))
+            decompressor = zstandard.ZstdDecompressor(dict_data=dict_data)
+            self._decompressobj = decompressor.decompressobj()
+        return self._decompressobj.decompress(data)
+
+
+class ZstdFile(BinaryZlibFile):
+    """A file object providing transparent zstandard (de)compression.
+
+    See BinaryZlibFile for the description of the filename and mode
+    parameters.
+
+    If mode is 'wb', compresslevel can be a number between 1 and 22, 3 is
+    the default. threads is the number of threads compressing the data, 0
+    compresses in the calling thread and -1 uses as many threads as CPUs.
+    dict_data is an optional zstandard.ZstdCompressionDict, improving the
+    compression of small files similar to the data it was trained on.
+
+    When reading, the dictionary identified in the header of the data is
+    dict_data or one of the dictionaries of the ZstdCompressorWrapper
+    objects created in the process.
+    """
+
+    max_compresslevel = 22
+
+    def __init__(self, filename, mode="rb", compresslevel=3, threads=0,
+                 dict_data=None):
+        _check_zstd_version()
+        self.threads = threads
+        self.dict_data = dict_data
+        BinaryZlibFile.__init__(self, filename, mode=mode,
+                                compresslevel=compresslevel)
+
+    def _new_compressor(self):
+        compressor = zstandard.ZstdCompressor(level=self.compresslevel,
+                                              threads=self.threads,
+                                              dict_data=self.dict_data)
+        return compressor.compressobj()
+
+    def _new_decompressor(self):
+        return _ZstdDecompressor(self.dict_data)
+
+
+class ZstdCompressorWrapper(CompressorWrapper):
+    """A wrapper around zstandard file objects.
+
+    Attributes
+    ----------
+    threads: int
+        The number of threads compressing the data, 0 to compress in the
+        calling thread or -1 to use as many threads as CPUs. Default: 0.
+    dict_data: zstandard.ZstdCompressionDict or None
+        If not None, the dictionary used to compress the data. It is also
+        made available to decompress the data compressed with it.
+    """
+
+    def __init__(self, threads=0, dict_data=None):
+        CompressorWrapper.__init__(
+            self, obj=ZstdFile if zstandard is not None else None,
+            prefix=_ZSTD_PREFIX, extension='.zst')
+        self.threads = threads
+        self.dict_data = dict_data
+        if dict_data is not None:
+            _ZSTD_DICTIONARIES[dict_data.dict_id()] = dict_data
+
+    def compressor_file(self, fileobj, compresslevel=None):
+        """Returns an instance of a compressor file object."""
+        _check_zstd_version()
+        if compresslevel is None:
+            compresslevel = 3
+        return self.fileobj_factory(fileobj, 'wb',
+                                    compresslevel=compresslevel,
+                                    threads=self.threads,
+                                    dict_data=self.dict_data)
+
+    def decompressor_file(self, fileobj):
+        """Returns an instance of a decompressor file object."""
+        _check_zstd_version()
+        return self.fileobj_factory(fileobj, 'rb', dict_data=self.dict_data)
+
+
+def _train_zstd_dictionary(samples, dict_size):
+    """Return a zstandard dictionary of dict_size bytes trained on samples."""
+    _check_zstd_version()
+    dict_data = zstandard.train_dictionary(dict_size, samples)
+    _ZSTD_DICTIONARIES[dict_data.dict_id()] = dict_data
+    return dict_data
+
+
+def _load_zstd_dictionary(data):
+    """Return the zstandard dictionary serialized in data."""
+    _check_zstd_version()
+    dict_data = zstandard.ZstdCompressionDict(data)
+    _ZSTD_DICTIONARIES[dict_data.dict_id()] = dict_data
+    return dict_data
+
+
+def _get_zstd_dict_compressor(compressor_name, dict_data):
+    """Return the name of a compressor using dict_data.
+
+    The compressor has the options of the zstandard compressor registered
+    under compressor_name. It is registered on the first call.
+    """
+    name = '{}-dict-{}'.format(compressor_name, dict_data.dict_id())
+    if name not in _COMPRESSORS:
+        threads = _COMPRESSORS[compressor_name].threads
+        register_compressor(name, ZstdCompressorWrapper(threads=threads,
+                                                        dict_data=dict_data))
+    return name
+
+
+###############################################################################
+#  block compressed file object definition
+_BLOCK_SIZE = 4 * 1024 ** 2
+# Each block is preceded by its compressed and uncompressed sizes. A header
+# with both sizes set to 0 marks the end of the stream.
+_BLOCK_HEADER = struct.Struct('<QQ')
+# The end of the stream is followed by the block index: the offsets of the
+# blocks in the file and in the uncompressed stream, packed as block headers.
+# The file ends with a trailer giving the offset of the index, the number of
+# blocks and the size of the uncompressed stream.
+_BLOCK_TRAILER = struct.Struct('<QQQ8s')
+_BLOCK_INDEX_MAGIC = b'JBLKIDX1'
+
+
+def _lz4_block_compress(data, level):
+    if level:
+        return lz4.block.compress(data, mode='high_compression',
+                                  compression=level, store_size=False)
+    return lz4.block.compress(data, store_size=False)
+
+
+# Codecs used to compress the blocks, mapped to their identifier in the file
+# prefix, their default level and their compress(data, level) and
+# decompress(data, size) functions. zlib, lz4 and lzma all release the GIL
+# while (de)compressing a block.
+_BLOCK_CODECS = {
+    'zlib': (b'Z', 3,
+             lambda data, level: zlib.compress(data, level),
+             lambda data, size: zlib.decompress(data, zlib.MAX_WBITS, size)),
+    'lz4': (b'4', 0, _lz4_block_compress,
+            lambda data, size: lz4.block.decompress(
+                data, uncompressed_size=size)),
+    'lzma': (b'X', 6,
+             lambda data, level: lzma.compress(data, format=lzma.FORMAT_XZ,
+                                               check=lzma.CHECK_NONE,
+                                               preset=level),
+             lambda data, size: lzma.decompress(data)),
+}
+
+
+def _byte_view(data):
+    """Return a 1-d memoryview of unsigned bytes on data."""
+    view = memoryview(data)
+    if PY3_OR_LATER and (view.ndim != 1 or view.format != 'B'):
+        view = view.cast('B')
+    return view
+
+
+def _is_seekable(fileobj):
+    """Return whether fileobj supports seeking.
+
+    The python 2 file objects have no seekable method.
+    """
+    if hasattr(fileobj, 'seekable'):
+        return fileobj.seekable()
+    try:
+        fileobj.seek(fileobj.tell())
+    except (AttributeError, IOError, OSError):
+        return False
+    return True
+
+
+class BlockCompressedFile(io.BufferedIOBase):
+    """A file object compressing independent blocks in parallel threads.
+
+    The data written is cut into blocks of block_size bytes that are
+    compressed independently by a pool of threads, and written in order,
+    each one preceded by its compressed and uncompressed sizes. When reading,
+    the following blocks are decompressed in parallel while the current one
+    is consumed.
+
+    The blocks are followed by an index of their offsets. When the
+    underlying file object is seekable, seeking then only decompresses the
+    block holding the new position.
+
+    If filename is a str or bytes object, it gives the name
+    of the file to be opened. Otherwise, it should be a file object,
+    which will be used to read or write the compressed data.
+
+    mode can be 'rb' for reading (default) or 'wb' for (over)writing
+
+    codec is the name of the compression method of the blocks: 'zlib', 'lz4'
+    or 'lzma'. When reading, it is determined from the file prefix.
+
+    compresslevel is the compression level of the codec, its default level is
+    used if None.
+
+    n_threads is the number of threads (de)compressing the blocks, the number
+    of CPUs available to the process, as given by joblib.cpu_count, by
+    default.
+
+    If block_index is False, the block index is neither written nor looked
+    for, and the stream stops right after its end-of-stream marker. This
+    allows to embed block compressed streams in another file.
+    """
+
+    def __init__(self, filename, mode="rb", compresslevel=None, codec='zlib',
+                 block_size=_BLOCK_SIZE, n_threads=None, block_index=True):
+        # This lock must be recursive, so that BufferedIOBase's
+        # readline(), readlines() and writelines() don't deadlock.
+        self._lock = RLock()
+        self._fp = None
+        self._closefp = False
+        self._mode = _MODE_CLOSED
+        self._pos = 0
+        self._pool = None
+        self._pending = collections.deque()
+        self._index = None
+        self.block_size = block_size
+        self.block_index = block_index
+        if not n_threads:
+            # import is not top level to avoid cyclic import errors.
+            from .parallel import cpu_count
+            n_threads = cpu_count()
+        self.n_threads = n_threads
+
+        if mode not in ("rb", "wb"):
+            raise ValueError("Invalid mode: %r" % (mode,))
+        if mode == "wb" and codec not in _BLOCK_CODECS:
+            raise ValueError("Non valid codec given: '{}'. Possible values "
+                             "are {}.".format(codec, sorted(_BLOCK_CODECS)))
+
+        if isinstance(filename, _basestring):
+            self._fp = io.open(filename, mode)
+            self._closefp = True
+        elif hasattr(filename, "read") or hasattr(filename, "write"):
+            self._fp = filename
+        else:
+            raise TypeError("filename must be a str or bytes object, "
+                            "or a file")
+
+        if mode == "rb":
+            self._mode = _MODE_READ
+            if block_index and _is_seekable(self._fp):
+                self._start = self._fp.tell()
+                self._read_index()
+            prefix = self._fp.read(len(_BLOCK_PREFIX) + 1)
+            for name, (identifier, _, _, _) in _BLOCK_CODECS.items():
+                if prefix == _BLOCK_PREFIX + identifier:
+                    codec = name
+                    break
+            else:
+                raise ValueError("The file does not start with the prefix "
+                                 "of a block compressed file.")
+            self._block = memoryview(b"")
+            self._block_offset = 0
+            # Number of blocks decompressed ahead, grown while reading
+            # sequentially.
+            self._readahead = 1
+        else:
+            self._mode = _MODE_WRITE
+            self._fp.write(_BLOCK_PREFIX + _BLOCK_CODECS[codec][0])
+            self._buffer = bytearray()
+            # Offsets of the blocks in the file and in the uncompressed
+            # stream.
+            self._index = []
+            self._compressed_pos = len(_BLOCK_PREFIX) + 1
+            self._uncompressed_pos = 0
+
+        self.codec = codec
+        _, default_level, self._compress, self._decompress = \
+            _BLOCK_CODECS[codec]
+        self.compresslevel = (default_level if compresslevel is None
+                              else compresslevel)
+
+    def close(self):
+        """Flush and close the file.
+
+        May be called more than once without error. Once the file is
+        closed, any other operation on it will raise a ValueError.
+        """
+        with self._lock:
+            if self._mode == _MODE_CLOSED:
+                return
+            try:
+                if self._mode == _MODE_WRITE:
+                    if self._buffer:
+                        self._submit_block()
+                    while self._pending:
+                        self._write_next_block()
+                    self._fp.write(_BLOCK_HEADER.pack(0, 0))
+                    if self.block_index:
+                        self._write_index()
+            finally:
+                try:
+                    if self._pool is not None:
+                        self._pool.terminate()
+                    if self._closefp:
+                        self._fp.close()
+                finally:
+                    self._fp = None
+                    self._closefp = False
+                    self._mode = _MODE_CLOSED
+                    self._pool = None
+                    self._pending.clear()
+                    self._buffer = self._block = None
+
+    @property
+    def closed(self):
+        """True if this file is closed."""
+        return self._mode == _MODE_CLOSED
+
+    def fileno(self):
+        """Return the file descriptor for the underlying file."""
+        self._check_not_closed()
+        return self._fp.fileno()
+
+    def seekable(self):
+        """Return whether the file supports seeking."""
+        return self.readable() and self._index is not None
+
+    def readable(self):
+        """Return whether the file was opened for reading."""
+        self._check_not_closed()
+        return self._mode in (_MODE_READ, _MODE_READ_EOF)
+
+    def writable(self):
+        """Return whether the file was opened for writing."""
+        self._check_not_closed()
+        return self._mode == _MODE_WRITE
+
+    def tell(self):
+        """Return the current file position."""
+        with self._lock:
+            self._check_not_closed()
+            return self._pos
+
+    # Mode-checking helper functions.
+
+    def _check_not_closed(self):
+        if self.closed:
+            fname = getattr(self._fp, 'name', None)
+            msg = "I/O operation on closed file"
+            if fname is not None:
+                msg += " {}".format(fname)
+            msg += "."
+            raise ValueError(msg)
+
+    def _check_can_read(self):
+        if self._mode not in (_MODE_READ, _MODE_READ_EOF):
+            self._check_not_closed()
+            raise io.UnsupportedOperation("File not open for reading")
+
+    def _check_can_write(self):
+        if self._mode != _MODE_WRITE:
+            self._check_not_closed()
+            raise io.UnsupportedOperation("File not open for writing")
+
+    def _apply_async(self, func, args):
+        """Run func(*args) in the thread pool, created on first use."""
+        if self._pool is None:
+            from multiprocessing.pool import ThreadPool
+            self._pool = ThreadPool(self.n_threads)
+        return self._pool.apply_async(func, args)
+
+    def _check_can_seek(self):
+        self._check_can_read()
+        if self._index is None:
+            raise io.UnsupportedOperation("Seeking is only supported on "
+                                          "seekable files with a block "
+                                          "index")
+
+    # Keep at most this number of blocks in flight, to bound memory usage.
+    def _max_pending(self):
+        return 2 * self.n_threads
+
+    def _submit_block(self):
+        block, self._buffer = self._buffer, bytearray()
+        if not PY3_OR_LATER:
+            # The python 2 codecs do not accept bytearrays.
+            block = bytes(block)
+        self._pending.append(
+            (self._apply_async(self._compress, (block, self.compresslevel)),
+             len(block)))
+        while len(self._pending) >= self._max_pending():
+            self._write_next_block()
+
+    def _write_next_block(self):
+        result, size = self._pending.popleft()
+        compressed = result.get()
+        self._index.append((self._compressed_pos, self._uncompressed_pos))
+        self._fp.write(_BLOCK_HEADER.pack(len(compressed), size))
+        self._fp.write(compressed)
+        self._compressed_pos += _BLOCK_HEADER.size + len(compressed)
+        self._uncompressed_pos += size
+
+    def _write_index(self):
+        index_offset = self._compressed_pos + _BLOCK_HEADER.size
+        self._fp.write(b"".join(_BLOCK_HEADER.pack(*offsets)
+                                for offsets in self._index))
+        self._fp.write(_BLOCK_TRAILER.pack(index_offset, len(self._index),
+                                           self._uncompressed_pos,
+                                           _BLOCK_INDEX_MAGIC))
+
+    # Read the block index at the end of the file, if any, and seek back to
+    # the start of the file.
+    def _read_index(self):
+        self._fp.seek(0, io.SEEK_END)
+        end = self._fp.tell()
+        if end - self._start >= len(_BLOCK_PREFIX) + _BLOCK_TRAILER.size:
+            self._fp.seek(end - _BLOCK_TRAILER.size)
+            index_offset, n_blocks, size, magic = _BLOCK_TRAILER.unpack(
+                self._read_exactly(_BLOCK_TRAILER.size))
+            if magic == _BLOCK_INDEX_MAGIC:
+                self._fp.seek(self._start + index_offset)
+                index = self._read_exactly(n_blocks * _BLOCK_HEADER.size)
+                self._index = [
+                    _BLOCK_HEADER.unpack_from(index, i * _BLOCK_HEADER.size)
+                    for i in range(n_blocks)]
+                self._block_starts = [start for _, start in self._index]
+                self._size = size
+        self._fp.seek(self._start)
+
+    def write(self, data):
+        """Write a bytes-like object to the file.
+
+        Returns the number of uncompressed bytes written. Note that the
+        blocks are compressed and written to the file asynchronously, the
+        file on disk may not reflect the data written until close() is
+        called.
+        """
+        with self._lock:
+            self._check_can_write()
+            data = _byte_view(data)
+            size = len(data)
+            while len(data):
+                n_bytes = min(len(data), self.block_size - len(self._buffer))
+                self._buffer += data[:n_bytes]
+                data = data[n_bytes:]
+                if len(self._buffer) == self.block_size:
+                    self._submit_block()
+            self._pos += size
+            return size
+
+    def _read_exactly(self, size):
+        data = self._fp.read(size)
+        while len(data) < size:
+            chunk = self._fp.read(size - len(data))
+            if not chunk:
+                raise EOFError("Compressed file ended before the "
+                               "end-of-stream marker was reached")
+            data += chunk
+        return data
+
+    # Schedule the decompression of the next blocks of the file.
+    def _fill_pending(self):
+        while (self._mode == _MODE_READ and
+               len(self._pending) < self._readahead):
+            compressed_size, size = _BLOCK_HEADER.unpack(
+                self._read_exactly(_BLOCK_HEADER.size))
+            if compressed_size == 0 and size == 0:
+                self._mode = _MODE_READ_EOF
+                break
+            compressed = self._read_exactly(compressed_size)
+            self._pending.append(
+                self._apply_async(self._decompress, (compressed, size)))
+
+    # Make the next decompressed block current. Returns False on EOF.
+    def _next_block(self):
+        self._fill_pending()
+        if not self._pending:
+            return False
+        self._block = memoryview(self._pending.popleft().get())
+        self._block_offset = 0
+        self._readahead = min(2 * self._readahead, self._max_pending())
+        self._fill_pending()
+        return True
+
+    def readinto(self, b):
+        """Read up to len(b) bytes into b.
+
+        Returns the number of bytes read (0 for EOF).
+        """
+        with self._lock:
+            self._check_can_read()
+            view = _byte_view(b)
+            n_read = 0
+            while n_read < len(view):
+                if self._block_offset == len(self._block):
+                    if not self._next_block():
+                        break
+                n_bytes = min(len(view) - n_read,
+                              len(self._block) - self._block_offset)
+                view[n_read:n_read + n_bytes] = self._block[
+                    self._block_offset:self._block_offset + n_bytes]
+                self._block_offset += n_bytes
+                n_read += n_bytes
+            self._pos += n_read
+            return n_read
+
+    def read(self, size=-1):
+        """Read up to size uncompressed bytes from the file.
+
+        If size is negative or omitted, read until EOF is reached.
+        Returns b'' if the file is already at EOF.
+        """
+        with self._lock:
+            self._check_can_read()
+            if size is None or size < 0:
+                blocks = []
+                while True:
+                    block = self.read(self.block_size)
+                    if not block:
+                        return b"".join(blocks)
+                    blocks.append(block)
+            data = bytearray(size)
+            n_read = self.readinto(data)
+            del data[n_read:]
+            return bytes(data)
+
+    def seek(self, offset, whence=0):
+        """Change the file position.
+
+        The new position is specified by offset, relative to the
+        position indicated by whence. Values for whence are:
+
+            0: start of stream (default); offset must not be negative
+            1: current stream position
+            2: end of stream; offset must not be positive
+
+        Returns the new file position.
+
+        Only the block holding the new position is decompressed. Seeking
+        requires the block index.
+        """
+        with self._lock:
+            self._check_can_seek()
+
+            # Recalculate offset as an absolute file position.
+            if whence == 0:
+                pass
+            elif whence == 1:
+                offset = self._pos + offset
+            elif whence == 2:
+                offset = self._size + offset
+            else:
+                raise ValueError("Invalid value for whence: %s" % (whence,))
+            offset = max(0, min(offset, self._size))
+
+            block_start = self._pos - self._block_offset
+            if block_start <= offset < block_start + len(self._block):
+                # The position is in the current block.
+                self._block_offset = offset - block_start
+            elif self._index:
+                i = bisect.bisect_right(self._block_starts, offset) - 1
+                compressed_offset, block_start = self._index[i]
+                # Drop the blocks decompressed ahead and restart the
+                # stream at the block holding the new position.
+                self._pending.clear()
+                self._fp.seek(self._start + compressed_offset)
+                self._mode = _MODE_READ
+                self._readahead = 1
+                self._next_block()
+                self._block_offset = offset - block_start
+            self._pos = offset
+            return self._pos
+
+
+class BlockCompressorWrapper(CompressorWrapper):
+    """A wrapper around block compressed file objects.
+
+    Attributes
+    ----------
+    codec: str in {'zlib', 'lz4', 'lzma'}
+        The compression method of the blocks.
+    block_size: int
+        The size in bytes of the blocks compressed independently.
+    n_threads: int or None
+        The number of threads (de)compressing the blocks, the number of CPUs
+        if None.
+    """
+
+    def __init__(self, codec, block_size=_BLOCK_SIZE, n_threads=None):
+        CompressorWrapper.__init__(
+            self, obj=BlockCompressedFile,
+            prefix=_BLOCK_PREFIX + _BLOCK_CODECS[codec][0])
+        self.codec = codec
+        self.block_size = block_size
+        self.n_threads = n_threads
+
+    def _check_versions(self):
+        if self.codec == 'lz4' and (not PY3_OR_LATER or lz4 is None):
+            raise ValueError(LZ4_NOT_INSTALLED_ERROR)
+        if self.codec == 'lzma' and lzma is None:
+            raise ValueError('lzma module is not available on your python '
+                             'standard library.')
+
+    def compressor_file(self, fileobj, compresslevel=None):
+        """Returns an instance of a compressor file object."""
+        self._check_versions()
+        return self.fileobj_factory(fileobj, 'wb',
+                                    compresslevel=compresslevel,
+                                    codec=self.codec,
+                                    block_size=self.block_size,
+                                    n_threads=self.n_threads)
+
+    def decompressor_file(self, fileobj):
+        """Returns an instance of a decompressor file object."""
+        self._check_versions()
+        return self.fileobj_factory(fileobj, 'rb', n_threads=self.n_threads)
+
+
+###############################################################################
+#  pre-compression filters of numpy array bytes
+
+# The filters are applied independently to blocks of this many bytes, rounded
+# down to whole items, so that any block can be decoded on its own.
+_FILTER_BLOCK_SIZE = 1024 ** 2
+_SHUFFLE_FILTERS = ('shuffle',)
+_DELTA_SHUFFLE_FILTERS = ('delta', 'shuffle')
+
+
+def _filter_block_items(itemsize, block_size):
+    """Return the number of items of the blocks filtered independently."""
+    return max(block_size // itemsize, 1)
+
+
+def _is_sorted(array):
+    """Whether the items of a contiguous array are in increasing order."""
+    if array.size < 2 or not (array.flags.c_contiguous or
+                              array.flags.f_contiguous):
+        return False
+    flat = array.ravel(order='K')
+    step = _filter_block_items(flat.itemsize, _FILTER_BLOCK_SIZE)
+    for start in range(0, flat.size - 1, step):
+        chunk = flat[start:start + step + 1]
+        if not (chunk[1:] >= chunk[:-1]).all():
+            return False
+    return True
+
+
+def _select_filters(array):
+    """Return the filters making the bytes of array more compressible.
+
+    Byte shuffling groups the bytes of same significance of the items of
+    numeric arrays, e.g. the exponents of floats or the high order bytes of
+    small integers, into long runs that compress much better. Sorted
+    integers and dates are also delta coded beforehand.
+    """
+    dtype = array.dtype
+    if dtype.kind not in 'iufcmM' or dtype.itemsize == 1:
+        return ()
+    if dtype.kind in 'iumM' and dtype.isnative and _is_sorted(array):
+        return _DELTA_SHUFFLE_FILTERS
+    return _SHUFFLE_FILTERS
+
+
+def _encode_filters(block, filters):
+    """Return the filtered bytes of a 1-d contiguous block of items."""
+    itemsize = block.itemsize
+    data = block.view('u1')
+    if 'delta' in filters:
+        # Differences are computed on unsigned integers, which wrap around
+        # on overflow.
+        items = block.view('u{}'.format(itemsize))
+        delta = items.copy()
+        delta[1:] -= items[:-1]
+        data = delta.view('u1')
+    if 'shuffle' in filters:
+        data = data.reshape(-1, itemsize).T.copy().reshape(-1)
+    return data
+
+
+def _decode_filters(data, itemsize, filters, block_size=_FILTER_BLOCK_SIZE):
+    """Undo in place the filters of the bytes of an array.
+
+    Parameters
+    ----------
+    data: 1-d contiguous numpy.ndarray of uint8
+        The filtered bytes, starting at the beginning of a filtered block.
+    itemsize: int
+        The size in bytes of the items of the array.
+    filters: tuple of str
+        The filters applied to the bytes, in order.
+    block_size: int
+        The size in bytes of the blocks filtered independently.
+    """
+    step = _filter_block_items(itemsize, block_size) * itemsize
+    scratch = None
+    for start in range(0, len(data), step):
+        block = data[start:start + step]
+        if 'shuffle' in filters:
+            if scratch is None:
+                scratch = block.copy()
+            else:
+                scratch[:len(block)] = block
+            shuffled = scratch[:len(block)].reshape(itemsize, -1)
+            block.reshape(-1, itemsize)[...] = shuffled.T
+        if 'delta' in filters:
+            items = block.view('u{}'.format(itemsize))
+            items.cumsum(dtype=items.dtype, out=items)
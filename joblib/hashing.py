@@ -9,20 +9,327 @@ hashing of numpy arrays.
 
 import pickle
 import hashlib
+import os
 import sys
 import types
 import struct
 import io
 import decimal
+import operator
+import threading
+import weakref
 
 from ._compat import _bytes_or_unicode, PY3_OR_LATER
 
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+XXHASH_NOT_INSTALLED_ERROR = ('xxhash is not installed. Install it with pip: '
+                              'https://pypi.org/project/xxhash/')
+
+# Non-cryptographic algorithms provided by the xxhash package
+_XXHASH_NAMES = ('xxh32', 'xxh64', 'xxh3_64', 'xxh3_128', 'xxh128')
+
+# Size of the chunks of the array buffers hashed independently when a
+# number of threads is passed to hash. It is part of the definition of the
+# resulting digests and must not change.
+_TREE_CHUNK_SIZE = 4 * 1024 ** 2
+
+# Maximal size of the scratch buffer used to hash non-contiguous arrays
+_HASH_BLOCK_SIZE = 1024 ** 2
+
+# Version of the normalized pickle stream hashed by CHasher, bumped each time
+# the digests it computes change.
+_C_HASHER_VERSION = b'joblib-c-hasher-3'
+
 
 if PY3_OR_LATER:
+    import copyreg
     Pickler = pickle._Pickler
 else:
+    import copy_reg as copyreg
     Pickler = pickle.Pickler
 
+# Types pickled as is, without memoization, by the C pickler
+_ATOMIC_TYPES = frozenset([type(None), bool, int, float, complex])
+
+# Types whose repr identifies their instances
+_REPR_TYPES = frozenset([type(None), bool, int, float, complex] +
+                        list(_bytes_or_unicode))
+if not PY3_OR_LATER:
+    _REPR_TYPES = _REPR_TYPES.union([long])  # noqa
+
+# Strings tagging the objects replaced by their description when hashed
+_TAGS = ('TOKEN', 'HASHED', 'DIGEST', 'TREE', 'SET', 'DICT', 'COMMUTATIVE',
+         'PANDAS', 'STRINGS')
+
+
+def _new_hash(hash_name):
+    """Return a new hash object for the algorithm hash_name.
+
+    Any algorithm of hashlib is supported, as well as the algorithms of the
+    optional xxhash package.
+    """
+    if hash_name in _XXHASH_NAMES:
+        if xxhash is None:
+            raise ValueError(XXHASH_NOT_INSTALLED_ERROR)
+        return getattr(xxhash, hash_name)()
+    return hashlib.new(hash_name)
+
+
+# Registered functions returning the hash token of the instances of a type
+_HASHERS = {}
+
+
+def register_hasher(klass, hasher, force=False):
+    """Register a function supplying the hash token of instances of klass.
+
+    Instead of being pickled field by field, the objects for which a token
+    is available are hashed through their class and their token. This
+    speeds up the hashing of objects that know a stable fingerprint of
+    their content, e.g. a handle on a file-backed dataset can be identified
+    by the path, size and modification time of the file. Classes can also
+    supply their own token by defining a ``__joblib_hash__`` method.
+
+    Parameters
+    -----------
+    klass: type
+        The class whose instances, including the instances of its
+        subclasses, are hashed with hasher.
+    hasher: callable
+        A function taking an instance of klass and returning its token, a
+        small object that can be hashed by joblib. If the function returns
+        None, the instance is hashed as usual.
+    force: bool, optional
+        Replace the function previously registered for klass, if any.
+    """
+    if not isinstance(klass, type):
+        raise ValueError("Hasher can only be registered for a class, "
+                         "'{}' given.".format(klass))
+
+    if not callable(hasher):
+        raise ValueError("Hasher should be a callable, '{}' given."
+                         .format(hasher))
+
+    if klass in _HASHERS and not force:
+        raise ValueError("Hasher for '{}' already registered."
+                         .format(klass))
+
+    _HASHERS[klass] = hasher
+
+
+def _get_token(obj):
+    """Return the hash token supplied for obj, or None."""
+    klass = type(obj)
+    if _HASHERS:
+        for base in klass.__mro__:
+            if base in _HASHERS:
+                return _HASHERS[base](obj)
+    hash_method = getattr(klass, '__joblib_hash__', None)
+    if hash_method is None:
+        return None
+    return hash_method(obj)
+
+
+def freeze(array):
+    """Mark a numpy array, and the arrays it is a view of, as read-only.
+
+    The digests of read-only arrays can be cached by ``hash`` when called
+    with ``cache_digests=True``: freezing an array is a promise that its
+    content will not change for as long as it is alive.
+
+    Returns
+    -------
+    array: numpy.ndarray
+        The array given as argument.
+    """
+    import numpy as np
+    base = array
+    while isinstance(base, np.ndarray):
+        base.flags.writeable = False
+        base = base.base
+    return array
+
+
+class _DigestCache(object):
+    """Digests of read-only array buffers, keyed on their owner identity.
+
+    The entries are dropped as soon as the object owning the memory of the
+    arrays is garbage collected.
+    """
+
+    def __init__(self):
+        self._data = {}
+        # Reentrant, as the weakref callbacks can be triggered by the garbage
+        # collector while the lock is held.
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _get_owner(array):
+        """Return the object owning the buffer of a read-only array.
+
+        None is returned if any array along the chain of bases is writeable,
+        as its content could then change under a given identity.
+        """
+        import numpy as np
+        while isinstance(array, np.ndarray):
+            if array.flags.writeable:
+                return None
+            owner, array = array, array.base
+        if array is not None:
+            # The memory is owned by a foreign buffer, e.g. a bytes object
+            # or a mmap.
+            if isinstance(array, bytearray):
+                return None
+            owner = array
+        return owner
+
+    @staticmethod
+    def _get_key(array, hash_name):
+        return (array.__array_interface__['data'][0], array.shape,
+                array.strides, array.dtype.str, hash_name)
+
+    def get(self, array, hash_name):
+        owner = self._get_owner(array)
+        if owner is None:
+            return None
+        with self._lock:
+            entry = self._data.get(id(owner))
+            if entry is None or entry[0]() is not owner:
+                return None
+            return entry[1].get(self._get_key(array, hash_name))
+
+    def set(self, array, hash_name, digest):
+        owner = self._get_owner(array)
+        if owner is None:
+            return
+        owner_id = id(owner)
+        with self._lock:
+            entry = self._data.get(owner_id)
+            if entry is None or entry[0]() is not owner:
+                def on_destroy(ref):
+                    with self._lock:
+                        current = self._data.get(owner_id)
+                        if current is not None and current[0] is ref:
+                            del self._data[owner_id]
+                try:
+                    entry = weakref.ref(owner, on_destroy), {}
+                except TypeError:
+                    # The owner cannot be weakly referenced, e.g. bytes
+                    return
+                self._data[owner_id] = entry
+            entry[1][self._get_key(array, hash_name)] = digest
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_DIGEST_CACHE = _DigestCache()
+
+
+def _get_file_identity(array, hash_name):
+    """Return the identity of the file region backing a read-only array.
+
+    The identity is made of the path, inode, size and modification time of
+    the file, completed by the offset and layout of the array in the file.
+    None is returned if the array is not a view of a read-only np.memmap.
+    """
+    import numpy as np
+    memmap = None
+    base = array
+    while isinstance(base, np.ndarray):
+        if base.flags.writeable:
+            return None
+        if isinstance(base, np.memmap) and base.filename is not None:
+            memmap = base
+        base = base.base
+    if memmap is None or memmap.mode != 'r':
+        return None
+    try:
+        stat = os.stat(memmap.filename)
+    except OSError:
+        return None
+    mtime = getattr(stat, 'st_mtime_ns', stat.st_mtime)
+    offset = (memmap.offset + array.__array_interface__['data'][0] -
+              memmap.__array_interface__['data'][0])
+    return (os.path.realpath(memmap.filename), stat.st_ino, stat.st_size,
+            mtime, offset, array.shape, array.strides, array.dtype.str,
+            hash_name)
+
+
+class _MmapDigestTable(object):
+    """In-memory table mapping file identities to content digests."""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, identity):
+        with self._lock:
+            return self._data.get(identity)
+
+    def set(self, identity, digest):
+        with self._lock:
+            self._data[identity] = digest
+
+
+class _PersistentMmapDigestTable(object):
+    """Table mapping file identities to content digests stored on disk.
+
+    Each entry is a small file named after the digest of the identity, so
+    that the table can be shared by concurrent processes.
+    """
+
+    def __init__(self, location):
+        self.location = location
+
+    def _get_filename(self, identity):
+        key = hashlib.md5(repr(identity).encode('utf-8')).hexdigest()
+        return os.path.join(self.location, key[:2], key)
+
+    def get(self, identity):
+        try:
+            with open(self._get_filename(identity), 'r') as f:
+                return f.read().strip() or None
+        except (IOError, OSError):
+            return None
+
+    def set(self, identity, digest):
+        from .backports import concurrency_safe_rename
+        filename = self._get_filename(identity)
+        temporary_filename = '{}.thread-{}-pid-{}'.format(
+            filename, id(threading.current_thread()), os.getpid())
+        try:
+            dirname = os.path.dirname(filename)
+            if not os.path.exists(dirname):
+                os.makedirs(dirname)
+        except OSError:
+            # Concurrent creation of the directory
+            pass
+        try:
+            with open(temporary_filename, 'w') as f:
+                f.write(digest)
+            concurrency_safe_rename(temporary_filename, filename)
+        except (IOError, OSError):
+            # The table is only an accelerator: failing to fill it is
+            # harmless.
+            pass
+
+
+_MMAP_DIGEST_TABLES = {True: _MmapDigestTable()}
+
+
+def _get_mmap_digest_table(mmap_digests):
+    """Return the table selected by the mmap_digests option of hash."""
+    table = _MMAP_DIGEST_TABLES.get(mmap_digests)
+    if table is None:
+        table = _MMAP_DIGEST_TABLES.setdefault(
+            mmap_digests, _PersistentMmapDigestTable(mmap_digests))
+    return table
+
 
 class _ConsistentSet(object):
     """ Class used to ensure the hash of Sets is preserved
@@ -42,6 +349,73 @@ class _ConsistentSet(object):
             self._sequence = sorted((hash(e) for e in set_sequence))
 
 
+def _combine_digests(item_hasher, items):
+    """Return the sum of the digests of items computed by item_hasher.
+
+    The sum does not depend on the order of the items, hence they do not
+    need to be sorted. It can also be accumulated over chunks of items.
+    """
+    # Copying an empty hash object is cheaper than creating a new one
+    empty_hash = _new_hash(item_hasher.hash_name)
+    empty_hash.update(b'A')
+    total = 0
+    for item in items:
+        if type(item) is tuple:
+            is_atomic = all([type(x) in _REPR_TYPES for x in item])
+        else:
+            is_atomic = type(item) in _REPR_TYPES
+        if is_atomic:
+            # The repr of these objects identifies them, and is much
+            # cheaper than their pickle, which starts with another byte.
+            item_hash = empty_hash.copy()
+            item_hash.update(repr(item).encode('utf-8', 'surrogatepass'))
+        else:
+            item_hasher._reset()
+            item_hasher.hash(item, return_digest=False)
+            item_hash = item_hasher._hash
+        total += int(item_hash.hexdigest(), 16)
+    modulus = 1 << (8 * empty_hash.digest_size)
+    return '%x' % (total % modulus)
+
+
+def _combine_container(hasher, container, items):
+    """Return the tagged combination of the digests of the items of a
+    container, in commutative mode.
+
+    The items are hashed by a separate hasher, which does not share the
+    memo of hasher: the containers being hashed are tracked instead, and a
+    container reached again from its own items is replaced by a reference
+    to its depth relative to the current one.
+    """
+    active = hasher._active
+    key = id(container)
+    if key in active:
+        return 'RECURSIVE', len(active) - active[key]
+    item_hasher = hasher._get_item_hasher()
+    item_hasher._active = active
+    active[key] = len(active)
+    try:
+        return 'COMMUTATIVE', _combine_digests(item_hasher, items)
+    finally:
+        del active[key]
+
+
+class _ContainerItems(object):
+    """Iterator over the items of a container, referencing the container."""
+
+    def __init__(self, container, items):
+        self.container = container
+        self._items = iter(items)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._items)
+
+    next = __next__
+
+
 class _MyHash(object):
     """ Class used to hash objects that won't normally pickle """
 
@@ -54,15 +428,34 @@ class Hasher(Pickler):
         pickling.
     """
 
-    def __init__(self, hash_name='md5'):
+    def __init__(self, hash_name='md5', commutative=False):
         self.stream = io.BytesIO()
         # By default we want a pickle protocol that only changes with
         # the major python version and not the minor one
         protocol = (pickle.DEFAULT_PROTOCOL if PY3_OR_LATER
                     else pickle.HIGHEST_PROTOCOL)
         Pickler.__init__(self, self.stream, protocol=protocol)
+        self.hash_name = hash_name
+        self.commutative = commutative
+        # Hasher of the items of dicts and sets, in commutative mode, and
+        # depths of the containers being hashed, shared with it
+        self._item_hasher = None
+        self._active = {}
         # Initialise the hash obj
-        self._hash = hashlib.new(hash_name)
+        self._hash = _new_hash(hash_name)
+
+    def _reset(self):
+        """Reset the state of the hasher to hash a new object."""
+        self.stream.seek(0)
+        self.stream.truncate()
+        self.clear_memo()
+        self._hash = _new_hash(self.hash_name)
+
+    def _get_item_hasher(self):
+        if self._item_hasher is None:
+            self._item_hasher = Hasher(hash_name=self.hash_name,
+                                       commutative=True)
+        return self._item_hasher
 
     def hash(self, obj, return_digest=True):
         try:
@@ -76,7 +469,12 @@ class Hasher(Pickler):
             return self._hash.hexdigest()
 
     def save(self, obj):
-        if isinstance(obj, (types.MethodType, type({}.pop))):
+        token = _get_token(obj)
+        if token is not None:
+            # The object is identified by its class and the token it
+            # supplies, instead of being pickled.
+            obj = (obj.__class__, ('TOKEN', token))
+        elif isinstance(obj, (types.MethodType, type({}.pop))):
             # the Pickler cannot pickle instance methods; here we decompose
             # them into components that make them uniquely identifiable
             if hasattr(obj, '__func__'):
@@ -137,7 +535,31 @@ class Hasher(Pickler):
     # function
     dispatch[type(pickle.dump)] = save_global
 
+    def save_reduce(self, func, args, state=None, listitems=None,
+                    dictitems=None, *rest, **kwargs):
+        if self.commutative and dictitems is not None:
+            dictitems = _ContainerItems(kwargs.get('obj'), dictitems)
+        Pickler.save_reduce(self, func, args, state, listitems, dictitems,
+                            *rest, **kwargs)
+
+    def save_dict(self, obj):
+        if not self.commutative:
+            Pickler.save_dict(self, obj)
+            return
+        # As Pickler.save_dict, with the protocols used for hashing
+        self.write(pickle.EMPTY_DICT)
+        self.memoize(obj)
+        self._batch_setitems(_ContainerItems(obj, obj.items()))
+
+    dispatch[type({})] = save_dict
+
     def _batch_setitems(self, items):
+        if self.commutative:
+            # The items are replaced by the combination of their digests
+            container = getattr(items, 'container', items)
+            Pickler._batch_setitems(self, iter([
+                _combine_container(self, container, items)]))
+            return
         # forces order of keys in dict to ensure consistent hash.
         try:
             # Trying first to compare dict assuming the type of keys is
@@ -152,6 +574,10 @@ class Hasher(Pickler):
                                                       for k, v in items)))
 
     def save_set(self, set_items):
+        if self.commutative:
+            Pickler.save(self, (set_items.__class__, _combine_container(
+                self, set_items, set_items)))
+            return
         # forces order of items in Set to ensure consistent hash
         Pickler.save(self, _ConsistentSet(set_items))
 
@@ -162,7 +588,9 @@ class NumpyHasher(Hasher):
     """ Special case the hasher for when numpy is loaded.
     """
 
-    def __init__(self, hash_name='md5', coerce_mmap=False):
+    def __init__(self, hash_name='md5', coerce_mmap=False,
+                 cache_digests=False, mmap_digests=False, n_threads=None,
+                 commutative=False, fast_pandas=False):
         """
             Parameters
             ----------
@@ -171,9 +599,38 @@ class NumpyHasher(Hasher):
             coerce_mmap: boolean
                 Make no difference between np.memmap and np.ndarray
                 objects.
+            cache_digests: boolean
+                Hash arrays through the digest of their buffer, and cache
+                the digests of read-only arrays.
+            mmap_digests: boolean or string
+                Hash arrays through the digest of their buffer, and look up
+                the digests of read-only memmaps by file identity, in memory
+                (True) or in the given directory.
+            n_threads: int or None
+                Hash arrays through a tree of the digests of fixed-size
+                chunks of their buffer, computed in n_threads threads.
+            commutative: boolean
+                Hash dicts and sets through the sum of the digests of their
+                items instead of sorting them.
+            fast_pandas: boolean
+                Hash pandas objects through their numpy arrays and
+                metadata.
         """
         self.coerce_mmap = coerce_mmap
-        Hasher.__init__(self, hash_name=hash_name)
+        self.fast_pandas = fast_pandas
+        self.hash_name = hash_name
+        self.cache_digests = cache_digests
+        self.mmap_digests = mmap_digests
+        self.n_threads = n_threads
+        self._pool = None
+        if n_threads is None:
+            self._digest_tag = 'DIGEST'
+            self._digest_name = hash_name
+        else:
+            self._digest_tag = 'TREE'
+            self._digest_name = '{}-tree-{}'.format(hash_name,
+                                                    _TREE_CHUNK_SIZE)
+        Hasher.__init__(self, hash_name=hash_name, commutative=commutative)
         # delayed import of numpy, to avoid tight coupling
         import numpy as np
         self.np = np
@@ -182,50 +639,41 @@ class NumpyHasher(Hasher):
         else:
             self._getbuffer = memoryview
 
+    def hash(self, obj, return_digest=True):
+        try:
+            return Hasher.hash(self, obj, return_digest=return_digest)
+        finally:
+            self._close_pool()
+
+    def _get_item_hasher(self):
+        if self._item_hasher is None:
+            self._item_hasher = NumpyHasher(
+                hash_name=self.hash_name, coerce_mmap=self.coerce_mmap,
+                cache_digests=self.cache_digests,
+                mmap_digests=self.mmap_digests, n_threads=self.n_threads,
+                commutative=True, fast_pandas=self.fast_pandas)
+        return self._item_hasher
+
+    def _close_pool(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
+
     def save(self, obj):
         """ Subclass the save method, to hash ndarray subclass, rather
             than pickling them. Off course, this is a total abuse of
             the Pickler class.
         """
-        if isinstance(obj, self.np.ndarray) and not obj.dtype.hasobject:
-            # Compute a hash of the object
-            # The update function of the hash requires a c_contiguous buffer.
-            if obj.shape == ():
-                # 0d arrays need to be flattened because viewing them as bytes
-                # raises a ValueError exception.
-                obj_c_contiguous = obj.flatten()
-            elif obj.flags.c_contiguous:
-                obj_c_contiguous = obj
-            elif obj.flags.f_contiguous:
-                obj_c_contiguous = obj.T
-            else:
-                # Cater for non-single-segment arrays: this creates a
-                # copy, and thus aleviates this issue.
-                # XXX: There might be a more efficient way of doing this
-                obj_c_contiguous = obj.flatten()
-
-            # memoryview is not supported for some dtypes, e.g. datetime64, see
-            # https://github.com/numpy/numpy/issues/4983. The
-            # workaround is to view the array as bytes before
-            # taking the memoryview.
-            self._hash.update(
-                self._getbuffer(obj_c_contiguous.view(self.np.uint8)))
-
-            # We store the class, to be able to distinguish between
-            # Objects with the same binary content, but different
-            # classes.
-            if self.coerce_mmap and isinstance(obj, self.np.memmap):
-                # We don't make the difference between memmap and
-                # normal ndarrays, to be able to reload previously
-                # computed results with memmap.
-                klass = self.np.ndarray
-            else:
-                klass = obj.__class__
-            # We also return the dtype and the shape, to distinguish
-            # different views on the same data with different dtypes.
-
-            # The object will be pickled by the pickler hashed at the end.
-            obj = (klass, ('HASHED', obj.dtype, obj.shape, obj.strides))
+        token = None
+        if isinstance(obj, self.np.ndarray):
+            token = _get_token(obj)
+        if token is not None:
+            # Arrays supplying their own token are not hashed by content.
+            obj = (obj.__class__, ('TOKEN', token))
+        elif self.fast_pandas and self._is_pandas(obj):
+            obj = self._reduce_pandas(obj)
+        elif isinstance(obj, self.np.ndarray) and not obj.dtype.hasobject:
+            obj = self._reduce_array(obj)
         elif isinstance(obj, self.np.dtype):
             # Atomic dtype objects are interned by their default constructor:
             # np.dtype('f8') is np.dtype('f8')
@@ -242,22 +690,522 @@ class NumpyHasher(Hasher):
             obj = (klass, ('HASHED', obj.descr))
         Hasher.save(self, obj)
 
+    def _is_pandas(self, obj):
+        pd = sys.modules.get('pandas')
+        return (pd is not None and
+                isinstance(obj, (pd.DataFrame, pd.Series, pd.Index)))
+
+    def _reduce_pandas(self, obj):
+        """Return the (class, description) pair identifying a pandas
+        DataFrame, Series or Index through its numpy arrays."""
+        pd = sys.modules['pandas']
+        if isinstance(obj, pd.DataFrame):
+            # The blocks hold the data of the columns of the same dtype in
+            # 2d arrays, hashed at once.
+            manager = getattr(obj, '_mgr', None)
+            if manager is None:
+                manager = obj._data
+            description = (
+                self._reduce_pandas(obj.columns),
+                self._reduce_pandas(obj.index),
+                [(block.mgr_locs.as_array, str(block.dtype),
+                  self._reduce_pandas_values(block.values))
+                 for block in manager.blocks])
+        elif isinstance(obj, pd.Series):
+            description = (obj.name, str(obj.dtype),
+                           self._reduce_pandas(obj.index),
+                           self._reduce_pandas_values(obj._values))
+        elif isinstance(obj, pd.MultiIndex):
+            description = (list(obj.names),
+                           [self._reduce_pandas(level)
+                            for level in obj.levels],
+                           [self.np.asarray(codes) for codes in obj.codes])
+        elif isinstance(obj, pd.RangeIndex):
+            description = (obj.name, obj.start, obj.stop, obj.step)
+        else:
+            description = (obj.name, str(obj.dtype),
+                           self._reduce_pandas_values(obj._values))
+        return obj.__class__, ('PANDAS', description)
+
+    def _reduce_pandas_values(self, values):
+        """Return the description of the values of a pandas object."""
+        if not isinstance(values, self.np.ndarray):
+            # Extension arrays, e.g. Categorical, are pickled.
+            return values
+        if values.dtype.hasobject:
+            pd = sys.modules['pandas']
+            flat_values = values.ravel()
+            if pd.api.types.infer_dtype(flat_values, skipna=False) == 'string':
+                # Columns of strings are reduced to an array of their 64 bit
+                # hashes, computed by pandas without pickling them.
+                return ('STRINGS', values.shape, pd.util.hash_array(
+                    flat_values, categorize=False))
+        return values
+
+    def _reduce_array(self, obj, own_digest=False):
+        """Return the (class, description) pair identifying the array obj
+        without object items, whose buffer is hashed.
+
+        The buffer is hashed to its own digest, part of the description, if
+        own_digest is True or if digests are cached or computed in threads,
+        and fed to the hash of the whole object otherwise.
+        """
+        if (own_digest or self.cache_digests or self.mmap_digests or
+                self.n_threads is not None):
+            # The buffer is hashed separately so that its digest can be
+            # reused the next time the same read-only array is hashed.
+            tag = self._digest_tag
+            digest = self._get_digest(obj)
+        else:
+            tag = 'HASHED'
+            self._update_with_buffer(self._hash, obj)
+
+        # We store the class, to be able to distinguish between
+        # Objects with the same binary content, but different
+        # classes.
+        if self.coerce_mmap and isinstance(obj, self.np.memmap):
+            # We don't make the difference between memmap and
+            # normal ndarrays, to be able to reload previously
+            # computed results with memmap.
+            klass = self.np.ndarray
+        else:
+            klass = obj.__class__
+        # We also return the dtype and the shape, to distinguish
+        # different views on the same data with different dtypes.
+
+        # The object will be pickled by the pickler hashed at the end.
+        if tag != 'HASHED':
+            return klass, (tag, digest, obj.dtype, obj.shape, obj.strides)
+        return klass, (tag, obj.dtype, obj.shape, obj.strides)
+
+    def _get_digest(self, obj):
+        """Return the digest of the buffer of obj, from a cache if any."""
+        digest = table = identity = None
+        if self.mmap_digests:
+            identity = _get_file_identity(obj, self._digest_name)
+            if identity is not None:
+                table = _get_mmap_digest_table(self.mmap_digests)
+                digest = table.get(identity)
+                if digest is not None:
+                    return digest
+        if digest is None and self.cache_digests:
+            digest = _DIGEST_CACHE.get(obj, self._digest_name)
+        if digest is None:
+            if self.n_threads is None:
+                array_hash = _new_hash(self.hash_name)
+                self._update_with_buffer(array_hash, obj)
+                digest = array_hash.hexdigest()
+            else:
+                digest = self._get_tree_digest(obj)
+            if self.cache_digests:
+                _DIGEST_CACHE.set(obj, self._digest_name, digest)
+        if table is not None:
+            table.set(identity, digest)
+        return digest
+
+    def _get_tree_digest(self, obj):
+        """Return the digest of the digests of the chunks of obj buffer.
+
+        The chunks have a fixed size so that the digest does not depend on
+        the number of threads used to compute it: hashlib releases the GIL
+        while hashing large buffers.
+        """
+        if not self._is_single_segment(obj):
+            return self._get_streamed_tree_digest(obj)
+        buffer = self._get_bytes(obj)
+        chunks = [buffer[start:start + _TREE_CHUNK_SIZE]
+                  for start in range(0, buffer.shape[0], _TREE_CHUNK_SIZE)]
+
+        def chunk_digest(chunk):
+            chunk_hash = _new_hash(self.hash_name)
+            chunk_hash.update(self._getbuffer(chunk))
+            return chunk_hash.digest()
+
+        if self.n_threads > 1 and len(chunks) > 1:
+            if self._pool is None:
+                from multiprocessing.pool import ThreadPool
+                self._pool = ThreadPool(self.n_threads)
+            digests = self._pool.map(chunk_digest, chunks)
+        else:
+            digests = map(chunk_digest, chunks)
+        tree_hash = _new_hash(self.hash_name)
+        for digest in digests:
+            tree_hash.update(digest)
+        return tree_hash.hexdigest()
+
+    def _get_streamed_tree_digest(self, obj):
+        """Compute the tree digest of a non-contiguous array sequentially.
+
+        The blocks of the array do not match the chunks of the tree, they
+        are split and fed to the chunk hashes as they come.
+        """
+        tree_hash = _new_hash(self.hash_name)
+        chunk_hash = None
+        remaining = 0
+        for block in self._iter_bytes(obj):
+            while block.shape[0]:
+                if remaining == 0:
+                    if chunk_hash is not None:
+                        tree_hash.update(chunk_hash.digest())
+                    chunk_hash = _new_hash(self.hash_name)
+                    remaining = _TREE_CHUNK_SIZE
+                part = block[:remaining]
+                chunk_hash.update(self._getbuffer(part))
+                remaining -= part.shape[0]
+                block = block[part.shape[0]:]
+        if chunk_hash is not None:
+            tree_hash.update(chunk_hash.digest())
+        return tree_hash.hexdigest()
+
+    def _update_with_buffer(self, hash_obj, obj):
+        """Update hash_obj with the memory buffer of the array obj."""
+        for block in self._iter_bytes(obj):
+            hash_obj.update(self._getbuffer(block))
+
+    def _is_single_segment(self, obj):
+        return (obj.shape == () or obj.flags.c_contiguous or
+                obj.flags.f_contiguous)
+
+    def _iter_bytes(self, obj):
+        """Yield the memory buffer of the array obj as 1d uint8 arrays.
+
+        The buffer of non-contiguous arrays is yielded in C order, by blocks
+        of rows copied in a scratch buffer of bounded size instead of a full
+        copy of the array. The blocks are only valid until the next one is
+        requested.
+        """
+        if self._is_single_segment(obj):
+            yield self._get_bytes(obj)
+            return
+
+        obj = obj.view(self.np.ndarray)
+        row_nbytes = obj.dtype.itemsize
+        for dim in obj.shape[1:]:
+            row_nbytes *= dim
+        if row_nbytes > _HASH_BLOCK_SIZE:
+            # A single row does not fit in the scratch buffer
+            for row in obj:
+                for block in self._iter_bytes(row):
+                    yield block
+            return
+
+        n_rows = min(_HASH_BLOCK_SIZE // row_nbytes, obj.shape[0])
+        scratch = self.np.empty((n_rows,) + obj.shape[1:], dtype=obj.dtype)
+        for start in range(0, obj.shape[0], n_rows):
+            rows = obj[start:start + n_rows]
+            block = scratch[:rows.shape[0]]
+            self.np.copyto(block, rows)
+            yield block.reshape(-1).view(self.np.uint8)
+
+    def _get_bytes(self, obj):
+        """Return the memory buffer of a single segment array as a 1d uint8
+        array."""
+        # The update function of the hash requires a c_contiguous buffer.
+        if obj.shape == ():
+            # 0d arrays need to be flattened because viewing them as bytes
+            # raises a ValueError exception.
+            obj_c_contiguous = obj.flatten()
+        elif obj.flags.c_contiguous:
+            obj_c_contiguous = obj
+        else:
+            obj_c_contiguous = obj.T
+
+        # memoryview is not supported for some dtypes, e.g. datetime64, see
+        # https://github.com/numpy/numpy/issues/4983. The
+        # workaround is to view the array as bytes before
+        # taking the memoryview.
+        return obj_c_contiguous.reshape(-1).view(self.np.uint8)
+
+
+class CHasher(pickle.Pickler):
+    """ A hasher built on the C implementation of the pickler.
+
+        Instead of overriding the pure Python pickler at each saved object,
+        the object is first walked to normalize the built-in containers
+        (sorted dicts and sets, equal strings shared so that memoization
+        depends on their value only). The objects of other types, e.g.
+        numpy arrays, are normalized as they are pickled through
+        reducer_override, which requires Python 3.8.
+
+        The digests differ from the ones of Hasher and are versioned: they
+        only change along with _C_HASHER_VERSION.
+    """
+
+    # Fixed, so that the digests do not depend on the default protocol of
+    # the Python version.
+    protocol = 4
+
+    def __init__(self, hash_name='md5', commutative=False, **numpy_options):
+        """
+            Parameters
+            ----------
+            hash_name: string
+                The hash algorithm to be used
+            commutative: boolean
+                Hash dicts and sets through the sum of the digests of their
+                items instead of sorting them.
+            **numpy_options:
+                Options of NumpyHasher, used to hash numpy arrays.
+        """
+        if sys.version_info < (3, 8):
+            raise ValueError('The C pickler based hasher requires '
+                             'Python 3.8 or later.')
+        self.stream = io.BytesIO()
+        pickle.Pickler.__init__(self, self.stream, protocol=self.protocol)
+        self.hash_name = hash_name
+        self.commutative = commutative
+        self.numpy_options = numpy_options
+        self._item_hasher = None
+        self._active = {}
+        self._array_hasher = None
+        if 'numpy' in sys.modules:
+            # Arrays are hashed as by NumpyHasher, directly in self._hash
+            self._array_hasher = NumpyHasher(hash_name=hash_name,
+                                             **numpy_options)
+        self._reset()
+        # The tags used in the normalized objects are shared with the equal
+        # strings of the hashed object.
+        self._interned = dict((tag, tag) for tag in _TAGS)
+        self._seen = {}
+
+    def _reset(self):
+        """Reset the state of the hasher to hash a new object."""
+        self.stream.seek(0)
+        self.stream.truncate()
+        self.clear_memo()
+        self._hash = _new_hash(self.hash_name)
+        self._hash.update(_C_HASHER_VERSION)
+        if self._array_hasher is not None:
+            self._array_hasher._hash = self._hash
+
+    def _get_item_hasher(self):
+        if self._item_hasher is None:
+            self._item_hasher = CHasher(hash_name=self.hash_name,
+                                        commutative=True,
+                                        **self.numpy_options)
+        return self._item_hasher
+
+    def hash(self, obj, return_digest=True):
+        try:
+            self.dump(self._normalize(obj))
+        except pickle.PicklingError as e:
+            e.args += ('PicklingError while hashing %r: %r' % (obj, e),)
+            raise
+        except AttributeError as e:
+            # Raised by the C pickler for the objects that cannot be pickled
+            # by reference, e.g. local functions.
+            if not str(e).startswith("Can't pickle"):
+                raise
+            raise pickle.PicklingError(
+                str(e), 'PicklingError while hashing %r: %r' % (obj, e))
+        finally:
+            self._interned = dict((tag, tag) for tag in _TAGS)
+            self._seen.clear()
+            if self._array_hasher is not None:
+                self._array_hasher._close_pool()
+        self._hash.update(self.stream.getvalue())
+        if return_digest:
+            return self._hash.hexdigest()
+
+    def _normalize(self, obj):
+        """Return a copy of obj with normalized built-in containers."""
+        obj_type = type(obj)
+        if obj_type in _ATOMIC_TYPES:
+            return obj
+        if obj_type is str or obj_type is bytes:
+            # The C pickler memoizes strings by identity
+            return self._interned.setdefault(obj, obj)
+        normalize = self._normalize
+        normalize_items = self._normalize_items
+        if obj_type is tuple:
+            return tuple(normalize_items(obj))
+        if self.commutative and (obj_type is dict or obj_type is set or
+                                 obj_type is frozenset):
+            items = obj.items() if obj_type is dict else obj
+            return obj_type, _combine_container(self, obj, items)
+        if obj_type is list or obj_type is dict:
+            # Shared and recursive containers are normalized once, the
+            # original is kept alive so that its id is not reused.
+            seen = self._seen.get(id(obj))
+            if seen is not None:
+                return seen[1]
+            if obj_type is list:
+                normalized = []
+                self._seen[id(obj)] = obj, normalized
+                normalized.extend(normalize_items(obj))
+            else:
+                # The normalized keys may not be hashable, e.g. the ones of
+                # frozensets hold lists, hence the sorted items are kept in
+                # a list rather than a new dict.
+                items = []
+                normalized = obj_type, ('DICT', items)
+                self._seen[id(obj)] = obj, normalized
+                items.extend(self._sorted_items(
+                    list(zip(normalize_items(obj.keys()),
+                             normalize_items(obj.values()))),
+                    key=operator.itemgetter(0)))
+            return normalized
+        if obj_type is set or obj_type is frozenset:
+            return obj_type, ('SET', self._sorted_items(
+                normalize_items(obj)))
+        if obj_type is type or obj_type is types.FunctionType:
+            return obj
+
+        # Objects described by a new tuple at each occurrence, so that they
+        # are not memoized by identity by the pickler.
+        token = _get_token(obj)
+        if token is not None:
+            return obj.__class__, ('TOKEN', normalize(token))
+        array_hasher = self._array_hasher
+        if array_hasher is not None:
+            np = array_hasher.np
+            if array_hasher.fast_pandas and array_hasher._is_pandas(obj):
+                klass, args = array_hasher._reduce_pandas(obj)
+                return klass, normalize(args)
+            if isinstance(obj, np.ndarray) and not obj.dtype.hasobject:
+                # Arrays are normalized before the containers holding them
+                # are sorted: their buffers are hashed to their own digest
+                # rather than fed to self._hash in the order of the walk.
+                klass, args = array_hasher._reduce_array(obj,
+                                                         own_digest=True)
+                return klass, normalize(args)
+            if isinstance(obj, np.dtype):
+                # See NumpyHasher.save
+                return obj.__class__, ('HASHED', normalize(obj.descr))
+        # The other objects are normalized when pickled, by reducer_override
+        return obj
+
+    def _normalize_items(self, items):
+        """Return the list of the normalized items of an iterable."""
+        # The atomic items, which make most of the data, are inlined to
+        # save function calls.
+        normalized = []
+        append = normalized.append
+        intern = self._interned.setdefault
+        normalize = self._normalize
+        for item in items:
+            item_type = type(item)
+            if item_type in _ATOMIC_TYPES:
+                append(item)
+            elif item_type is str or item_type is bytes:
+                append(intern(item, item))
+            else:
+                append(normalize(item))
+        return normalized
+
+    def _sorted_items(self, items, key=None):
+        """Sort items, by their digests if they are not orderable."""
+        try:
+            return sorted(items, key=key)
+        except (TypeError, decimal.InvalidOperation):
+            if key is None:
+                key = _identity
+            return sorted(items, key=lambda item: self._digest(key(item)))
+
+    def _digest(self, obj):
+        """Return the digest of obj, with a fresh state."""
+        hasher = CHasher(hash_name=self.hash_name, **self.numpy_options)
+        return hasher.hash(obj)
+
+    def reducer_override(self, obj):
+        if isinstance(obj, (type, types.FunctionType)):
+            # Pickled by reference
+            return NotImplemented
+        normalize = self._normalize
+        reduce = copyreg.dispatch_table.get(type(obj))
+        if reduce is not None:
+            rv = reduce(obj)
+        else:
+            rv = obj.__reduce_ex__(self.protocol)
+        if isinstance(rv, str):
+            # Global object, e.g. a builtin function
+            return NotImplemented
+        rv = list(rv)
+        rv[1] = normalize(rv[1])
+        if len(rv) > 2:
+            rv[2] = normalize(rv[2])
+        if len(rv) > 3 and rv[3] is not None:
+            rv[3] = iter([normalize(item) for item in rv[3]])
+        if len(rv) > 4 and rv[4] is not None and self.commutative:
+            rv[4] = iter([_combine_container(self, obj, rv[4])])
+        elif len(rv) > 4 and rv[4] is not None:
+            # As Hasher does for all dicts, ordered or not
+            rv[4] = iter(self._sorted_items(
+                [(normalize(key), normalize(value)) for key, value in rv[4]],
+                key=operator.itemgetter(0)))
+        return tuple(rv)
+
+
+def _identity(obj):
+    return obj
+
 
-def hash(obj, hash_name='md5', coerce_mmap=False):
+def hash(obj, hash_name='md5', coerce_mmap=False, cache_digests=False,
+         mmap_digests=False, n_threads=None, c_pickler=False,
+         commutative=False, fast_pandas=False):
     """ Quick calculation of a hash to identify uniquely Python objects
         containing numpy arrays.
 
 
         Parameters
         -----------
-        hash_name: 'md5' or 'sha1'
+        hash_name: 'md5', 'sha1', 'blake2b', 'xxh64', ...
             Hashing algorithm used. sha1 is supposedly safer, but md5 is
-            faster.
+            faster. Any algorithm of hashlib can be used, as well as the
+            non-cryptographic and much faster algorithms of the xxhash
+            package ('xxh64', 'xxh3_64', 'xxh3_128', ...), when installed.
         coerce_mmap: boolean
             Make no difference between np.memmap and np.ndarray
+        cache_digests: boolean
+            Hash numpy arrays through the digest of their buffer, and
+            remember the digests of read-only arrays (see ``freeze``) for as
+            long as they are alive, so that hashing them again is cheap.
+            The resulting hashes differ from the ones computed without this
+            option.
+        mmap_digests: boolean or string
+            Identify arrays backed by a file memory-mapped in read-only mode
+            by the path, inode, size and modification time of the file and
+            the position of the array in the file. The content digests of
+            the arrays are stored in a table mapping these identities,
+            either kept in memory if True, or persisted in the directory
+            given as a string, so that the files are only read the first
+            time they are hashed. Arrays are hashed as with cache_digests,
+            and memmaps hash as in-memory arrays with the same content when
+            coerce_mmap is True.
+        n_threads: int or None
+            If not None, the buffers of numpy arrays are split in chunks of
+            fixed size, whose digests are computed in parallel in n_threads
+            threads and combined in a tree. The resulting hashes differ from
+            the ones computed by default but do not depend on n_threads.
+        c_pickler: boolean
+            Use CHasher, based on the C implementation of the pickler, which
+            is much faster on structures made of many small Python objects.
+            It requires Python 3.8 or later and computes different hashes.
+        commutative: boolean
+            Hash dicts and sets through the sum of the digests of their
+            items, which does not depend on their order, instead of sorting
+            them. This takes linear time, which pays off for large dicts
+            and sets, or when their items cannot be ordered. The resulting
+            hashes differ from the ones computed without this option.
+        fast_pandas: boolean
+            Hash pandas DataFrame, Series and Index objects through the
+            numpy arrays holding their data, hashed as numpy arrays, and
+            their metadata, instead of pickling them. The columns of strings
+            are hashed through their 64 bit hashes computed by pandas. The
+            resulting hashes differ from the ones computed without this
+            option.
     """
-    if 'numpy' in sys.modules:
-        hasher = NumpyHasher(hash_name=hash_name, coerce_mmap=coerce_mmap)
+    if c_pickler:
+        hasher = CHasher(hash_name=hash_name, coerce_mmap=coerce_mmap,
+                         cache_digests=cache_digests,
+                         mmap_digests=mmap_digests, n_threads=n_threads,
+                         commutative=commutative, fast_pandas=fast_pandas)
+    elif 'numpy' in sys.modules:
+        hasher = NumpyHasher(hash_name=hash_name, coerce_mmap=coerce_mmap,
+                             cache_digests=cache_digests,
+                             mmap_digests=mmap_digests, n_threads=n_threads,
+                             commutative=commutative,
+                             fast_pandas=fast_pandas)
     else:
-        hasher = Hasher(hash_name=hash_name)
+        hasher = Hasher(hash_name=hash_name, commutative=commutative)
     return hasher.hash(obj)
@@ -19,7 +19,9 @@ import traceback
 import warnings
 import inspect
 import sys
+import types
 import weakref
+from multiprocessing.pool import ThreadPool
 
 # Local imports
 from . import hashing
@@ -30,6 +32,8 @@ from ._memory_helpers import open_py_source
 from .logger import Logger, format_time, pformat
 from ._compat import _basestring, PY3_OR_LATER
 from ._store_backends import StoreBackendBase, FileSystemStoreBackend
+from .compressor import _COMPRESSORS, ZstdCompressorWrapper
+from ._utils import _WeakArrayKeyMap
 
 if sys.version_info[:2] >= (3, 4):
     import pathlib
@@ -364,6 +368,10 @@ class NotMemorizedFunc(object):
         # Argument "warn" is for compatibility with MemorizedFunc.clear
         pass
 
+    def prefetch(self, args_iterable, n_jobs=4):
+        # Nothing is stored, hence nothing to prefetch
+        return None
+
 
 ###############################################################################
 # class `MemorizedFunc`
@@ -396,26 +404,36 @@ class MemorizedFunc(Logger):
         numpy arrays. See numpy.load for the meaning of the different
         values.
 
-    compress: boolean, or integer
+    compress: boolean, or integer, or 'auto'
         Whether to zip the stored data on disk. If an integer is
         given, it should be between 1 and 9, and sets the amount
         of compression. Note that compressed arrays cannot be
-        read by memmapping.
+        read by memmapping. If 'auto', only the numpy arrays that
+        compress well are compressed, the others can still be memmapped,
+        see joblib.dump.
 
     verbose: int, optional
         The verbosity flag, controls messages that are issued as
         the function is evaluated.
+
+    hash_options: dict or None
+        Extra keyword arguments passed to :func:`joblib.hashing.hash` when
+        hashing the input arguments.
     """
     # ------------------------------------------------------------------------
     # Public interface
     # ------------------------------------------------------------------------
 
     def __init__(self, func, location, backend='local', ignore=None,
-                 mmap_mode=None, compress=False, verbose=1, timestamp=None):
+                 mmap_mode=None, compress=False, verbose=1, timestamp=None,
+                 hash_options=None):
         Logger.__init__(self)
         self.mmap_mode = mmap_mode
         self.compress = compress
         self.func = func
+        if hash_options is None:
+            hash_options = {}
+        self.hash_options = hash_options
 
         if ignore is None:
             ignore = []
@@ -567,6 +585,42 @@ class MemorizedFunc(Logger):
     def __call__(self, *args, **kwargs):
         return self._cached_call(args, kwargs)[0]
 
+    def prefetch(self, args_iterable, n_jobs=4):
+        """Read ahead the cached results of upcoming calls.
+
+        The results already cached for the given arguments are warmed up in
+        background threads, so that the subsequent calls hit the OS page
+        cache instead of blocking one after another on cold disk reads.
+        Arguments for which no result is cached are skipped.
+
+        Parameters
+        ----------
+        args_iterable: iterable of tuples
+            Positional arguments of the upcoming calls, one tuple per call
+            as for itertools.starmap.
+        n_jobs: int, optional
+            Number of threads used to read the results ahead.
+
+        Returns
+        -------
+        prefetching: multiprocessing.pool.AsyncResult
+            Handle on the background prefetching. Its ``wait`` method blocks
+            until all items are prefetched and ``get`` returns, for each
+            call, whether a cached result was found.
+        """
+        func_id = _build_func_identifier(self.func)
+
+        def prefetch_item(args):
+            args_id = self._get_argument_hash(*args)
+            return self.store_backend.prefetch_item([func_id, args_id])
+
+        pool = ThreadPool(n_jobs)
+        try:
+            return pool.map_async(prefetch_item, args_iterable)
+        finally:
+            # The worker threads exit once the prefetching is done.
+            pool.close()
+
     def __getstate__(self):
         """ We don't store the timestamp when pickling, to avoid the hash
             depending from it.
@@ -581,7 +635,8 @@ class MemorizedFunc(Logger):
 
     def _get_argument_hash(self, *args, **kwargs):
         return hashing.hash(filter_args(self.func, self.ignore, args, kwargs),
-                            coerce_mmap=(self.mmap_mode is not None))
+                            coerce_mmap=(self.mmap_mode is not None),
+                            **self.hash_options)
 
     def _get_output_identifiers(self, *args, **kwargs):
         """Return the func identifier and input parameter hash of a result."""
@@ -807,6 +862,113 @@ class MemorizedFunc(Logger):
             location=self.store_backend.location,)
 
 
+###############################################################################
+# class `MemorizedMethod`
+###############################################################################
+class MemorizedMethod(MemorizedFunc):
+    """Descriptor decorating a method for caching its return value.
+
+    A MemorizedMethod behaves like a MemorizedFunc whose first argument is
+    the instance the method is bound to. Instead of hashing the whole
+    instance on each call, which can be very costly for objects holding
+    large arrays, the instance is hashed once and its digest is reused by
+    the following calls. The digest of an instance is recomputed when:
+
+    * the value of its ``version_attr`` attribute has changed,
+    * it has been explicitly invalidated with
+      ``Klass.method.invalidate(instance)``.
+
+    Instances defining a ``__joblib_token__`` attribute (or method returning
+    it) are never hashed: their token is used in place of the digest, and
+    is expected to change whenever the cached results must be recomputed.
+
+    Attributes
+    ----------
+    version_attr: str or None
+        Name of an instance attribute whose value changes each time the
+        instance is modified.
+
+    See MemorizedFunc for the other attributes.
+    """
+
+    def __init__(self, func, location, backend='local', ignore=None,
+                 mmap_mode=None, compress=False, verbose=1, timestamp=None,
+                 hash_options=None, version_attr=None):
+        if isinstance(func, types.MethodType) and func.__self__ is None:
+            # Python 2 unbound method, e.g. Klass.method: its function takes
+            # the instance as first argument, as expected by filter_args.
+            func = func.__func__
+        MemorizedFunc.__init__(self, func, location, backend=backend,
+                               ignore=ignore, mmap_mode=mmap_mode,
+                               compress=compress, verbose=verbose,
+                               timestamp=timestamp, hash_options=hash_options)
+        self.version_attr = version_attr
+        self._instance_digests = _WeakArrayKeyMap()
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        return types.MethodType(self, instance)
+
+    def invalidate(self, instance):
+        """Forget the digest computed for the given instance."""
+        try:
+            self._instance_digests.set(instance, None)
+        except TypeError:
+            # Instances that cannot be weakly referenced are never cached
+            pass
+
+    def _get_instance_token(self, instance):
+        """Return a cheap identifier of the content of instance."""
+        token = getattr(instance, '__joblib_token__', None)
+        if token is not None:
+            if callable(token):
+                token = token()
+            return instance.__class__, token
+
+        version = None
+        if self.version_attr is not None:
+            version = getattr(instance, self.version_attr)
+        try:
+            cached = self._instance_digests.get(instance)
+        except KeyError:
+            cached = None
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        digest = hashing.hash(instance,
+                              coerce_mmap=(self.mmap_mode is not None),
+                              **self.hash_options)
+        try:
+            self._instance_digests.set(instance, (version, digest))
+        except TypeError:
+            # Instances that cannot be weakly referenced are hashed on each
+            # call.
+            pass
+        return digest
+
+    def _get_argument_hash(self, *args, **kwargs):
+        if not args:
+            # Not called as a bound method, let filter_args report the
+            # missing instance.
+            return MemorizedFunc._get_argument_hash(self, *args, **kwargs)
+        # The instance is replaced by its token in the hashed arguments.
+        token = self._get_instance_token(args[0])
+        return hashing.hash(
+            filter_args(self.func, self.ignore, (token,) + args[1:], kwargs),
+            coerce_mmap=(self.mmap_mode is not None), **self.hash_options)
+
+    def __getstate__(self):
+        state = MemorizedFunc.__getstate__(self)
+        # The digests are only meaningful for the instances of this process.
+        del state['_instance_digests']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._instance_digests = _WeakArrayKeyMap()
+
+
 ###############################################################################
 # class `Memory`
 ###############################################################################
@@ -844,11 +1006,14 @@ class Memory(Logger):
             numpy arrays. See numpy.load for the meaning of the
             arguments.
 
-        compress: boolean, or integer, optional
+        compress: boolean, or integer, or 'auto', optional
             Whether to zip the stored data on disk. If an integer is
             given, it should be between 1 and 9, and sets the amount
             of compression. Note that compressed arrays cannot be
-            read by memmapping.
+            read by memmapping. If 'auto', only the numpy arrays that
+            compress well are compressed, the others can still be
+            memmapped, see joblib.dump. The outputs compressed with
+            'zstd' can use a dictionary, see train_compression_dictionary.
 
         verbose: int, optional
             Verbosity flag, controls the debug messages that are issued
@@ -860,6 +1025,11 @@ class Memory(Logger):
         backend_options: dict, optional
             Contains a dictionnary of named parameters used to configure
             the store backend.
+
+        hash_options: dict, optional
+            Contains a dictionnary of named parameters passed to
+            :func:`joblib.hashing.hash` when hashing the input arguments of
+            the cached functions, e.g. ``{'cache_digests': True}``.
     """
     # ------------------------------------------------------------------------
     # Public interface
@@ -867,7 +1037,7 @@ class Memory(Logger):
 
     def __init__(self, location=None, backend='local', cachedir=None,
                  mmap_mode=None, compress=False, verbose=1, bytes_limit=None,
-                 backend_options=None):
+                 backend_options=None, hash_options=None):
         # XXX: Bad explanation of the None value of cachedir
         Logger.__init__(self)
         self._verbose = verbose
@@ -879,8 +1049,11 @@ class Memory(Logger):
         if backend_options is None:
             backend_options = {}
         self.backend_options = backend_options
+        if hash_options is None:
+            hash_options = {}
+        self.hash_options = hash_options
 
-        if compress and mmap_mode is not None:
+        if compress and compress != 'auto' and mmap_mode is not None:
             warnings.warn('Compressed results cannot be memmapped',
                           stacklevel=2)
         if cachedir is not None:
@@ -963,7 +1136,66 @@ class Memory(Logger):
                              backend=self.backend,
                              ignore=ignore, mmap_mode=mmap_mode,
                              compress=self.compress,
-                             verbose=verbose, timestamp=self.timestamp)
+                             verbose=verbose, timestamp=self.timestamp,
+                             hash_options=self.hash_options)
+
+    def cache_method(self, func=None, ignore=None, verbose=None,
+                     mmap_mode=False, version_attr=None):
+        """ Decorates the given method func to only compute its return
+            value for instances and input arguments not cached on disk.
+
+            The instance is hashed once and its digest is reused across
+            calls, see :class:`joblib.memory.MemorizedMethod` for the rules
+            used to invalidate it.
+
+            Parameters
+            ----------
+            func: function, optional
+                The method to be decorated, in the body of its class.
+            version_attr: str, optional
+                Name of an instance attribute whose value changes each time
+                the instance is modified, triggering a new hash of the
+                instance.
+
+            See the cache method for the other parameters.
+
+            Returns
+            -------
+            decorated_method: MemorizedMethod object or function
+                The returned object binds to instances like a regular
+                method. func is returned unchanged when the Memory object
+                does not cache anything.
+        """
+        if func is None:
+            # Partial application, to be able to specify extra keyword
+            # arguments in decorators
+            return functools.partial(self.cache_method, ignore=ignore,
+                                     verbose=verbose, mmap_mode=mmap_mode,
+                                     version_attr=version_attr)
+        if self.store_backend is None:
+            return func
+        if verbose is None:
+            verbose = self._verbose
+        if mmap_mode is False:
+            mmap_mode = self.mmap_mode
+        return MemorizedMethod(func, location=self.store_backend,
+                               backend=self.backend,
+                               ignore=ignore, mmap_mode=mmap_mode,
+                               compress=self.compress,
+                               verbose=verbose, timestamp=self.timestamp,
+                               hash_options=self.hash_options,
+                               version_attr=version_attr)
+
+    def warm(self, func, args_iterable, n_jobs=4):
+        """ Read ahead the cached results of upcoming calls of func.
+
+            This is a shorthand for ``self.cache(func).prefetch(...)``, see
+            :meth:`joblib.memory.MemorizedFunc.prefetch`. None is returned
+            when the Memory object does not cache anything.
+        """
+        if self.store_backend is None:
+            return None
+        return self.cache(func).prefetch(args_iterable, n_jobs=n_jobs)
 
     def clear(self, warn=True):
         """ Erase the complete cache directory.
@@ -978,6 +1210,34 @@ class Memory(Logger):
         if self.bytes_limit is not None and self.store_backend is not None:
             self.store_backend.reduce_store_size(self.bytes_limit)
 
+    def train_compression_dictionary(self, dict_size=112640,
+                                     max_item_size=65536):
+        """Train a zstandard dictionary on the small outputs in the cache.
+
+        Small outputs compress poorly on their own. Once trained on the
+        outputs already cached, the dictionary is saved in the cache and
+        used to compress the outputs cached from then on, which requires
+        ``compress`` to use a zstandard compressor, e.g. 'zstd'.
+
+        Parameters
+        ----------
+        dict_size: int, optional
+            The size in bytes of the dictionary.
+        max_item_size: int, optional
+            Only the cached outputs of at most max_item_size bytes on disk
+            are used to train the dictionary.
+        """
+        method = self.compress
+        if isinstance(method, tuple):
+            method = method[0]
+        if not isinstance(_COMPRESSORS.get(method), ZstdCompressorWrapper):
+            raise ValueError('Compression dictionaries are only used with '
+                             'zstandard compressors, compress={!r} given.'
+                             .format(self.compress))
+        if self.store_backend is not None:
+            self.store_backend.train_compression_dictionary(dict_size,
+                                                            max_item_size)
+
     def eval(self, func, *args, **kwargs):
         """ Eval function func with arguments `*args` and `**kwargs`,
             in the context of the memory.
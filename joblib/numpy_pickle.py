@@ -7,20 +7,37 @@
 import pickle
 import os
 import sys
+import struct
+import time
+import codecs
+import numbers
 import warnings
+import contextlib
 try:
     from pathlib import Path
 except ImportError:
     Path = None
+try:
+    from pickle import PickleBuffer
+except ImportError:
+    # Out-of-band buffers were introduced with pickle protocol 5 in
+    # python 3.8.
+    PickleBuffer = None
 
 from .compressor import lz4, LZ4_NOT_INSTALLED_ERROR
 from .compressor import _COMPRESSORS, register_compressor, BinaryZlibFile
 from .compressor import (ZlibCompressorWrapper, GzipCompressorWrapper,
                          BZ2CompressorWrapper, LZMACompressorWrapper,
-                         XZCompressorWrapper, LZ4CompressorWrapper)
+                         XZCompressorWrapper, LZ4CompressorWrapper,
+                         BlockCompressorWrapper, BlockCompressedFile,
+                         ZstdCompressorWrapper)
+from .compressor import _BLOCK_CODECS, _FILTER_BLOCK_SIZE
+from .compressor import (_select_filters, _encode_filters, _decode_filters,
+                         _filter_block_items)
 from .numpy_pickle_utils import Unpickler, Pickler
 from .numpy_pickle_utils import _read_fileobject, _write_fileobject
-from .numpy_pickle_utils import _read_bytes, BUFFER_SIZE
+from .numpy_pickle_utils import _detect_compressor
+from .numpy_pickle_utils import _read_bytes, _readinto_exactly, BUFFER_SIZE
 from .numpy_pickle_compat import load_compatibility
 from .numpy_pickle_compat import NDArrayWrapper
 # For compatibility with old versions of joblib, we need ZNDArrayWrapper
@@ -28,7 +45,7 @@ from .numpy_pickle_compat import NDArrayWrapper
 # Explicitly skipping next line from flake8 as it triggers an F401 warning
 # which we don't care.
 from .numpy_pickle_compat import ZNDArrayWrapper  # noqa
-from ._compat import _basestring, PY3_OR_LATER
+from ._compat import _basestring, _bytes_or_unicode, PY3_OR_LATER
 from .backports import make_memmap
 
 # Register supported compressors
@@ -38,10 +55,70 @@ register_compressor('bz2', BZ2CompressorWrapper())
 register_compressor('lzma', LZMACompressorWrapper())
 register_compressor('xz', XZCompressorWrapper())
 register_compressor('lz4', LZ4CompressorWrapper())
+register_compressor('zstd', ZstdCompressorWrapper())
+register_compressor('zstd-mt', ZstdCompressorWrapper(threads=-1))
+# Block compressed files, (de)compressed in parallel threads.
+register_compressor('zlib-mt', BlockCompressorWrapper('zlib'))
+register_compressor('lz4-mt', BlockCompressorWrapper('lz4'))
+register_compressor('lzma-mt', BlockCompressorWrapper('lzma'))
 
 ###############################################################################
 # Utility objects for persistence.
 
+# Size of the slices in which buffers are written to file objects.
+_WRITE_CHUNK_SIZE = 16 * 1024 ** 2
+
+# Minimal alignment of the arena of the packed arrays in uncompressed files,
+# at least the alignment of the numpy dtypes.
+_PACKED_ALIGNMENT = 16
+
+# The table of contents footer ends with this magic number followed by the
+# offset of the pickled table of contents, as a little-endian uint64.
+_TOC_MAGIC = b'JOBLIBTOC1'
+_TOC_OFFSET_FORMAT = '<Q'
+
+
+def _padding_size(file_handle, alignment):
+    """Return the number of bytes padding a buffer at the current offset."""
+    if not alignment:
+        return 0
+    return -file_handle.tell() % alignment
+
+
+def _write_buffer(data, file_handle):
+    """Write a memoryview of bytes to a file handle."""
+    if not PY3_OR_LATER:
+        # Python 2 file objects do not all accept memoryviews.
+        data = data.tobytes()
+    file_handle.write(data)
+
+
+# Object arrays of strings are written as a header holding the size in bytes
+# of the strings, UTF-8 encoded for text, and whether they are separated by
+# NUL characters, followed by the strings. Splitting the strings on the
+# separator is much faster than slicing them, but strings holding NUL
+# characters are concatenated instead, after their offsets in the
+# concatenation, as little-endian int64.
+_STRINGS_HEADER = struct.Struct('<Q?')
+# Lone surrogates can be encoded in python 3 strings.
+_UTF8_ERRORS = 'surrogatepass' if PY3_OR_LATER else 'strict'
+
+
+def _get_strings_type(array):
+    """Return 'bytes' or 'str' if all the items of an object array have
+    this exact type, None otherwise."""
+    if array.dtype.kind != 'O' or array.size == 0:
+        return None
+    types = set(map(type, array.ravel(order='K')))
+    if len(types) != 1:
+        return None
+    item_type = types.pop()
+    if item_type is _bytes_or_unicode[0]:
+        return 'bytes'
+    if item_type is _bytes_or_unicode[1]:
+        return 'str'
+    return None
+
 
 class NumpyArrayWrapper(object):
     """An object to be persisted instead of numpy arrays.
@@ -71,15 +148,52 @@ class NumpyArrayWrapper(object):
     allow_mmap: bool
         Determine if memory mapping is allowed on the wrapped array.
         Default: False.
+    alignment: int or None
+        If not None, the array bytes are preceded by zero padding so that
+        they start at a file offset multiple of alignment. Default: None.
+    compression: 2-tuple or None
+        If not None, the (codec, level) with which the array bytes are
+        written as an embedded block compressed stream. Default: None.
+    filters: tuple of str
+        The filters, among 'delta' and 'shuffle', applied in this order to
+        the array bytes before they are compressed. Default: ().
+    filter_block_size: int or None
+        The size in bytes of the blocks of the array that the filters are
+        applied to independently. Default: None.
+    strings: {'str', 'bytes'} or None
+        If not None, the wrapped array is an object array of this type of
+        strings, written as their offsets and their concatenation rather
+        than pickled. Default: None.
     """
 
-    def __init__(self, subclass, shape, order, dtype, allow_mmap=False):
+    # Wrappers pickled by older versions of joblib do not carry these
+    # attributes.
+    alignment = None
+    compression = None
+    filters = ()
+    filter_block_size = None
+    strings = None
+
+    def __init__(self, subclass, shape, order, dtype, allow_mmap=False,
+                 alignment=None, compression=None, filters=(), strings=None):
         """Constructor. Store the useful information for later."""
         self.subclass = subclass
         self.shape = shape
         self.order = order
         self.dtype = dtype
         self.allow_mmap = allow_mmap
+        self.alignment = alignment
+        self.compression = compression
+        self.filters = filters
+        if filters:
+            self.filter_block_size = _FILTER_BLOCK_SIZE
+        self.strings = strings
+
+    def _padding_size(self, file_handle):
+        """Return the number of bytes padding the array at this offset."""
+        if self.dtype.hasobject and self.strings is None:
+            return 0
+        return _padding_size(file_handle, self.alignment)
 
     def write_array(self, array, pickler):
         """Write array bytes to pickler file handle.
@@ -87,21 +201,185 @@ class NumpyArrayWrapper(object):
         This function is an adaptation of the numpy write_array function
         available in version 1.10.1 in numpy/lib/format.py.
         """
-        # Set buffer size to 16 MiB to hide the Python loop overhead.
-        buffersize = max(16 * 1024 ** 2 // array.itemsize, 1)
-        if array.dtype.hasobject:
+        padding_size = self._padding_size(pickler.file_handle)
+        if padding_size:
+            pickler.file_handle.write(b'\0' * padding_size)
+        if self.strings is not None:
+            self._write_strings(array, pickler.file_handle, pickler.np)
+        elif array.dtype.hasobject:
             # We contain Python objects so we cannot write out the data
             # directly. Instead, we will pickle it out with version 2 of the
             # pickle protocol.
             pickle.dump(array, pickler.file_handle, protocol=2)
+        elif self.compression is not None:
+            codec, level = self.compression
+            with BlockCompressedFile(pickler.file_handle, 'wb',
+                                     compresslevel=level, codec=codec,
+                                     block_index=False) as f:
+                self._write_data(array, f, pickler.np)
+        else:
+            self._write_data(array, pickler.file_handle, pickler.np)
+
+    def _write_data(self, array, file_handle, np):
+        """Write the bytes of an array without Python objects."""
+        if self.filters:
+            for block in self._iter_filter_blocks(array, np):
+                _write_buffer(memoryview(_encode_filters(block, self.filters)),
+                              file_handle)
+            return
+        # Set buffer size to 16 MiB to hide the Python loop overhead.
+        buffersize = max(16 * 1024 ** 2 // array.itemsize, 1)
+        if (array.flags.c_contiguous if self.order == 'C'
+                else array.flags.f_contiguous):
+            # The array buffer already holds the bytes in the expected order:
+            # write it in place through slices of a memoryview, without any
+            # copy. Slicing keeps each write of a reasonable size for
+            # compressed file objects.
+            data = array.view(np.ndarray).ravel(order='K')
+            data = memoryview(data.view(np.uint8))
+            for start in range(0, len(data), _WRITE_CHUNK_SIZE):
+                _write_buffer(data[start:start + _WRITE_CHUNK_SIZE],
+                              file_handle)
+        else:
+            # The array is not contiguous: nditer gathers its items into
+            # chunks that are written from a scratch buffer reused across
+            # the iterations.
+            scratch = np.empty(buffersize, dtype=array.dtype)
+            for chunk in np.nditer(array,
+                                   flags=['external_loop',
+                                          'buffered',
+                                          'zerosize_ok'],
+                                   buffersize=buffersize,
+                                   order=self.order):
+                if not chunk.flags.c_contiguous:
+                    scratch[:chunk.size] = chunk
+                    chunk = scratch[:chunk.size]
+                _write_buffer(memoryview(chunk.view(np.uint8)), file_handle)
+
+    def _write_strings(self, array, file_handle, np):
+        """Write an object array of strings as described by _STRINGS_HEADER.
+        """
+        items = array.ravel(order=self.order).tolist()
+        if self.strings == 'str':
+            separator, empty = u'\0', u''
+        else:
+            separator, empty = b'\0', b''
+        data = separator.join(items)
+        separated = data.count(separator) == len(items) - 1
+        if not separated:
+            data = empty.join(items)
+            offsets = np.zeros(len(items) + 1, dtype='<i8')
+            np.cumsum(np.fromiter(map(len, items), dtype=np.int64,
+                                  count=len(items)),
+                      out=offsets[1:])
+        del items
+        if self.strings == 'str':
+            data = data.encode('utf-8', _UTF8_ERRORS)
+
+        file_handle.write(_STRINGS_HEADER.pack(len(data), separated))
+        if not separated:
+            _write_buffer(memoryview(offsets.view(np.uint8)), file_handle)
+        data = memoryview(data)
+        for start in range(0, len(data), _WRITE_CHUNK_SIZE):
+            _write_buffer(data[start:start + _WRITE_CHUNK_SIZE], file_handle)
+
+    def _read_strings(self, unpickler, mmap=False):
+        """Read an object array of strings written by _write_strings.
+
+        With mmap, the strings and their offsets are memory mapped rather
+        than read in memory before the array items are built from them.
+        """
+        np = unpickler.np
+        file_handle = unpickler.file_handle
+        count = int(np.prod(self.shape, dtype=np.int64))
+        nbytes, separated = _STRINGS_HEADER.unpack(
+            _read_bytes(file_handle, _STRINGS_HEADER.size, "strings header"))
+        offsets = None
+        if mmap:
+            offset = file_handle.tell()
+            if not separated:
+                offsets = make_memmap(unpickler.filename, dtype='<i8',
+                                      shape=(count + 1,), mode='r',
+                                      offset=offset)
+                offset += offsets.nbytes
+            data = b''
+            if nbytes:
+                # Empty buffers cannot be memory mapped.
+                data = make_memmap(unpickler.filename, dtype=np.uint8,
+                                   shape=(nbytes,), mode='r', offset=offset)
+            file_handle.seek(offset + nbytes)
+        else:
+            if not separated:
+                offsets = np.empty(count + 1, dtype='<i8')
+                _readinto_exactly(file_handle, offsets.view(np.uint8),
+                                  "string offsets")
+            data = _read_bytes(file_handle, nbytes, "strings")
+
+        if self.strings == 'str':
+            data = codecs.utf_8_decode(data, _UTF8_ERRORS, True)[0]
+            separator = u'\0'
         else:
-            for chunk in pickler.np.nditer(array,
-                                           flags=['external_loop',
-                                                  'buffered',
-                                                  'zerosize_ok'],
-                                           buffersize=buffersize,
-                                           order=self.order):
-                pickler.file_handle.write(chunk.tostring('C'))
+            if not isinstance(data, bytes):
+                data = data.tobytes()
+            separator = b'\0'
+        if separated:
+            items = data.split(separator)
+        else:
+            # The offsets are counted in characters of the decoded strings.
+            bounds = offsets.tolist()
+            items = []
+            if bounds[0] == 0 and bounds[-1] == len(data):
+                items = list(map(data.__getitem__,
+                                 map(slice, bounds[:-1], bounds[1:])))
+            del bounds
+        del data
+        if len(items) != count:
+            raise ValueError("Corrupted object array of strings: expected "
+                             "{} strings in {} bytes.".format(count, nbytes))
+        array = np.empty(count, dtype=object)
+        array[:] = items
+        del items
+
+        if self.order == 'F':
+            array.shape = self.shape[::-1]
+            return array.transpose()
+        array.shape = self.shape
+        return array
+
+    def _iter_filter_blocks(self, array, np):
+        """Yield the items of an array as the blocks filtered independently.
+
+        The blocks are 1-d contiguous arrays, which may be reused from one
+        iteration to the next.
+        """
+        block_items = _filter_block_items(array.itemsize,
+                                          self.filter_block_size)
+        if (array.flags.c_contiguous if self.order == 'C'
+                else array.flags.f_contiguous):
+            data = array.view(np.ndarray).ravel(order='K')
+            for start in range(0, data.size, block_items):
+                yield data[start:start + block_items]
+            return
+        # Gather the items of the chunks produced by nditer into blocks of
+        # exactly block_items items.
+        scratch = np.empty(block_items, dtype=array.dtype)
+        filled = 0
+        for chunk in np.nditer(array,
+                               flags=['external_loop',
+                                      'buffered',
+                                      'zerosize_ok'],
+                               buffersize=block_items,
+                               order=self.order):
+            while chunk.size:
+                n_items = min(block_items - filled, chunk.size)
+                scratch[filled:filled + n_items] = chunk[:n_items]
+                chunk = chunk[n_items:]
+                filled += n_items
+                if filled == block_items:
+                    yield scratch
+                    filled = 0
+        if filled:
+            yield scratch[:filled]
 
     def read_array(self, unpickler):
         """Read array from unpickler file handle.
@@ -114,11 +392,24 @@ class NumpyArrayWrapper(object):
         else:
             count = unpickler.np.multiply.reduce(self.shape)
         # Now read the actual data.
-        if self.dtype.hasobject:
+        if self.strings is not None:
+            array = self._read_strings(unpickler)
+        elif self.dtype.hasobject:
             # The array contained Python objects. We need to unpickle the data.
             array = pickle.load(unpickler.file_handle)
         else:
-            if (not PY3_OR_LATER and
+            if self.compression is not None:
+                # The bytes are an embedded block compressed stream, which
+                # is read up to its end-of-stream marker.
+                array = unpickler.np.empty(count, dtype=self.dtype)
+                with BlockCompressedFile(unpickler.file_handle, 'rb',
+                                         block_index=False) as f:
+                    _readinto_exactly(f, array.view(unpickler.np.uint8),
+                                      "array data")
+                    if f.read(1):
+                        raise ValueError("Compressed array data is longer "
+                                         "than expected.")
+            elif (not PY3_OR_LATER and
                     unpickler.np.compat.isfileobj(unpickler.file_handle)):
                 # In python 2, gzip.GzipFile is considered as a file so one
                 # can use numpy.fromfile().
@@ -127,9 +418,16 @@ class NumpyArrayWrapper(object):
                 # method below.
                 array = unpickler.np.fromfile(unpickler.file_handle,
                                               dtype=self.dtype, count=count)
+            elif hasattr(unpickler.file_handle, 'readinto'):
+                # Read the bytes directly into the memory of the array, for
+                # raw files and decompressor streams alike.
+                array = unpickler.np.empty(count, dtype=self.dtype)
+                _readinto_exactly(unpickler.file_handle,
+                                  array.view(unpickler.np.uint8),
+                                  "array data")
             else:
-                # This is not a real file. We have to read it the
-                # memory-intensive way.
+                # This file object cannot read in place. We have to read it
+                # the memory-intensive way.
                 # crc32 module fails on reads greater than 2 ** 32 bytes,
                 # breaking large reads from gzip streams. Chunk reads to
                 # BUFFER_SIZE bytes to avoid issue and reduce memory overhead
@@ -149,6 +447,11 @@ class NumpyArrayWrapper(object):
                                                 count=read_count)
                     del data
 
+            if self.filters:
+                _decode_filters(array.view(unpickler.np.uint8),
+                                self.dtype.itemsize, self.filters,
+                                self.filter_block_size)
+
             if self.order == 'F':
                 array.shape = self.shape[::-1]
                 array = array.transpose()
@@ -159,6 +462,9 @@ class NumpyArrayWrapper(object):
 
     def read_mmap(self, unpickler):
         """Read an array using numpy memmap."""
+        if self.strings is not None:
+            # The strings are built from memory mapped buffers.
+            return self._read_strings(unpickler, mmap=True)
         offset = unpickler.file_handle.tell()
         if unpickler.mmap_mode == 'w+':
             unpickler.mmap_mode = 'r+'
@@ -188,8 +494,13 @@ class NumpyArrayWrapper(object):
         array: numpy.ndarray
 
         """
+        padding_size = self._padding_size(unpickler.file_handle)
+        if padding_size:
+            _read_bytes(unpickler.file_handle, padding_size, "array padding")
+
         # When requested, only use memmap mode if allowed.
-        if unpickler.mmap_mode is not None and self.allow_mmap:
+        if (unpickler.mmap_mode is not None and self.allow_mmap and
+                not self.filters):
             array = self.read_mmap(unpickler)
         else:
             array = self.read_array(unpickler)
@@ -205,6 +516,493 @@ class NumpyArrayWrapper(object):
         else:
             return array
 
+
+class PickleBufferWrapper(object):
+    """An object to be persisted instead of pickle protocol 5 buffers.
+
+    Objects implementing pickle protocol 5 hand their data to the pickler
+    as ``pickle.PickleBuffer`` objects. As for numpy arrays, this object is
+    pickled in place of the buffer and the raw buffer bytes are written
+    right after it in the file, so that they can be read back without
+    copies or memory mapped.
+
+    Attributes
+    ----------
+    nbytes: int
+        The size of the wrapped buffer in bytes.
+    readonly: bool
+        Whether the wrapped buffer is read-only. Read-only buffers are
+        loaded as read-only memoryviews, writable ones as bytearrays.
+    allow_mmap: bool
+        Determine if memory mapping is allowed on the wrapped buffer.
+        Default: False.
+    alignment: int or None
+        If not None, the buffer bytes are preceded by zero padding so that
+        they start at a file offset multiple of alignment. Default: None.
+    """
+
+    def __init__(self, nbytes, readonly, allow_mmap=False, alignment=None):
+        """Constructor. Store the useful information for later."""
+        self.nbytes = nbytes
+        self.readonly = readonly
+        self.allow_mmap = allow_mmap
+        self.alignment = alignment
+
+    def write_buffer(self, buffer, pickler):
+        """Write the raw bytes of buffer to pickler file handle."""
+        padding_size = _padding_size(pickler.file_handle, self.alignment)
+        if padding_size:
+            pickler.file_handle.write(b'\0' * padding_size)
+        with buffer.raw() as data:
+            for start in range(0, len(data), _WRITE_CHUNK_SIZE):
+                _write_buffer(data[start:start + _WRITE_CHUNK_SIZE],
+                              pickler.file_handle)
+
+    def read_buffer(self, unpickler):
+        """Read the buffer bytes from unpickler file handle."""
+        buffer = bytearray(self.nbytes)
+        if hasattr(unpickler.file_handle, 'readinto'):
+            _readinto_exactly(unpickler.file_handle, buffer, "buffer data")
+        else:
+            buffer[:] = _read_bytes(unpickler.file_handle, self.nbytes,
+                                    "buffer data")
+        if self.readonly:
+            return memoryview(buffer).toreadonly()
+        return buffer
+
+    def read_mmap(self, unpickler):
+        """Read the buffer using numpy memmap."""
+        offset = unpickler.file_handle.tell()
+        if unpickler.mmap_mode == 'w+':
+            unpickler.mmap_mode = 'r+'
+
+        marray = make_memmap(unpickler.filename,
+                             dtype=unpickler.np.uint8,
+                             shape=(self.nbytes,),
+                             mode=unpickler.mmap_mode,
+                             offset=offset)
+        # update the offset so that it corresponds to the end of the buffer
+        unpickler.file_handle.seek(offset + self.nbytes)
+
+        return marray
+
+    def read(self, unpickler):
+        """Read the buffer corresponding to this wrapper.
+
+        Parameters
+        ----------
+        unpickler: NumpyUnpickler
+
+        Returns
+        -------
+        buffer: bytearray, memoryview or numpy.memmap
+            A bytes-like object to be passed to the function rebuilding the
+            object owning the buffer.
+
+        """
+        padding_size = _padding_size(unpickler.file_handle, self.alignment)
+        if padding_size:
+            _read_bytes(unpickler.file_handle, padding_size, "buffer padding")
+
+        # Empty buffers cannot be memory mapped.
+        if (unpickler.mmap_mode is not None and self.allow_mmap and
+                unpickler.np is not None and self.nbytes > 0):
+            return self.read_mmap(unpickler)
+        return self.read_buffer(unpickler)
+
+
+class PackedArraysWrapper(PickleBufferWrapper):
+    """An object to be persisted instead of many small numpy arrays.
+
+    The small arrays of a dump are packed in one buffer, the arena, written
+    once at the start of the pickle stream right after this wrapper. The
+    pickle stream then refers to each array by its index in the arena, and
+    the arrays are rebuilt at once on load, as views of the arena, or of its
+    memory map.
+
+    Attributes
+    ----------
+    dtypes: list of numpy.dtype
+        The distinct dtypes of the packed arrays.
+    offsets: numpy.ndarray
+        The offsets of the packed arrays in the arena.
+    dtype_indices: numpy.ndarray
+        The indices of the dtypes of the packed arrays in dtypes.
+    ndims: numpy.ndarray
+        The numbers of dimensions of the packed arrays, whose shapes are
+        concatenated in dims.
+    dims: numpy.ndarray
+        The concatenated shapes of the packed arrays.
+    fortran: numpy.ndarray
+        Whether each packed array is in Fortran order.
+    """
+
+    def __init__(self, arrays, np, allow_mmap=False, alignment=None):
+        """Lay out the given arrays in the arena."""
+        dtype_indices = {}
+        self.dtypes = []
+        offsets = []
+        nbytes = 0
+        for array in arrays:
+            if array.dtype not in dtype_indices:
+                dtype_indices[array.dtype] = len(self.dtypes)
+                self.dtypes.append(array.dtype)
+            # Each array is aligned for its dtype in the arena.
+            nbytes += -nbytes % array.dtype.alignment
+            offsets.append(nbytes)
+            nbytes += array.nbytes
+        PickleBufferWrapper.__init__(self, nbytes, readonly=False,
+                                     allow_mmap=allow_mmap,
+                                     alignment=alignment)
+        self.offsets = np.array(offsets, dtype=np.int64)
+        self.dtype_indices = np.array([dtype_indices[array.dtype]
+                                       for array in arrays], dtype=np.int32)
+        self.ndims = np.array([array.ndim for array in arrays],
+                              dtype=np.int8)
+        self.dims = np.array([dim for array in arrays for dim in array.shape],
+                             dtype=np.int64)
+        self.fortran = np.array([array.flags.f_contiguous and
+                                 not array.flags.c_contiguous
+                                 for array in arrays], dtype=bool)
+
+    def write_arrays(self, arrays, pickler):
+        """Write the arena holding arrays to pickler file handle."""
+        arena = bytearray(self.nbytes)
+        np = pickler.np
+        for array, offset, fortran in zip(arrays, self.offsets.tolist(),
+                                          self.fortran.tolist()):
+            # Non contiguous arrays are copied in the arena.
+            view = np.ndarray(array.shape, dtype=array.dtype, buffer=arena,
+                              offset=offset, order='F' if fortran else 'C')
+            view[...] = array
+
+        padding_size = _padding_size(pickler.file_handle, self.alignment)
+        if padding_size:
+            pickler.file_handle.write(b'\0' * padding_size)
+        arena = memoryview(arena)
+        for start in range(0, len(arena), _WRITE_CHUNK_SIZE):
+            _write_buffer(arena[start:start + _WRITE_CHUNK_SIZE],
+                          pickler.file_handle)
+
+    def read(self, unpickler):
+        """Read the arena and return the list of the packed arrays."""
+        arena = PickleBufferWrapper.read(self, unpickler)
+        ndarray = unpickler.np.ndarray
+        dtypes = [self.dtypes[index] for index in self.dtype_indices.tolist()]
+        dims = self.dims.tolist()
+        arrays = []
+        start = 0
+        for offset, dtype, ndim, fortran in zip(self.offsets.tolist(), dtypes,
+                                                self.ndims.tolist(),
+                                                self.fortran.tolist()):
+            shape = tuple(dims[start:start + ndim])
+            start += ndim
+            arrays.append(ndarray(shape, dtype=dtype, buffer=arena,
+                                  offset=offset,
+                                  order='F' if fortran else 'C'))
+        return arrays
+
+
+# Parameters of the compression policy of dump(compress='auto'). Arrays
+# smaller than _AUTO_MIN_SIZE bytes are written raw: compressing them saves
+# little. Arrays larger than _AUTO_MAX_SIZE bytes are written raw and page
+# aligned, to be memory mapped. The others are compressed if samples of
+# _AUTO_SAMPLE_SIZE bytes compress by more than _AUTO_MAX_RATIO at more than
+# _AUTO_MIN_SPEED bytes per second.
+_AUTO_MIN_SIZE = 64 * 1024
+_AUTO_MAX_SIZE = 2 * 1024 ** 3
+_AUTO_SAMPLE_SIZE = 64 * 1024
+_AUTO_N_SAMPLES = 3
+_AUTO_MAX_RATIO = 0.9
+_AUTO_MIN_SPEED = 20 * 1024 ** 2
+_AUTO_ALIGNMENT = 4096
+
+
+def _get_auto_compression():
+    """Return the (codec, level) of dump(compress='auto')."""
+    if PY3_OR_LATER and lz4 is not None:
+        return 'lz4', 0
+    return 'zlib', 1
+
+
+def _should_compress(array, codec, level, filters=()):
+    """Whether array is worth compressing with codec, from a few samples.
+
+    The filters are applied to the samples before compressing them.
+    """
+    if array.nbytes > _AUTO_MAX_SIZE:
+        return False
+    compress = _BLOCK_CODECS[codec][2]
+    sample_items = max(_AUTO_SAMPLE_SIZE // array.itemsize, 1)
+    # Evenly spaced samples, taken through flat indexing for any layout.
+    starts = set(int(i * (array.size - sample_items) / (_AUTO_N_SAMPLES - 1))
+                 for i in range(_AUTO_N_SAMPLES))
+    raw_size = compressed_size = 0
+    t0 = time.time()
+    for start in sorted(starts):
+        sample = array.flat[max(start, 0):start + sample_items]
+        raw_size += sample.nbytes
+        if filters:
+            sample = _encode_filters(sample, filters)
+        compressed_size += len(compress(sample.tobytes(), level))
+    duration = time.time() - t0
+    if compressed_size > _AUTO_MAX_RATIO * raw_size:
+        return False
+    return duration == 0 or raw_size / duration >= _AUTO_MIN_SPEED
+
+
+def _get_array_paths(obj, np):
+    """Map the ids of the arrays found in obj to their paths in obj.
+
+    Only dicts, lists and tuples are traversed, in the order in which they
+    are pickled, so that the n-th path of an array corresponds to the n-th
+    time the array is written by the pickler. A path is a tuple of dict keys
+    and sequence indices.
+    """
+    paths = {}
+    seen = set()
+
+    def walk(obj, path):
+        if type(obj) in (np.ndarray, np.matrix, np.memmap):
+            paths.setdefault(id(obj), []).append(path)
+        elif type(obj) in (dict, list, tuple):
+            # Containers are memoized by the pickler and only written once.
+            if id(obj) in seen:
+                return
+            seen.add(id(obj))
+            items = obj.items() if type(obj) is dict else enumerate(obj)
+            for key, value in items:
+                walk(value, path + (key,))
+
+    walk(obj, ())
+    return paths
+
+
+def _get_packed_arrays(obj, np, pack_size):
+    """Return the numpy arrays of at most pack_size bytes found in obj.
+
+    As for the table of contents, only dicts, lists and tuples are
+    traversed. Each array is returned once, arrays with a subclass or
+    Python objects are left out.
+    """
+    arrays = {}
+    seen = set()
+
+    def walk(obj):
+        if type(obj) is np.ndarray:
+            if not obj.dtype.hasobject and obj.nbytes <= pack_size:
+                arrays.setdefault(id(obj), obj)
+        elif type(obj) in (dict, list, tuple):
+            if id(obj) in seen:
+                return
+            seen.add(id(obj))
+            for value in (obj.values() if type(obj) is dict else obj):
+                walk(value)
+
+    walk(obj)
+    return list(arrays.values())
+
+
+def _read_toc(fobj):
+    """Return the table of contents at the end of fobj, or None."""
+    footer_size = len(_TOC_MAGIC) + struct.calcsize(_TOC_OFFSET_FORMAT)
+    fobj.seek(0, os.SEEK_END)
+    if fobj.tell() < footer_size:
+        return None
+    fobj.seek(-footer_size, os.SEEK_END)
+    footer = fobj.read(footer_size)
+    if not footer.startswith(_TOC_MAGIC):
+        return None
+    toc_offset, = struct.unpack(_TOC_OFFSET_FORMAT,
+                                footer[len(_TOC_MAGIC):])
+    fobj.seek(toc_offset)
+    return pickle.load(fobj)
+
+
+class LazyPickle(object):
+    """A lazy view on a file dumped by joblib.dump with toc=True.
+
+    The numpy arrays listed in the table of contents of the file are read,
+    or memory mapped, individually when accessed, without unpickling the
+    rest of the file. Other members are obtained by loading the whole
+    object, once.
+
+    Items are accessed with the keys and indices of the dicts, lists and
+    tuples leading to the arrays. Accessing a container returns another
+    LazyPickle. The arrays of block compressed files are returned as
+    LazyArray objects, decompressed on access.
+
+    Attributes
+    ----------
+    filename: str
+        The file to read the arrays from.
+    mmap_mode: {None, 'r+', 'r', 'w+', 'c'}
+        If not None, the arrays are memory-mapped from the file.
+    path: tuple
+        The path of the viewed container in the persisted object.
+    compressed: bool
+        Whether the file is block compressed.
+    """
+
+    def __init__(self, filename, toc, mmap_mode=None, path=(),
+                 compressed=False, _root=None):
+        self.filename = filename
+        self.mmap_mode = mmap_mode
+        self.path = path
+        self.compressed = compressed
+        self._toc = toc
+        self._root = self if _root is None else _root
+        self._obj = None
+        self._loaded = False
+
+    def keys(self):
+        """Return the keys leading to arrays listed in the table of contents.
+        """
+        depth = len(self.path)
+        keys = []
+        for path, _, _ in self._toc:
+            if (len(path) > depth and path[:depth] == self.path and
+                    path[depth] not in keys):
+                keys.append(path[depth])
+        return keys
+
+    def __getitem__(self, key):
+        path = self.path + (key,)
+        for toc_path, offset, wrapper in self._toc:
+            if toc_path == path:
+                if self.compressed:
+                    return LazyArray(self, offset, wrapper)
+                return self._read(offset, wrapper)
+        if any(toc_path[:len(path)] == path for toc_path, _, _ in self._toc):
+            return LazyPickle(self.filename, self._toc,
+                              mmap_mode=self.mmap_mode, path=path,
+                              compressed=self.compressed, _root=self._root)
+        return self.load()[key]
+
+    @contextlib.contextmanager
+    def _open(self):
+        """Open the file, through its decompressor if it is compressed."""
+        with open(self.filename, 'rb') as f:
+            with _read_fileobject(f, self.filename) as fobj:
+                yield fobj
+
+    def _read(self, offset, wrapper):
+        """Read the array whose bytes start at offset."""
+        with self._open() as f:
+            f.seek(offset)
+            unpickler = NumpyUnpickler(self.filename, f,
+                                       mmap_mode=self.mmap_mode)
+            return wrapper.read(unpickler)
+
+    def load(self):
+        """Load the viewed object, unpickling the whole file once."""
+        root = self._root
+        if not root._loaded:
+            root._obj = load(self.filename, mmap_mode=self.mmap_mode)
+            root._loaded = True
+        obj = root._obj
+        for key in self.path:
+            obj = obj[key]
+        return obj
+
+    def __repr__(self):
+        return '{}(filename={!r}, path={!r})'.format(
+            self.__class__.__name__, self.filename, self.path)
+
+
+class LazyArray(object):
+    """A numpy array of a block compressed file, decompressed on access.
+
+    Indexing the first axis of a C ordered array with an integer or a slice
+    of step 1 only decompresses the blocks holding the requested rows. Any
+    other indexing, or the conversion with numpy.asarray, decompresses the
+    whole array.
+
+    Attributes
+    ----------
+    shape: tuple
+        The shape of the array.
+    dtype: numpy.dtype
+        The data type of the array.
+    """
+
+    def __init__(self, lazy_pickle, offset, wrapper):
+        self._lazy_pickle = lazy_pickle
+        self._offset = offset
+        self._wrapper = wrapper
+        self.shape = wrapper.shape
+        self.dtype = wrapper.dtype
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    def __len__(self):
+        if not self.shape:
+            raise TypeError('len() of unsized object')
+        return self.shape[0]
+
+    def read(self):
+        """Decompress and return the whole array."""
+        return self._lazy_pickle._read(self._offset, self._wrapper)
+
+    def __array__(self, dtype=None):
+        array = self.read()
+        return array if dtype is None else array.astype(dtype)
+
+    def __getitem__(self, key):
+        import numpy as np
+        first, rest = key, ()
+        if isinstance(key, tuple) and key:
+            first, rest = key[0], key[1:]
+        if (self._wrapper.order != 'C' or self.dtype.hasobject or
+                self._wrapper.subclass is not np.ndarray or not self.shape):
+            return self.read()[key]
+
+        n_rows = self.shape[0]
+        if (isinstance(first, numbers.Integral) and
+                not isinstance(first, (bool, np.bool_))):
+            start = first + n_rows if first < 0 else first
+            if not 0 <= start < n_rows:
+                raise IndexError('index {} is out of bounds for axis 0 with '
+                                 'size {}'.format(first, n_rows))
+            stop = start + 1
+        elif isinstance(first, slice) and first.step in (None, 1):
+            start, stop, _ = first.indices(n_rows)
+            stop = max(start, stop)
+        else:
+            return self.read()[key]
+
+        itemsize = self.dtype.itemsize
+        row_size = int(np.prod(self.shape[1:], dtype=np.int64)) * itemsize
+        start_byte, stop_byte = start * row_size, stop * row_size
+        filters = self._wrapper.filters
+        if filters:
+            # Filtered blocks can only be decoded whole: read all the blocks
+            # holding the requested rows.
+            block_size = self._wrapper.filter_block_size
+            step = _filter_block_items(itemsize, block_size) * itemsize
+            read_start = start_byte - start_byte % step
+            read_stop = min(-(-stop_byte // step) * step, n_rows * row_size)
+        else:
+            read_start, read_stop = start_byte, stop_byte
+        data = np.empty(read_stop - read_start, dtype=np.uint8)
+        with self._lazy_pickle._open() as f:
+            f.seek(self._offset + read_start)
+            _readinto_exactly(f, data, "array data")
+        if filters:
+            _decode_filters(data, itemsize, filters, block_size)
+        data = data[start_byte - read_start:stop_byte - read_start]
+        rows = data.view(self.dtype).reshape((stop - start,) + self.shape[1:])
+        if isinstance(first, slice):
+            return rows[(slice(None),) + rest] if rest else rows
+        return rows[0][rest] if rest else rows[0]
+
+    def __repr__(self):
+        return '{}(shape={}, dtype={})'.format(
+            self.__class__.__name__, self.shape, self.dtype)
+
+
 ###############################################################################
 # Pickler classes
 
@@ -223,13 +1021,43 @@ class NumpyPickler(Pickler):
     protocol: int, optional
         Pickle protocol used. Default is pickle.DEFAULT_PROTOCOL under
         python 3, pickle.HIGHEST_PROTOCOL otherwise.
+    align: int, optional
+        If not None, the bytes of each numpy array are padded to start at a
+        file offset multiple of align. The file object must support tell.
+    toc: bool, optional
+        If True, a table of contents recording the offset of the numpy
+        arrays reachable through dicts, lists and tuples is appended after
+        the pickle stream. The file object must support tell.
+    auto_compress: 2-tuple, optional
+        If not None, the (codec, level) used to compress the numpy arrays
+        that the compression policy of dump(compress='auto') selects. The
+        other large arrays are written raw and page aligned.
+    filters: bool, optional
+        If True, the bytes of numeric arrays are byte shuffled, and delta
+        coded for sorted integers, to make them more compressible. Used when
+        the file object compresses its content.
+    pack_size: int, optional
+        If not None, the numpy arrays of at most pack_size bytes reachable
+        through dicts, lists and tuples are packed in one buffer written at
+        the start of the pickle stream, and pickled as references to it.
     """
 
     dispatch = Pickler.dispatch.copy()
 
-    def __init__(self, fp, protocol=None):
+    def __init__(self, fp, protocol=None, align=None, toc=False,
+                 auto_compress=None, filters=False, pack_size=None):
         self.file_handle = fp
         self.buffered = isinstance(self.file_handle, BinaryZlibFile)
+        self.align = align
+        self.auto_compress = auto_compress
+        self.filters = filters
+        # List of (path, offset, wrapper) entries of the table of contents.
+        self.toc = [] if toc else None
+        self._toc_paths = {}
+        self.pack_size = pack_size
+        # The arrays to pack, until they are written, and their indices.
+        self._packed_arrays = None
+        self._packed_indices = {}
 
         # By default we want a pickle protocol that only changes with
         # the major python version and not the minor one
@@ -249,10 +1077,33 @@ class NumpyPickler(Pickler):
         """Create and returns a numpy array wrapper from a numpy array."""
         order = 'F' if (array.flags.f_contiguous and
                         not array.flags.c_contiguous) else 'C'
-        allow_mmap = not self.buffered and not array.dtype.hasobject
+        strings = _get_strings_type(array)
+        allow_mmap = not self.buffered and (not array.dtype.hasobject or
+                                            strings is not None)
+        alignment = self.align
+        compression = None
+        filters = ()
+        if (self.auto_compress is not None and not array.dtype.hasobject and
+                array.nbytes >= _AUTO_MIN_SIZE):
+            filters = _select_filters(array)
+            if _should_compress(array, *self.auto_compress, filters=filters):
+                compression = self.auto_compress
+                allow_mmap = False
+            else:
+                filters = ()
+                if alignment is None:
+                    # Keep the raw array memory mappable with aligned pages.
+                    alignment = _AUTO_ALIGNMENT
+        elif self.filters and not array.dtype.hasobject:
+            filters = _select_filters(array)
+            allow_mmap = allow_mmap and not filters
         wrapper = NumpyArrayWrapper(type(array),
                                     array.shape, order, array.dtype,
-                                    allow_mmap=allow_mmap)
+                                    allow_mmap=allow_mmap,
+                                    alignment=alignment,
+                                    compression=compression,
+                                    filters=filters,
+                                    strings=strings)
 
         return wrapper
 
@@ -266,31 +1117,132 @@ class NumpyPickler(Pickler):
         after in the file. Warning: the file produced does not follow the
         pickle format. As such it can not be read with `pickle.load`.
         """
+        if self._packed_arrays is not None:
+            self._save_packed_arrays()
+
         if self.np is not None and type(obj) in (self.np.ndarray,
                                                  self.np.matrix,
                                                  self.np.memmap):
+            index = self._packed_indices.get(id(obj))
+            if index is not None:
+                # The array is referred to by its index in the arena.
+                Pickler.save(self, index)
+                self.write(pickle.BINPERSID)
+                return
+
             if type(obj) is self.np.memmap:
                 # Pickling doesn't work with memmapped arrays
                 obj = self.np.asanyarray(obj)
 
             # The array wrapper is pickled instead of the real array.
             wrapper = self._create_array_wrapper(obj)
-            Pickler.save(self, wrapper)
-
-            # A framer was introduced with pickle protocol 4 and we want to
-            # ensure the wrapper object is written before the numpy array
-            # buffer in the pickle file.
-            # See https://www.python.org/dev/peps/pep-3154/#framing to get
-            # more information on the framer behavior.
-            if self.proto >= 4:
-                self.framer.commit_frame(force=True)
+            self._save_wrapper(wrapper)
+            if self._toc_paths.get(id(obj)) and (
+                    not obj.dtype.hasobject or wrapper.strings is not None):
+                self._add_toc_entry(obj, wrapper)
 
             # And then array bytes are written right after the wrapper.
             wrapper.write_array(obj, self)
             return
 
+        if (PickleBuffer is not None and self.proto >= 5 and
+                type(obj) in (PickleBuffer, bytearray)):
+            if type(obj) is bytearray:
+                if id(obj) in self.memo:
+                    # Let the pickler refer to the already saved bytearray.
+                    return Pickler.save(self, obj)
+                # Bytearrays are pickled in-band by default: write them
+                # out-of-band as well, but never load them as memmaps.
+                buffer = PickleBuffer(obj)
+                allow_mmap = False
+            else:
+                buffer = obj
+                allow_mmap = not self.buffered
+            # raw raises a BufferError for non contiguous buffers, as
+            # pickle does.
+            with buffer.raw() as data:
+                wrapper = PickleBufferWrapper(data.nbytes, data.readonly,
+                                              allow_mmap=allow_mmap,
+                                              alignment=self.align)
+            self._save_wrapper(wrapper)
+            wrapper.write_buffer(buffer, self)
+            if type(obj) is bytearray:
+                self.memoize(obj)
+            return
+
         return Pickler.save(self, obj)
 
+    def dump(self, obj):
+        """Pickle obj, followed by the table of contents if requested."""
+        if self.toc is not None and self.np is not None:
+            self._toc_paths = _get_array_paths(obj, self.np)
+        if (self.pack_size is not None and self.np is not None and
+                self.proto >= 1):
+            self._packed_arrays = _get_packed_arrays(obj, self.np,
+                                                     self.pack_size)
+            self._packed_indices = dict(
+                (id(array), index)
+                for index, array in enumerate(self._packed_arrays))
+        try:
+            Pickler.dump(self, obj)
+        finally:
+            self._packed_arrays = None
+            self._packed_indices = {}
+        if self.toc is not None:
+            self._write_toc()
+
+    def _save_packed_arrays(self):
+        """Write the arena of the packed arrays before the dumped object."""
+        arrays = self._packed_arrays
+        self._packed_arrays = None
+        if not arrays:
+            return
+        alignment = None
+        if not self.buffered:
+            # Keep the arrays aligned in the memory map of the arena.
+            alignment = self.align or _PACKED_ALIGNMENT
+        wrapper = PackedArraysWrapper(arrays, self.np,
+                                      allow_mmap=not self.buffered,
+                                      alignment=alignment)
+        self._save_wrapper(wrapper)
+        wrapper.write_arrays(arrays, self)
+        # The list of arrays the wrapper is read as is discarded.
+        self.write(pickle.POP)
+
+    def _add_toc_entry(self, array, wrapper):
+        """Record the path and offset of the array bytes about to be written.
+        """
+        path = self._toc_paths[id(array)].pop(0)
+        offset = (self.file_handle.tell() +
+                  wrapper._padding_size(self.file_handle))
+        # The recorded wrapper reads the bytes from their actual offset.
+        toc_wrapper = NumpyArrayWrapper(wrapper.subclass, wrapper.shape,
+                                        wrapper.order, wrapper.dtype,
+                                        allow_mmap=wrapper.allow_mmap,
+                                        compression=wrapper.compression,
+                                        filters=wrapper.filters,
+                                        strings=wrapper.strings)
+        self.toc.append((path, offset, toc_wrapper))
+
+    def _write_toc(self):
+        """Append the table of contents footer after the pickle stream."""
+        toc_offset = self.file_handle.tell()
+        pickle.dump(self.toc, self.file_handle, protocol=self.proto)
+        self.file_handle.write(_TOC_MAGIC +
+                               struct.pack(_TOC_OFFSET_FORMAT, toc_offset))
+
+    def _save_wrapper(self, wrapper):
+        """Pickle a wrapper, ready for the raw bytes to be written next."""
+        Pickler.save(self, wrapper)
+
+        # A framer was introduced with pickle protocol 4 and we want to
+        # ensure the wrapper object is written before the raw buffer in the
+        # pickle file.
+        # See https://www.python.org/dev/peps/pep-3154/#framing to get
+        # more information on the framer behavior.
+        if self.proto >= 4:
+            self.framer.commit_frame(force=True)
+
 
 class NumpyUnpickler(Unpickler):
     """A subclass of the Unpickler to unpickle our numpy pickles.
@@ -321,6 +1273,8 @@ class NumpyUnpickler(Unpickler):
         # filename is required for numpy mmap mode.
         self.filename = filename
         self.compat_mode = False
+        # The arrays read from the arena of a dump with packed arrays.
+        self._packed_arrays = None
         Unpickler.__init__(self, self.file_handle)
         try:
             import numpy as np
@@ -338,8 +1292,19 @@ class NumpyUnpickler(Unpickler):
         """
         Unpickler.load_build(self)
 
+        if isinstance(self.stack[-1], PackedArraysWrapper):
+            if self.np is None:
+                raise ImportError("Trying to unpickle an ndarray, "
+                                  "but numpy didn't import correctly")
+            self._packed_arrays = self.stack.pop().read(self)
+            self.stack.append(self._packed_arrays)
+
+        elif isinstance(self.stack[-1], PickleBufferWrapper):
+            buffer_wrapper = self.stack.pop()
+            self.stack.append(buffer_wrapper.read(self))
+
         # For backward compatibility, we support NDArrayWrapper objects.
-        if isinstance(self.stack[-1], (NDArrayWrapper, NumpyArrayWrapper)):
+        elif isinstance(self.stack[-1], (NDArrayWrapper, NumpyArrayWrapper)):
             if self.np is None:
                 raise ImportError("Trying to unpickle an ndarray, "
                                   "but numpy didn't import correctly")
@@ -351,6 +1316,13 @@ class NumpyUnpickler(Unpickler):
                 self.compat_mode = True
             self.stack.append(array_wrapper.read(self))
 
+    def persistent_load(self, pid):
+        """Return the packed array referred to by its index in the arena."""
+        if self._packed_arrays is None:
+            raise pickle.UnpicklingError(
+                "Packed array {!r} found before its arena.".format(pid))
+        return self._packed_arrays[pid]
+
     # Be careful to register our new method.
     if PY3_OR_LATER:
         dispatch[pickle.BUILD[0]] = load_build
@@ -361,7 +1333,8 @@ class NumpyUnpickler(Unpickler):
 ###############################################################################
 # Utility functions
 
-def dump(value, filename, compress=0, protocol=None, cache_size=None):
+def dump(value, filename, compress=0, protocol=None, cache_size=None,
+         align=None, toc=False, pack_size=None, filters=False):
     """Persist an arbitrary Python object into one file.
 
     Read more in the :ref:`User Guide <persistence>`.
@@ -375,7 +1348,7 @@ def dump(value, filename, compress=0, protocol=None, cache_size=None):
         The compression method corresponding to one of the supported filename
         extensions ('.z', '.gz', '.bz2', '.xz' or '.lzma') will be used
         automatically.
-    compress: int from 0 to 9 or bool or 2-tuple, optional
+    compress: int from 0 to 9 or bool or 2-tuple or 'auto', optional
         Optional compression level for the data. 0 or False is no compression.
         Higher value means more compression, but also slower read and
         write times. Using a value of 3 is often a good compromise.
@@ -384,11 +1357,45 @@ def dump(value, filename, compress=0, protocol=None, cache_size=None):
         If compress is a 2-tuple, the first element must correspond to a string
         between supported compressors (e.g 'zlib', 'gzip', 'bz2', 'lzma'
         'xz'), the second element must be an integer from 0 to 9, corresponding
-        to the compression level.
+        to the compression level. The 'zlib-mt', 'lz4-mt' and 'lzma-mt'
+        compressors (de)compress independent blocks in parallel threads.
+        The 'zstd' and 'zstd-mt' compressors, available when the zstandard
+        package is installed, compress in one or as many threads as CPUs.
+        If compress is 'auto', the file itself is not compressed: a few
+        samples of each large numpy array decide whether it is compressed,
+        with lz4 if installed or zlib otherwise, or written raw and page
+        aligned so that it can still be memory mapped on load.
     protocol: int, optional
         Pickle protocol, see pickle.dump documentation for more details.
     cache_size: positive int, optional
         This option is deprecated in 0.10 and has no effect.
+    align: positive int, optional
+        If not None, the bytes of each numpy array are padded to start at an
+        offset of the file that is a multiple of align, e.g. 64 for SIMD
+        friendly memory maps or 4096 for page aligned ones. The padding is
+        skipped transparently by :func:`joblib.load`. This option has no
+        effect on compressed files, which cannot be memory mapped.
+    toc: bool, optional
+        If True, append a table of contents recording the offset, dtype,
+        shape and order of the numpy arrays reachable through dicts, lists
+        and tuples, with their path in value. Such arrays can then be read
+        individually with ``joblib.load(filename, lazy=True)``. The file
+        remains loadable as usual. Only files given by their filename, and
+        among compressed files only block compressed ones, e.g. with
+        'zlib-mt', support it.
+    pack_size: positive int, optional
+        If not None, the numpy arrays of at most pack_size bytes reachable
+        through dicts, lists and tuples are packed in one buffer written
+        once, rather than one by one, which makes dumping and loading many
+        small arrays much faster. :func:`joblib.load` returns them as views
+        of this buffer, or of its memory map. Such arrays are not listed in
+        the table of contents.
+    filters: bool, optional
+        If True, the bytes of the numeric numpy arrays are byte shuffled, and
+        the ones of sorted integer arrays delta coded, before being
+        compressed, which usually makes them several times more
+        compressible. Only compressed files support it, and joblib versions
+        older than 0.14 cannot load them.
 
     Returns
     -------
@@ -415,6 +1422,12 @@ def dump(value, filename, compress=0, protocol=None, cache_size=None):
     is_filename = isinstance(filename, _basestring)
     is_fileobj = hasattr(filename, "write")
 
+    auto_compress = None
+    if isinstance(compress, _basestring) and compress == 'auto':
+        # Arrays are compressed individually in an uncompressed file.
+        auto_compress = _get_auto_compression()
+        compress = 0
+
     compress_method = 'zlib'  # zlib is the default compression method.
     if compress is True:
         # By default, if compress is enabled, we want the default compress
@@ -463,7 +1476,8 @@ def dump(value, filename, compress=0, protocol=None, cache_size=None):
             % (filename, type(filename))
         )
 
-    if is_filename and not isinstance(compress, tuple):
+    if (is_filename and not isinstance(compress, tuple) and
+            auto_compress is None):
         # In case no explicit compression was requested using both compression
         # method and level in a tuple and the filename has an explicit
         # extension, we select the corresponding compressor.
@@ -471,7 +1485,8 @@ def dump(value, filename, compress=0, protocol=None, cache_size=None):
         # unset the variable to be sure no compression level is set afterwards.
         compress_method = None
         for name, compressor in _COMPRESSORS.items():
-            if filename.endswith(compressor.extension):
+            if (compressor.extension and
+                    filename.endswith(compressor.extension)):
                 compress_method = name
 
         if compress_method in _COMPRESSORS and compress_level == 0:
@@ -486,6 +1501,33 @@ def dump(value, filename, compress=0, protocol=None, cache_size=None):
                                                  sys.version_info[0],
                                                  sys.version_info[1]))
 
+    if align is not None and (not isinstance(align, int) or align <= 0):
+        raise ValueError(
+            'Non valid align value given: "{}". It should be a positive '
+            'integer.'.format(align))
+
+    if pack_size is not None and (not isinstance(pack_size, int) or
+                                  pack_size <= 0):
+        raise ValueError(
+            'Non valid pack_size value given: "{}". It should be a positive '
+            'integer.'.format(pack_size))
+
+    if toc and not is_filename:
+        # The table of contents is only read by lazy loading, which
+        # requires a filename, and would be left unread in a file object.
+        raise ValueError('A table of contents can only be appended to a '
+                         'file given by its filename, {!r} was given.'
+                         .format(filename))
+
+    if toc and compress_level != 0 and not isinstance(
+            _COMPRESSORS.get(compress_method), BlockCompressorWrapper):
+        raise ValueError('A table of contents can only be appended to '
+                         'uncompressed or block compressed files.')
+
+    if filters and compress_level == 0:
+        raise ValueError('Filters can only be applied to the arrays of '
+                         'compressed files.')
+
     if cache_size is not None:
         # Cache size is deprecated starting from version 0.10
         warnings.warn("Please do not set 'cache_size' in joblib.dump, "
@@ -496,12 +1538,17 @@ def dump(value, filename, compress=0, protocol=None, cache_size=None):
     if compress_level != 0:
         with _write_fileobject(filename, compress=(compress_method,
                                                    compress_level)) as f:
-            NumpyPickler(f, protocol=protocol).dump(value)
+            NumpyPickler(f, protocol=protocol, toc=toc, filters=filters,
+                         pack_size=pack_size).dump(value)
     elif is_filename:
         with open(filename, 'wb') as f:
-            NumpyPickler(f, protocol=protocol).dump(value)
+            NumpyPickler(f, protocol=protocol, align=align, toc=toc,
+                         auto_compress=auto_compress,
+                         pack_size=pack_size).dump(value)
     else:
-        NumpyPickler(filename, protocol=protocol).dump(value)
+        NumpyPickler(filename, protocol=protocol, align=align, toc=toc,
+                     auto_compress=auto_compress,
+                     pack_size=pack_size).dump(value)
 
     # If the target container is a file object, nothing is returned.
     if is_fileobj:
@@ -545,7 +1592,7 @@ def _unpickle(fobj, filename="", mmap_mode=None):
     return obj
 
 
-def load(filename, mmap_mode=None):
+def load(filename, mmap_mode=None, lazy=False):
     """Reconstruct a Python object from a file persisted with joblib.dump.
 
     Read more in the :ref:`User Guide <persistence>`.
@@ -563,6 +1610,10 @@ def load(filename, mmap_mode=None):
         mode has no effect for compressed files. Note that in this
         case the reconstructed object might no longer match exactly
         the originally pickled object.
+    lazy: bool, optional
+        If True, return a :class:`LazyPickle` reading the numpy arrays
+        listed in the table of contents of the file individually, on
+        access. The file must have been dumped with ``toc=True``.
 
     Returns
     -------
@@ -585,6 +1636,29 @@ def load(filename, mmap_mode=None):
     if Path is not None and isinstance(filename, Path):
         filename = str(filename)
 
+    if lazy:
+        if not isinstance(filename, _basestring):
+            raise ValueError('Lazy loading requires a filename, {!r} was '
+                             'given.'.format(filename))
+        toc = None
+        with open(filename, 'rb') as f:
+            compressed = _detect_compressor(f) != 'not-compressed'
+            with _read_fileobject(f, filename, mmap_mode) as fobj:
+                # Only block compressed files with a block index support
+                # the random access required by the table of contents.
+                if (not isinstance(fobj, _basestring) and
+                        getattr(fobj, 'seekable', lambda: True)()):
+                    toc = _read_toc(fobj)
+        if toc is None:
+            raise ValueError("The file '{}' has no table of contents. Dump "
+                             "it with toc=True to load it lazily."
+                             .format(filename))
+        if compressed:
+            # Compressed arrays cannot be memory mapped.
+            mmap_mode = None
+        return LazyPickle(filename, toc, mmap_mode=mmap_mode,
+                          compressed=compressed)
+
     if hasattr(filename, "read"):
         fobj = filename
         filename = getattr(fobj, 'name', '')
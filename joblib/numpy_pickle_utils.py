@@ -202,6 +202,11 @@ def _write_fileobject(filename, compress=("zlib", 3)):
 # we use the ones from numpy 1.10.2.
 BUFFER_SIZE = 2 ** 18  # size of buffer for reading npz files in bytes
 
+# Size of the reads performed directly into the memory of loaded arrays.
+# It is kept well below 2 ** 32 bytes as crc32 fails on larger reads of gzip
+# streams.
+_READINTO_CHUNK_SIZE = 16 * 1024 ** 2
+
 
 def _read_bytes(fp, size, error_template="ran out of data"):
     """Read from file-like object until size bytes are read.
@@ -243,3 +248,41 @@ def _read_bytes(fp, size, error_template="ran out of data"):
         raise ValueError(msg % (error_template, size, len(data)))
     else:
         return data
+
+
+def _readinto_exactly(fp, buf, error_template="ran out of data"):
+    """Fill buf with bytes read from a file-like object.
+
+    The bytes are read in place in the memory of buf, in chunks of
+    _READINTO_CHUNK_SIZE bytes, so that no intermediate bytes object is
+    allocated.
+
+    Raises ValueError if EOF is encountered before buf is filled.
+
+    Parameters
+    ----------
+    fp: file-like object
+        A file object implementing readinto.
+    buf: writable bytes-like object
+        The buffer to fill, e.g. a uint8 view of a contiguous numpy array.
+    error_template: str
+
+    """
+    view = memoryview(buf)
+    size = len(view)
+    n_read = 0
+    while n_read < size:
+        try:
+            n_bytes = fp.readinto(
+                view[n_read:n_read + _READINTO_CHUNK_SIZE])
+        except io.BlockingIOError:
+            continue
+        if n_bytes is None:
+            # Non-blocking raw files return None when no data is available.
+            continue
+        if n_bytes == 0:
+            break
+        n_read += n_bytes
+    if n_read != size:
+        msg = "EOF: reading %s, expected %d bytes got %d"
+        raise ValueError(msg % (error_template, size, n_read))
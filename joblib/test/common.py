@@ -17,6 +17,21 @@ try:
 except ImportError:
     lz4 = None
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+try:
+    import scipy.sparse as sp
+except ImportError:
+    sp = None
+
 # A decorator to run tests only when numpy is available
 try:
     import numpy as np
@@ -112,5 +127,14 @@ with_dev_shm = skipif(
 with_lz4 = skipif(
     lz4 is None or not PY3_OR_LATER, reason='Needs lz4 compression to run')
 
+with_pandas = skipif(pd is None, reason='Needs pandas to run')
+
+with_scipy = skipif(sp is None, reason='Needs scipy to run')
+
 without_lz4 = skipif(
     lz4 is not None, reason='Needs lz4 not being installed to run')
+
+with_zstd = skipif(zstandard is None, reason='Needs zstandard to run')
+
+without_zstd = skipif(
+    zstandard is not None, reason='Needs zstandard not being installed to run')
@@ -11,17 +11,19 @@ import hashlib
 import sys
 import gc
 import io
+import os
 import collections
 import itertools
 import pickle
 import random
 from decimal import Decimal
 
-from joblib.hashing import hash
+from joblib import hashing
+from joblib.hashing import hash, register_hasher
 from joblib.func_inspect import filter_args
 from joblib.memory import Memory
-from joblib.testing import raises, skipif, fixture, parametrize
-from joblib.test.common import np, with_numpy
+from joblib.testing import raises, skipif, fixture, parametrize, SkipTest
+from joblib.test.common import np, with_numpy, pd, with_pandas
 from joblib.my_exceptions import TransportableException
 from joblib._compat import PY3_OR_LATER
 
@@ -454,3 +456,418 @@ def test_hashing_pickling_error():
     with raises(pickle.PicklingError) as excinfo:
         hash(non_picklable)
     excinfo.match('PicklingError while hashing')
+
+
+class _Dataset(object):
+    """A container whose content can be identified by a small token."""
+
+    def __init__(self, path, data):
+        self.path = path
+        self.data = data
+
+
+class _TokenDataset(_Dataset):
+
+    def __joblib_hash__(self):
+        return self.path
+
+
+def test_hash_joblib_hash_protocol():
+    a = _TokenDataset('a.csv', list(range(10)))
+    # The content is not hashed, only the token
+    assert hash(a) == hash(_TokenDataset('a.csv', None))
+    assert hash(a) != hash(_TokenDataset('b.csv', list(range(10))))
+    # The class is hashed along the token
+    assert hash(a) != hash('a.csv')
+    assert hash([a, 1]) == hash([_TokenDataset('a.csv', 'b'), 1])
+
+
+def test_register_hasher(monkeypatch):
+    monkeypatch.setattr(hashing, '_HASHERS', {})
+
+    a = _Dataset('a.csv', list(range(10)))
+    b = _Dataset('a.csv', None)
+    assert hash(a) != hash(b)
+
+    register_hasher(_Dataset, lambda dataset: dataset.path)
+    assert hash(a) == hash(b)
+    # The registered hasher takes precedence over __joblib_hash__ and
+    # applies to subclasses
+    assert (hash(_TokenDataset('a.csv', None)) !=
+            hash(_TokenDataset('b.csv', None)))
+
+    # Returning None falls back to the regular hashing
+    register_hasher(_Dataset, lambda dataset: None, force=True)
+    assert hash(a) != hash(b)
+
+    with raises(ValueError, match='already registered'):
+        register_hasher(_Dataset, lambda dataset: None)
+    with raises(ValueError, match='class'):
+        register_hasher('_Dataset', lambda dataset: None)
+    with raises(ValueError, match='callable'):
+        register_hasher(_TokenDataset, None)
+
+
+@with_numpy
+def test_hash_numpy_array_with_token(monkeypatch):
+    monkeypatch.setattr(hashing, '_HASHERS', {})
+    register_hasher(np.recarray, lambda array: array.shape)
+    a = np.arange(10).view(np.recarray)
+    b = np.zeros(10).view(np.recarray)
+    assert hash(a) == hash(b)
+    assert hash(np.arange(10)) != hash(np.zeros(10))
+
+
+@with_numpy
+def test_hash_cache_digests(monkeypatch):
+    monkeypatch.setattr(hashing, '_DIGEST_CACHE', hashing._DigestCache())
+    cache = hashing._DIGEST_CACHE
+    a = np.random.RandomState(0).random_sample((100, 10))
+    expected = hash(a, cache_digests=True)
+    # The content of the array is taken into account, not its identity
+    assert hash(a.copy(), cache_digests=True) == expected
+    assert hash(a[::2], cache_digests=True) != expected
+
+    # Writeable arrays are hashed at each call
+    assert not cache._data
+    a[0, 0] += 1
+    assert hash(a, cache_digests=True) != expected
+    a[0, 0] -= 1
+    assert hash(a, cache_digests=True) == expected
+
+    view = hashing.freeze(a[::2])
+    assert not a.flags.writeable
+    view_hash = hash(view, cache_digests=True)
+    assert hash(a, cache_digests=True) == expected
+    assert len(cache._data) == 1
+    # The digests of views of the frozen buffer are read from the cache
+    monkeypatch.setattr(hashing.NumpyHasher, '_update_with_buffer', None)
+    assert hash(a[::2], cache_digests=True) == view_hash
+    assert hash(a, cache_digests=True) == expected
+
+    del a, view
+    gc.collect()
+    assert not cache._data
+
+
+@with_numpy
+def test_hash_cache_digests_writeable_base(monkeypatch):
+    monkeypatch.setattr(hashing, '_DIGEST_CACHE', hashing._DigestCache())
+    a = np.arange(10)
+    view = a[2:]
+    view.flags.writeable = False
+    # The base array can still be modified, so the digest is not cached
+    hash_view = hash(view, cache_digests=True)
+    assert not hashing._DIGEST_CACHE._data
+    a[3] = -1
+    assert hash(view, cache_digests=True) != hash_view
+
+
+@with_numpy
+@parametrize('persistent', [False, True])
+def test_hash_mmap_digests(tmpdir, monkeypatch, persistent):
+    monkeypatch.setattr(hashing, '_MMAP_DIGEST_TABLES',
+                        {True: hashing._MmapDigestTable()})
+    mmap_digests = tmpdir.join('digests').strpath if persistent else True
+    filename = tmpdir.join('data.mmap').strpath
+    a = np.random.RandomState(0).random_sample((50, 10))
+    a.tofile(filename)
+    m = np.memmap(filename, dtype=a.dtype, shape=a.shape, mode='r')
+
+    expected = hash(a, cache_digests=True)
+    assert hash(m, mmap_digests=mmap_digests, coerce_mmap=True) == expected
+    view_hash = hash(m[10:20], mmap_digests=mmap_digests)
+    assert view_hash == hash(np.memmap(filename, dtype=a.dtype, mode='r',
+                                       shape=(10, 10), offset=800),
+                             mmap_digests=mmap_digests)
+    assert view_hash == hash(a[10:20].view(np.memmap), cache_digests=True)
+
+    # The content of the file is not read anymore
+    monkeypatch.setattr(hashing.NumpyHasher, '_update_with_buffer', None)
+    reloaded = np.memmap(filename, dtype=a.dtype, shape=a.shape, mode='r')
+    assert (hash(reloaded, mmap_digests=mmap_digests, coerce_mmap=True) ==
+            expected)
+    if persistent:
+        monkeypatch.setattr(hashing, '_MMAP_DIGEST_TABLES', {})
+        assert hash(m[10:20], mmap_digests=mmap_digests) == view_hash
+    monkeypatch.undo()
+
+    # Writeable memmaps are hashed by content
+    m_w = np.memmap(filename, dtype=a.dtype, shape=a.shape, mode='r+')
+    assert hashing._get_file_identity(m_w, 'md5') is None
+    m_w[0, 0] += 1
+    m_w.flush()
+    del m_w
+    # The modification time changed, the file is hashed again
+    os.utime(filename, (0, 0))
+    new_hash = hash(reloaded, mmap_digests=mmap_digests, coerce_mmap=True)
+    assert new_hash != expected
+    assert new_hash == hash(np.array(reloaded), cache_digests=True)
+
+
+@with_numpy
+def test_hash_n_threads(monkeypatch):
+    monkeypatch.setattr(hashing, '_TREE_CHUNK_SIZE', 1000)
+    a = np.random.RandomState(0).random_sample((100, 100))
+    expected = hash(a, n_threads=1)
+    assert expected != hash(a)
+    # The digest does not depend on the number of threads
+    for n_threads in [2, 3, 8]:
+        assert hash(a, n_threads=n_threads) == expected
+    assert hash(np.asfortranarray(a), n_threads=4) != expected
+    assert hash(a[::2], n_threads=4) == hash(a[::2], n_threads=1)
+    b = a.copy()
+    b[-1, -1] += 1
+    assert hash(b, n_threads=4) != expected
+    assert hash(a, n_threads=4, hash_name='sha1') != expected
+
+    # The chunk size is part of the scheme
+    monkeypatch.setattr(hashing, '_TREE_CHUNK_SIZE', 2000)
+    assert hash(a, n_threads=4) != expected
+
+
+@parametrize('hash_name', ['blake2b', 'xxh64'])
+def test_hash_name(hash_name):
+    if hash_name in hashing._XXHASH_NAMES:
+        if hashing.xxhash is None:
+            with raises(ValueError, match='xxhash is not installed'):
+                hash([1, 2], hash_name=hash_name)
+            return
+    elif hash_name not in hashlib.algorithms_available:
+        raise SkipTest('hashlib does not support {}'.format(hash_name))
+    assert hash([1, 2], hash_name=hash_name) != hash([1, 2])
+    assert (hash([1, 2], hash_name=hash_name) ==
+            hash([1, 2], hash_name=hash_name))
+
+
+@with_numpy
+@parametrize('block_size', [8, 100, 10000, 2 ** 20])
+@parametrize('n_threads', [None, 2])
+def test_hash_non_contiguous_arrays(monkeypatch, block_size, n_threads):
+    class FlattenedHasher(hashing.NumpyHasher):
+        # Reference implementation, hashing a flattened copy of the array
+        def _iter_bytes(self, obj):
+            if not self._is_single_segment(obj):
+                obj = obj.flatten()
+            yield self._get_bytes(obj)
+
+    monkeypatch.setattr(hashing, '_HASH_BLOCK_SIZE', block_size)
+    monkeypatch.setattr(hashing, '_TREE_CHUNK_SIZE', 1000)
+    rnd = np.random.RandomState(0)
+    arrays = [rnd.random_sample((30, 20, 10))[::2, ::3, 1:],
+              rnd.random_sample((30, 20))[:, ::2],
+              rnd.random_sample(100)[::3],
+              np.arange(100).astype('datetime64[D]')[::2],
+              np.asfortranarray(rnd.random_sample((30, 20)))[::2, 1:]]
+    for a in arrays:
+        assert not (a.flags.c_contiguous or a.flags.f_contiguous)
+        assert (hash(a, n_threads=n_threads) ==
+                FlattenedHasher(n_threads=n_threads).hash(a))
+
+
+with_c_hasher = skipif(sys.version_info < (3, 8),
+                       reason='The C hasher requires Python 3.8')
+
+
+@with_c_hasher
+@parametrize('obj1', input_list)
+@parametrize('obj2', input_list)
+def test_c_hasher_trivial_hash(obj1, obj2):
+    are_hashes_equal = (hash(obj1, c_pickler=True) ==
+                        hash(obj2, c_pickler=True))
+    assert are_hashes_equal == (obj1 is obj2)
+    assert hash(obj1, c_pickler=True) != hash(obj1)
+
+
+@with_c_hasher
+def test_c_hasher_normalization():
+    keys = ['key_%d' % i for i in range(20)]
+    d1 = dict((key, [key, 'aa']) for key in keys)
+    d2 = dict((key, [key, 'aaZ'[:2]]) for key in keys[::-1])
+    assert hash(d1, c_pickler=True) == hash(d2, c_pickler=True)
+    assert (hash(set(keys), c_pickler=True) ==
+            hash(set(keys[::-1]), c_pickler=True))
+    assert (hash(set([Decimal(0), Decimal('NaN')]), c_pickler=True) ==
+            hash(set([Decimal('NaN'), Decimal(0)]), c_pickler=True))
+    assert (hash(collections.OrderedDict(zip(keys, keys)), c_pickler=True) ==
+            hash(collections.OrderedDict(zip(keys[::-1], keys[::-1])),
+                 c_pickler=True))
+
+    # The attributes of instances are normalized as well
+    a, b = Klass(), Klass()
+    a.x, a.y = set(keys), 'aa'
+    b.y, b.x = 'aaZ'[:2], set(keys[::-1])
+    assert hash([a, 'aa'], c_pickler=True) == hash([b, 'aa'], c_pickler=True)
+    b.y = 'ab'
+    assert hash(a, c_pickler=True) != hash(b, c_pickler=True)
+
+    # Keys normalized to unhashable objects
+    assert (hash({frozenset([1, 2]): 1}, c_pickler=True) ==
+            hash({frozenset([2, 1]): 1}, c_pickler=True))
+    assert (hash({frozenset([1, 2]): 1}, c_pickler=True) !=
+            hash({frozenset([1, 3]): 1}, c_pickler=True))
+
+    # Recursive structures
+    l1, l2 = [1], [1]
+    l1.append(l1)
+    l2.append(l2)
+    assert hash(l1, c_pickler=True) == hash(l2, c_pickler=True)
+    d1, d2 = {'a': 1}, {'a': 1}
+    d1['self'] = d1
+    d2['self'] = d2
+    assert hash(d1, c_pickler=True) == hash(d2, c_pickler=True)
+    assert hash(d1, c_pickler=True) != hash({'a': 1}, c_pickler=True)
+
+
+@with_numpy
+@with_c_hasher
+def test_c_hasher_numpy(three_np_arrays):
+    arr1, arr2, arr3 = three_np_arrays
+    assert hash(arr1, c_pickler=True) == hash(arr2, c_pickler=True)
+    assert hash(arr1, c_pickler=True) != hash(arr3, c_pickler=True)
+    assert (hash([arr1, np.dtype('f8')], c_pickler=True) ==
+            hash([arr2, pickle.loads(pickle.dumps(np.dtype('f8')))],
+                 c_pickler=True))
+    assert (hash({np.dtype('f8'): 1}, c_pickler=True) ==
+            hash({pickle.loads(pickle.dumps(np.dtype('f8'))): 1},
+                 c_pickler=True))
+    assert (hash({np.dtype('f8'): 1}, c_pickler=True) !=
+            hash({np.dtype('f4'): 1}, c_pickler=True))
+    assert (hash(arr1, c_pickler=True, n_threads=2) !=
+            hash(arr1, c_pickler=True))
+    a = np.array([{'a': 1, 'b': 2}, 'aa'], dtype=object)
+    b = np.array([{'b': 2, 'a': 1}, 'aaZ'[:2]], dtype=object)
+    assert hash(a, c_pickler=True) == hash(b, c_pickler=True)
+
+    # Dicts and instances holding arrays do not depend on their order, as
+    # with the default hasher.
+    d1 = {'a': np.arange(5), 'b': np.arange(3.)}
+    d2 = {'b': np.arange(3.), 'a': np.arange(5)}
+    o1, o2 = Klass(), Klass()
+    o1.x, o1.y = np.arange(5), np.arange(3.)
+    o2.y, o2.x = np.arange(3.), np.arange(5)
+    for obj1, obj2 in [(d1, d2), (o1, o2), ([d1, o1], [d2, o2])]:
+        assert hash(obj1) == hash(obj2)
+        assert hash(obj1, c_pickler=True) == hash(obj2, c_pickler=True)
+    o2.x = np.arange(6)
+    assert hash(o1, c_pickler=True) != hash(o2, c_pickler=True)
+
+
+@with_c_hasher
+def test_c_hasher_pickling_error():
+    def non_picklable():
+        return 42
+
+    with raises(pickle.PicklingError) as excinfo:
+        hash(non_picklable, c_pickler=True)
+    excinfo.match('PicklingError while hashing')
+
+
+@parametrize('c_pickler', [False, True])
+def test_hash_commutative(c_pickler):
+    if c_pickler and sys.version_info < (3, 8):
+        raise SkipTest('The C hasher requires Python 3.8')
+    keys = ['key_%d' % i for i in range(100)] + list(range(100))
+    d1 = dict((key, [key, {'a': 1, 2: 'b'}]) for key in keys)
+    d2 = dict((key, [key, {2: 'b', 'a': 1}]) for key in keys[::-1])
+    expected = hash(d1, commutative=True, c_pickler=c_pickler)
+    assert hash(d2, commutative=True, c_pickler=c_pickler) == expected
+    assert hash(d1, c_pickler=c_pickler) != expected
+    d2[0] = None
+    assert hash(d2, commutative=True, c_pickler=c_pickler) != expected
+    assert (hash(set(keys), commutative=True, c_pickler=c_pickler) ==
+            hash(set(keys[::-1]), commutative=True, c_pickler=c_pickler))
+    assert (hash(set(keys), commutative=True, c_pickler=c_pickler) !=
+            hash(set(keys[1:]), commutative=True, c_pickler=c_pickler))
+    # The keys are hashed along the values
+    assert (hash({1: 2, 3: 4}, commutative=True, c_pickler=c_pickler) !=
+            hash({1: 4, 3: 2}, commutative=True, c_pickler=c_pickler))
+    assert (hash([{1: 2}, 'aa'], commutative=True, c_pickler=c_pickler) ==
+            hash([{1: 2}, 'aaZ'[:2]], commutative=True, c_pickler=c_pickler))
+
+
+@parametrize('c_pickler', [False, True])
+def test_hash_commutative_recursive(c_pickler):
+    if c_pickler and sys.version_info < (3, 8):
+        raise SkipTest('The C hasher requires Python 3.8')
+
+    def commutative_hash(obj):
+        return hash(obj, commutative=True, c_pickler=c_pickler)
+
+    def make_recursive(key):
+        d = {'a': {}}
+        d['a'][key] = d
+        return d
+
+    expected = commutative_hash(make_recursive('self'))
+    assert commutative_hash(make_recursive('self')) == expected
+    assert commutative_hash(make_recursive('other')) != expected
+    # The containers reached from several places are not recursive
+    d = {'a': 1}
+    assert (commutative_hash([d, {'b': d}]) ==
+            commutative_hash([{'a': 1}, {'b': {'a': 1}}]))
+
+    o1, o2 = Klass(), Klass()
+    o1.attr = {'o': o1}
+    o2.attr = {'o': o2}
+    assert commutative_hash(o1) == commutative_hash(o2)
+    if PY3_OR_LATER:
+        # The python 2 OrderedDict reduces to a list of its items, which
+        # holds the dict itself: pickle recurses infinitely on it as well.
+        od = collections.OrderedDict()
+        od['self'] = od
+        commutative_hash(od)
+
+
+def _make_dataframe():
+    rnd = np.random.RandomState(0)
+    n = 100
+    return pd.DataFrame({
+        'float': rnd.random_sample(n),
+        'int': np.arange(n),
+        'str': ['value_%d' % (i % 7) for i in range(n)],
+        'mixed': [i if i % 2 else str(i) for i in range(n)],
+        'category': pd.Categorical(['a', 'b'] * (n // 2)),
+        'date': pd.date_range('2019-01-01', periods=n, tz='UTC')},
+        index=pd.Index(['row_%d' % i for i in range(n)], name='rows'))
+
+
+@with_numpy
+@with_pandas
+@parametrize('c_pickler', [False, True])
+def test_hash_pandas(c_pickler):
+    if c_pickler and sys.version_info < (3, 8):
+        raise SkipTest('The C hasher requires Python 3.8')
+
+    def pandas_hash(obj):
+        return hash(obj, fast_pandas=True, c_pickler=c_pickler)
+
+    df = _make_dataframe()
+    expected = pandas_hash(df)
+    assert expected != hash(df, c_pickler=c_pickler)
+    assert pandas_hash(_make_dataframe()) == expected
+    assert pandas_hash(pickle.loads(pickle.dumps(df))) == expected
+
+    modified = [df.copy() for _ in range(6)]
+    modified[0].iloc[3, 0] += 1
+    modified[1].loc['row_3', 'str'] = 'other'
+    modified[2].loc['row_2', 'mixed'] = 2
+    modified[3].index = df.index.rename('other')
+    modified[4].columns = ['a', 'b', 'c', 'd', 'e', 'f']
+    modified[5]['date'] = df['date'].dt.tz_convert('Europe/Paris')
+    for other in modified:
+        assert pandas_hash(other) != expected
+
+    series = df['str']
+    assert pandas_hash(series) == pandas_hash(df['str'].copy())
+    assert pandas_hash(series) != pandas_hash(series.rename('other'))
+    assert pandas_hash(series) != pandas_hash(series.reset_index(drop=True))
+    assert (pandas_hash(pd.Series(['1', '2'])) !=
+            pandas_hash(pd.Series([1, 2], dtype=object)))
+
+    multi_index = pd.MultiIndex.from_product([['a', 'b'], [1, 2, 3]])
+    assert (pandas_hash(multi_index) ==
+            pandas_hash(pd.MultiIndex.from_product([['a', 'b'], [1, 2, 3]])))
+    assert (pandas_hash(multi_index) !=
+            pandas_hash(pd.MultiIndex.from_product([['a', 'b'], [1, 2, 4]])))
+    assert pandas_hash(pd.RangeIndex(10)) != pandas_hash(pd.RangeIndex(11))
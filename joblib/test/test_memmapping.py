@@ -5,7 +5,8 @@ import platform
 import gc
 import pickle
 
-from joblib.test.common import with_numpy, np
+from joblib.test.common import with_numpy, np, with_pandas, pd
+from joblib.test.common import with_scipy, sp
 from joblib.test.common import setup_autokill
 from joblib.test.common import teardown_autokill
 from joblib.test.common import with_multiprocessing
@@ -18,11 +19,12 @@ from joblib.pool import MemmappingPool
 from joblib.executor import _TestingMemmappingExecutor
 from joblib._memmapping_reducer import has_shareable_memory
 from joblib._memmapping_reducer import ArrayMemmapReducer
+from joblib._memmapping_reducer import _sparse_matrix_components
 from joblib._memmapping_reducer import reduce_memmap
 from joblib._memmapping_reducer import _strided_from_memmap
 from joblib._memmapping_reducer import _get_backing_memmap
 from joblib._memmapping_reducer import _get_temp_dir
-from joblib._memmapping_reducer import _WeakArrayKeyMap
+from joblib._utils import _WeakArrayKeyMap
 import joblib._memmapping_reducer as jmr
 
 
@@ -60,6 +62,29 @@ def inplace_double(args):
     np.testing.assert_array_equal(data[position], 2 * expected)
 
 
+def dataframe_blocks(df):
+    """Dummy helper function to be executed in subprocesses
+
+    Return the sum of the numeric columns of the DataFrame and, for each of
+    its blocks, whether it is backed by shared memory.
+
+    """
+    return (df.sum(numeric_only=True).sum(),
+            [has_shareable_memory(block.values) for block in df._mgr.blocks])
+
+
+def sparse_components(matrix):
+    """Dummy helper function to be executed in subprocesses
+
+    Return the sum of the sparse matrix and, for each of its data, indices
+    and indptr arrays, whether it is backed by shared memory.
+
+    """
+    return (matrix.sum(),
+            [has_shareable_memory(getattr(matrix, name))
+             for name in ('data', 'indices', 'indptr')])
+
+
 @with_numpy
 @with_multiprocessing
 def test_memmap_based_array_reducing(tmpdir):
@@ -349,6 +374,86 @@ def test_memmapping_pool_for_large_arrays(factory, tmpdir):
         del p
 
 
+@with_pandas
+@with_multiprocessing
+@parametrize("factory", [MemmappingPool, _TestingMemmappingExecutor],
+             ids=["multiprocessing", "loky"])
+def test_memmapping_pool_for_large_dataframes(factory, tmpdir):
+    """Check that DataFrames made of many small blocks are memmapped"""
+    p = factory(3, max_nbytes=400, temp_folder=tmpdir.strpath)
+    try:
+        # Each column added to the frame is a 80 bytes block.
+        df = pd.DataFrame({'text': ['abc'] * 10})
+        for i in range(10):
+            df['x{}'.format(i)] = np.arange(10.)
+        assert len(df._mgr.blocks) == 11
+
+        df_sum, shared = p.map(dataframe_blocks, [df])[0]
+        assert df_sum == 450
+        # The whole frame has been dumped to a single file.
+        assert len(os.listdir(p._temp_folder)) == 1
+        assert shared == [False] + [True] * 10
+
+        # Small frames are pickled.
+        df_sum, shared = p.map(dataframe_blocks, [df.iloc[:, :3]])[0]
+        assert df_sum == 90
+        assert shared == [False] * 3
+        assert len(os.listdir(p._temp_folder)) == 1
+
+        # The frame is dumped again once modified.
+        df['x10'] = np.arange(10.)
+        df_sum, shared = p.map(dataframe_blocks, [df])[0]
+        assert df_sum == 495
+        assert shared == [False] + [True] * 11
+        assert len(os.listdir(p._temp_folder)) == 2
+    finally:
+        p.terminate()
+        del p
+
+
+@with_scipy
+@with_multiprocessing
+@parametrize("factory", [MemmappingPool, _TestingMemmappingExecutor],
+             ids=["multiprocessing", "loky"])
+def test_memmapping_pool_for_large_sparse_matrices(factory, tmpdir):
+    """Check that sparse matrices made of small arrays are memmapped"""
+    p = factory(3, max_nbytes=400, temp_folder=tmpdir.strpath)
+    try:
+        # The data, indices and indptr arrays are 240, 120 and 88 bytes.
+        matrix = sp.random(10, 20, density=0.15, format='csr',
+                           random_state=0).astype(np.float64)
+        matrix.indices = matrix.indices.astype(np.int32)
+        matrix.indptr = matrix.indptr.astype(np.int64)
+        assert matrix.nnz == 30
+        for fmt in ['csr', 'csc']:
+            expected = matrix.asformat(fmt)
+            matrix_sum, shared = p.map(sparse_components, [expected])[0]
+            assert matrix_sum == expected.sum()
+            assert shared == [True] * 3
+
+        # Small matrices are pickled.
+        matrix_sum, shared = p.map(sparse_components, [matrix[:2]])[0]
+        assert matrix_sum == matrix[:2].sum()
+        assert shared == [False] * 3
+        assert len(os.listdir(p._temp_folder)) == 2
+    finally:
+        p.terminate()
+        del p
+
+
+@with_scipy
+@parametrize('fmt', ['csr', 'csc', 'coo', 'bsr', 'dia'])
+def test_sparse_matrix_components(fmt):
+    matrix = sp.random(10, 20, density=0.15, format='coo', random_state=0)
+    matrix = matrix.asformat(fmt)
+    components = _sparse_matrix_components(matrix)
+    assert all(isinstance(component, np.ndarray) for component in components)
+    # The data and the indices of the nonzero values, as 2 arrays for the
+    # COO format, held in a coords tuple by recent scipy versions.
+    n_components = {'csr': 3, 'csc': 3, 'coo': 3, 'bsr': 3, 'dia': 2}[fmt]
+    assert len(components) == n_components
+
+
 @with_numpy
 @with_multiprocessing
 @parametrize("factory", [MemmappingPool, _TestingMemmappingExecutor],
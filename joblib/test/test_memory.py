@@ -18,7 +18,7 @@ import datetime
 import pytest
 
 from joblib.memory import Memory
-from joblib.memory import MemorizedFunc, NotMemorizedFunc
+from joblib.memory import MemorizedFunc, NotMemorizedFunc, MemorizedMethod
 from joblib.memory import MemorizedResult, NotMemorizedResult
 from joblib.memory import _FUNCTION_HASHES
 from joblib.memory import register_store_backend, _STORE_BACKENDS
@@ -27,7 +27,7 @@ from joblib.memory import JobLibCollisionWarning
 from joblib.parallel import Parallel, delayed
 from joblib._store_backends import StoreBackendBase, FileSystemStoreBackend
 from joblib.test.common import with_numpy, np
-from joblib.test.common import with_multiprocessing
+from joblib.test.common import with_multiprocessing, with_zstd
 from joblib.testing import parametrize, raises, warns
 from joblib._compat import PY3_OR_LATER
 from joblib.hashing import hash
@@ -309,6 +309,68 @@ def test_memory_numpy(tmpdir, mmap_mode):
             assert len(accumulator) == i + 1
 
 
+@with_numpy
+def test_memory_numpy_auto_compress(tmpdir):
+    "Check that compress='auto' can be combined with mmap_mode."
+    memory = Memory(location=tmpdir.strpath, mmap_mode='r',
+                    compress='auto', verbose=0)
+
+    @memory.cache()
+    def identity(a):
+        return a
+
+    rnd = np.random.RandomState(0)
+    a = np.frombuffer(rnd.bytes(800000), dtype=np.int64)
+    b = np.arange(100000)
+    with warns(None) as warninfo:
+        identity((a, b))
+        c, d = identity((a, b))
+    assert not [w for w in warninfo if 'mmap' in str(w.message)]
+    assert isinstance(c, np.memmap)
+    np.testing.assert_array_equal(c, a)
+    np.testing.assert_array_equal(d, b)
+
+
+@with_zstd
+def test_memory_compression_dictionary(tmpdir):
+    from joblib.compressor import _ZSTD_DICTIONARIES
+    memory = Memory(location=tmpdir.strpath, compress='zstd', verbose=0)
+
+    @memory.cache()
+    def record(i):
+        return {'name': 'subject_{}'.format(i), 'values': list(range(i % 20)),
+                'tags': ['patient', 'control'][:i % 3]}
+
+    def outputs_size():
+        return sum(os.path.getsize(os.path.join(item.path, 'output.pkl'))
+                   for item in memory.store_backend.get_items())
+
+    for i in range(200):
+        record(i)
+    size = outputs_size()
+    memory.train_compression_dictionary(dict_size=4096)
+    dict_id = memory.store_backend.compression_dictionary.dict_id()
+    # The dictionary is kept when clearing the cache, and makes the small
+    # outputs smaller.
+    memory.clear(warn=False)
+    for i in range(200):
+        record(i)
+    assert outputs_size() < size / 2
+
+    # Another Memory on the same location loads the saved dictionary.
+    _ZSTD_DICTIONARIES.pop(dict_id)
+    memory = Memory(location=tmpdir.strpath, compress=('zstd', 3), verbose=0)
+    assert memory.store_backend.compression_dictionary.dict_id() == dict_id
+    assert memory.cache(record.func)(7) == record.func(7)
+
+
+def test_memory_compression_dictionary_error(tmpdir):
+    memory = Memory(location=tmpdir.strpath, compress=True, verbose=0)
+    with raises(ValueError) as excinfo:
+        memory.train_compression_dictionary()
+    excinfo.match('only used with zstandard compressors')
+
+
 @with_numpy
 def test_memory_numpy_check_mmap_mode(tmpdir, monkeypatch):
     """Check that mmap_mode is respected even at the first call"""
@@ -555,6 +617,145 @@ def test_call_and_shelve_lazily_load_stored_result(tmpdir):
     assert os.stat(result_path).st_atime > first_access_time
 
 
+def test_memorized_func_prefetch(tmpdir):
+    accumulator = list()
+
+    def n(x, y=1):
+        accumulator.append(1)
+        return x + y
+
+    memory = Memory(location=tmpdir.strpath, verbose=0)
+    func = memory.cache(n)
+    for i in range(3):
+        func(i)
+
+    prefetching = func.prefetch([(i,) for i in range(5)], n_jobs=2)
+    prefetching.wait()
+    assert prefetching.get() == [True, True, True, False, False]
+
+    # Prefetching neither calls the function nor alters the cached results
+    assert len(accumulator) == 3
+    assert [func(i) for i in range(3)] == [1, 2, 3]
+    assert len(accumulator) == 3
+
+    assert memory.warm(n, [(0, 1), (0, 2)]).get() == [True, False]
+
+
+def test_prefetch_without_cache():
+    memory = Memory(location=None, verbose=0)
+    assert memory.warm(f, [(1,)]) is None
+    assert memory.cache(f).prefetch([(1,)]) is None
+
+
+def _model_predict(model, x):
+    # Defined at the module level to be pickled by reference on python 2.
+    model.n_calls += 1
+    return [w * x for w in model.weights]
+
+
+class _Model(object):
+    """A class whose hashing by joblib can be monitored."""
+
+    def __init__(self, weights):
+        self.weights = weights
+        self.version = 0
+        self.n_hashed = 0
+        self.n_calls = 0
+
+    def __getstate__(self):
+        self.n_hashed += 1
+        return {'weights': self.weights, 'version': self.version}
+
+    predict = _model_predict
+
+
+class _TokenModel(_Model):
+
+    def __joblib_token__(self):
+        return self.version
+
+
+def test_memory_cache_method(tmpdir, monkeypatch):
+    memory = Memory(location=tmpdir.strpath, verbose=0)
+    monkeypatch.setattr(_Model, 'predict', memory.cache_method(
+        _Model.predict, version_attr='version'))
+
+    model = _Model([1, 2])
+    assert model.predict(2) == [2, 4]
+    assert model.predict(2) == [2, 4]
+    assert model.predict(3) == [3, 6]
+    assert model.n_calls == 2
+    # The instance is hashed only once
+    assert model.n_hashed == 1
+
+    # An identical instance hits the cache
+    other_model = _Model([1, 2])
+    assert other_model.predict(3) == [3, 6]
+    assert other_model.n_calls == 0
+
+    # Bumping the version triggers a new hash of the instance
+    model.weights = [1, 3]
+    model.version += 1
+    assert model.predict(2) == [2, 6]
+    assert model.n_hashed == 2
+    assert model.n_calls == 3
+
+    # Explicit invalidation
+    model.weights = [1, 4]
+    _Model.predict.invalidate(model)
+    assert model.predict(2) == [2, 8]
+    assert model.n_hashed == 3
+    assert model.n_calls == 4
+    assert isinstance(_Model.predict, MemorizedMethod)
+
+
+def test_memory_cache_method_joblib_token(tmpdir, monkeypatch):
+    memory = Memory(location=tmpdir.strpath, verbose=0)
+    monkeypatch.setattr(_TokenModel, 'predict',
+                        memory.cache_method(_Model.predict))
+
+    model = _TokenModel([1, 2])
+    assert model.predict(2) == [2, 4]
+    model.weights = [1, 3]
+    # The token has not changed: the results are considered up to date
+    assert model.predict(2) == [2, 4]
+    model.version = 1
+    assert model.predict(2) == [2, 6]
+    assert model.n_calls == 2
+    assert model.n_hashed == 0
+
+
+def test_memory_cache_method_without_cache():
+    memory = Memory(location=None, verbose=0)
+    predict = memory.cache_method(_model_predict)
+    assert predict is _model_predict
+
+
+def test_memorized_method_pickling(tmpdir):
+    memorized = MemorizedMethod(_Model.predict, tmpdir.strpath, verbose=0,
+                                version_attr='version')
+    assert memorized(_Model([1, 2]), 2) == [2, 4]
+    memorized_reloaded = pickle.loads(pickle.dumps(memorized))
+    assert memorized_reloaded.version_attr == 'version'
+    model = _Model([1, 2])
+    assert memorized_reloaded(model, 2) == [2, 4]
+    assert model.n_calls == 0
+
+
+@with_numpy
+def test_memory_hash_options(tmpdir):
+    memory = Memory(location=tmpdir.strpath, verbose=0,
+                    hash_options=dict(cache_digests=True))
+    a = np.arange(10)
+    func = memory.cache(f)
+    assert func.hash_options == {'cache_digests': True}
+    assert (func._get_argument_hash(a) ==
+            hash({'x': a, 'y': 1}, cache_digests=True))
+    assert func._get_argument_hash(a) != hash({'x': a, 'y': 1})
+    method = memory.cache_method(_Model.predict)
+    assert method.hash_options == {'cache_digests': True}
+
+
 def test_memorized_pickling(tmpdir):
     for func in (MemorizedFunc(f, tmpdir.strpath), NotMemorizedFunc(f)):
         filename = tmpdir.join('pickling_test.dat').strpath
@@ -12,10 +12,13 @@ import zlib
 import bz2
 import pickle
 import socket
+import struct
 from contextlib import closing
 import mmap
 
 from joblib.test.common import np, with_numpy, with_lz4, without_lz4
+from joblib.test.common import with_zstd, without_zstd, with_pandas, pd
+from joblib.test.common import with_scipy, sp
 from joblib.test.common import with_memory_profiler, memory_used
 from joblib.testing import parametrize, raises, SkipTest, warns
 
@@ -25,10 +28,15 @@ from joblib import numpy_pickle, register_compressor
 from joblib.test import data
 
 from joblib._compat import PY3_OR_LATER
+from joblib._memmapping_reducer import has_shareable_memory
 from joblib.numpy_pickle_utils import _IO_BUFFER_SIZE
 from joblib.numpy_pickle_utils import _detect_compressor
 from joblib.compressor import (_COMPRESSORS, _LZ4_PREFIX, CompressorWrapper,
-                               LZ4_NOT_INSTALLED_ERROR, BinaryZlibFile)
+                               LZ4_NOT_INSTALLED_ERROR, BinaryZlibFile,
+                               BlockCompressedFile, _select_filters,
+                               _encode_filters, _decode_filters,
+                               ZstdFile, ZstdCompressorWrapper,
+                               ZSTD_NOT_INSTALLED_ERROR, _ZSTD_PREFIX)
 
 ###############################################################################
 # Define a list of standard types.
@@ -544,7 +552,11 @@ def test_joblib_compression_formats(tmpdir, compress, cmethod):
 
     dump_filename = filename + "." + cmethod
     for obj in objects:
-        if not PY3_OR_LATER and cmethod in ('lzma', 'xz', 'lz4'):
+        if cmethod in ('lzma-mt', 'lz4-mt') and not PY3_OR_LATER:
+            with raises(ValueError):
+                numpy_pickle.dump(obj, dump_filename,
+                                  compress=(cmethod, compress))
+        elif not PY3_OR_LATER and cmethod in ('lzma', 'xz', 'lz4'):
             # Lzma module only available for python >= 3.3
             msg = "{} compression is only available".format(cmethod)
             error = NotImplementedError
@@ -554,16 +566,20 @@ def test_joblib_compression_formats(tmpdir, compress, cmethod):
                 numpy_pickle.dump(obj, dump_filename,
                                   compress=(cmethod, compress))
             excinfo.match(msg)
-        elif cmethod == 'lz4' and with_lz4.args[0]:
+        elif cmethod in ('lz4', 'lz4-mt') and with_lz4.args[0]:
             # Skip the test if lz4 is not installed. We here use the with_lz4
             # skipif fixture whose argument is True when lz4 is not installed
             raise SkipTest("lz4 is not installed.")
+        elif cmethod in ('zstd', 'zstd-mt') and with_zstd.args[0]:
+            raise SkipTest("zstandard is not installed.")
         else:
             numpy_pickle.dump(obj, dump_filename,
                               compress=(cmethod, compress))
-            # Verify the file contains the right magic number
+            # Verify the file contains the right magic number. Zstandard
+            # files do not record the number of threads used.
             with open(dump_filename, 'rb') as f:
-                assert _detect_compressor(f) == cmethod
+                assert _detect_compressor(f) == cmethod.replace('zstd-mt',
+                                                                'zstd')
             # Verify the reloaded object is correct
             obj_reloaded = numpy_pickle.load(dump_filename)
             assert isinstance(obj_reloaded, type(obj))
@@ -694,6 +710,41 @@ def test_in_memory_persistence():
             assert obj_reloaded == obj
 
 
+class ShortReadBytesIO(io.BytesIO):
+    """A file object reading at most a few bytes per readinto call."""
+
+    def readinto(self, b):
+        return io.BytesIO.readinto(self, memoryview(b)[:7])
+
+
+class ReadOnlyFile(object):
+    """A file object without readinto."""
+
+    def __init__(self, data):
+        self._fobj = io.BytesIO(data)
+        self.read = self._fobj.read
+        self.readline = self._fobj.readline
+        self.seek = self._fobj.seek
+        self.tell = self._fobj.tell
+
+
+@with_numpy
+@parametrize('file_class', [io.BytesIO, ShortReadBytesIO, ReadOnlyFile])
+def test_array_read_from_file_object(file_class):
+    array = np.random.RandomState(0).random_sample((100, 30))
+    f = io.BytesIO()
+    numpy_pickle.dump([array, np.asfortranarray(array)], f)
+    data = f.getvalue()
+
+    for array_reloaded in numpy_pickle.load(file_class(data)):
+        np.testing.assert_array_equal(array_reloaded, array)
+
+    # A truncated array buffer is reported whatever the read path.
+    with raises(ValueError) as excinfo:
+        numpy_pickle.load(file_class(data[:len(data) // 3]))
+    excinfo.match('EOF: reading array data')
+
+
 @with_numpy
 def test_file_handle_persistence_mmap(tmpdir):
     obj = np.random.random((10, 10))
@@ -803,6 +854,40 @@ def test_binary_zlibfile(tmpdir, data, compress_level):
     fz.close()
 
 
+def test_binary_zlibfile_readinto(tmpdir):
+    filename = tmpdir.join('test.pkl').strpath
+    rnd = random.Random(0)
+    noise = bytes(bytearray(rnd.randint(0, 255) for _ in range(300000)))
+    # Highly compressible data is decompressed by bounded chunks.
+    data = noise + b'\0' * (3 * 1024 ** 2 + 17) + noise
+    with BinaryZlibFile(filename, 'wb') as fz:
+        fz.write(data)
+
+    with BinaryZlibFile(filename, 'rb') as fz:
+        buf = bytearray(len(data) + 10)
+        view = memoryview(buf)
+        start = 0
+        for size in [0, 1, 7, 100000, 2 * 1024 ** 2, len(data)]:
+            n_read = fz.readinto(view[start:start + size])
+            assert 0 <= n_read <= size
+            assert len(fz._buffer) <= 4 * 1024 ** 2
+            start += n_read
+        assert start == len(data)
+        assert fz.tell() == len(data)
+        assert fz.readinto(view[start:]) == 0
+        assert bytes(buf[:start]) == data
+
+        fz.seek(len(noise) - 3)
+        assert fz.read(5) == noise[-3:] + b'\0\0'
+        fz.seek(len(data) - 10)
+        assert fz.read(100) == noise[-10:]
+        fz.seek(1)
+        assert fz.read() == data[1:]
+        # The requested size is not allocated up front.
+        fz.seek(len(data) - 10)
+        assert fz.read(2 ** 50) == noise[-10:]
+
+
 @parametrize('bad_value', [-1, 10, 15, 'a', (), {}])
 def test_binary_zlibfile_bad_compression_levels(tmpdir, bad_value):
     filename = tmpdir.join('test.pkl').strpath
@@ -828,6 +913,74 @@ def test_binary_zlibfile_invalid_filename_type(bad_file):
     excinfo.match("filename must be a str or bytes object, or a file")
 
 
+@parametrize('codec', ['zlib', 'lz4', 'lzma'])
+def test_block_compressed_file(tmpdir, codec):
+    if codec == 'lz4' and with_lz4.args[0]:
+        raise SkipTest("lz4 is not installed.")
+    if codec != 'zlib' and not PY3_OR_LATER:
+        raise SkipTest("{} block compression requires python 3".format(codec))
+    filename = tmpdir.join('test.pkl').strpath
+    data = b''.join(str(i).encode() for i in range(10000))
+
+    with BlockCompressedFile(filename, 'wb', codec=codec, block_size=1000,
+                             n_threads=3) as f:
+        assert f.writable()
+        # Writes are cut in blocks whatever their size.
+        f.write(data[:10])
+        f.write(memoryview(data)[10:2500])
+        f.write(bytearray(data[2500:]))
+        assert f.tell() == len(data)
+    with open(filename, 'rb') as f:
+        assert _detect_compressor(f) == codec + '-mt'
+
+    with BlockCompressedFile(filename, 'rb', n_threads=2) as f:
+        assert f.readable()
+        assert f.codec == codec
+        assert f.read(10) == data[:10]
+        buffer = bytearray(2490)
+        assert f.readinto(buffer) == len(buffer)
+        assert buffer == data[10:2500]
+        assert f.read() == data[2500:]
+        assert f.read() == b''
+        assert f.tell() == len(data)
+
+    # The block index allows to seek anywhere in the stream.
+    with BlockCompressedFile(filename, 'rb', n_threads=2) as f:
+        assert f.seekable()
+        for offset in [5000, 20, 38000, 999, 1000, 1001, len(data)]:
+            assert f.seek(offset) == offset
+            assert f.read(1500) == data[offset:offset + 1500]
+        f.seek(-10, 2)
+        assert f.read() == data[-10:]
+        f.seek(100)
+        f.seek(50, 1)
+        assert f.tell() == 150
+        assert f.read(5) == data[150:155]
+
+    # A truncated file misses the end-of-stream marker and the index.
+    with open(filename, 'rb') as f:
+        truncated = f.read()[:-2000]
+    with BlockCompressedFile(io.BytesIO(truncated), 'rb') as f:
+        assert not f.seekable()
+        with raises(io.UnsupportedOperation):
+            f.seek(0)
+        with raises(EOFError):
+            f.read()
+
+
+def test_block_compressed_file_errors(tmpdir):
+    filename = tmpdir.join('test.pkl').strpath
+    with raises(ValueError) as excinfo:
+        BlockCompressedFile(filename, 'wb', codec='wrong')
+    excinfo.match("Non valid codec given: 'wrong'")
+    with raises(ValueError) as excinfo:
+        BlockCompressedFile(filename, 'r')
+    excinfo.match("Invalid mode")
+    with raises(ValueError) as excinfo:
+        BlockCompressedFile(io.BytesIO(b'not a block compressed file'))
+    excinfo.match("prefix of a block compressed file")
+
+
 ###############################################################################
 # Test dumping array subclasses
 if np is not None:
@@ -892,6 +1045,30 @@ def test_non_contiguous_array_pickling(tmpdir):
         np.testing.assert_array_equal(array_reloaded, array)
 
 
+@with_numpy
+@parametrize('compress', [0, 3])
+def test_array_buffer_persistence(tmpdir, compress):
+    # Contiguous arrays are written from their buffer, the others from a
+    # scratch buffer: check both paths for a few memory layouts and dtypes.
+    filename = tmpdir.join('test.pkl').strpath
+    rnd = np.random.RandomState(0)
+    records = np.zeros(7, dtype=[('a', 'i4'), ('b', 'f8', (2,))])
+    records['a'] = np.arange(7)
+    for array in [rnd.random_sample((30, 20)),
+                  np.asfortranarray(rnd.random_sample((30, 20))),
+                  rnd.random_sample((30, 20))[::3, ::2],
+                  np.asfortranarray(rnd.random_sample((30, 20)))[1:, ::-2],
+                  np.arange(50).astype('datetime64[D]')[::2],
+                  np.arange(50).astype('datetime64[D]'),
+                  records, records[::2],
+                  np.matrix(rnd.random_sample((3, 4))),
+                  np.zeros((0, 5))]:
+        numpy_pickle.dump(array, filename, compress=compress)
+        array_reloaded = numpy_pickle.load(filename)
+        assert type(array_reloaded) is type(array)
+        np.testing.assert_array_equal(array_reloaded, array)
+
+
 @with_numpy
 def test_pickle_highest_protocol(tmpdir):
     # ensure persistence of a numpy array is valid even when using
@@ -907,6 +1084,531 @@ def test_pickle_highest_protocol(tmpdir):
     np.testing.assert_array_equal(array_reloaded, test_array)
 
 
+class BufferHolder(object):
+    """An object handing its buffer to the pickler with protocol 5."""
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+
+    def __reduce_ex__(self, protocol):
+        if protocol >= 5:
+            return BufferHolder, (pickle.PickleBuffer(self.buffer),)
+        return BufferHolder, (bytes(self.buffer),)
+
+
+@with_numpy
+@parametrize('mmap_mode', [None, 'r', 'r+'])
+def test_pickle_buffer_persistence(tmpdir, mmap_mode):
+    if sys.version_info < (3, 8):
+        raise SkipTest("Pickle protocol 5 requires python 3.8 or later.")
+    filename = tmpdir.join('test.pkl').strpath
+    array = np.random.RandomState(0).random_sample(100)
+    readonly_array = array.copy()
+    readonly_array.flags.writeable = False
+    data = bytearray(b'some data')
+    obj = [BufferHolder(array), BufferHolder(readonly_array),
+           BufferHolder(b''), data, data]
+    numpy_pickle.dump(obj, filename, protocol=5)
+
+    # Buffers are written raw in the file.
+    with open(filename, 'rb') as f:
+        assert array.tobytes() in f.read()
+
+    holder, readonly_holder, empty_holder, data1, data2 = \
+        numpy_pickle.load(filename, mmap_mode=mmap_mode)
+    np.testing.assert_array_equal(np.frombuffer(holder.buffer), array)
+    np.testing.assert_array_equal(np.frombuffer(readonly_holder.buffer),
+                                  array)
+    assert bytes(empty_holder.buffer) == b''
+    if mmap_mode is None:
+        assert type(holder.buffer) is bytearray
+        assert memoryview(readonly_holder.buffer).readonly
+    else:
+        assert isinstance(holder.buffer, np.memmap)
+        assert holder.buffer.flags.writeable == (mmap_mode == 'r+')
+    # Bytearrays are never memory mapped and keep their identity.
+    assert type(data1) is bytearray
+    assert data1 == data
+    assert data1 is data2
+
+
+@with_numpy
+@parametrize('align', [64, 4096])
+@parametrize('protocol', [2, pickle.HIGHEST_PROTOCOL])
+def test_aligned_array_persistence(tmpdir, align, protocol):
+    filename = tmpdir.join('test.pkl').strpath
+    rnd = np.random.RandomState(0)
+    obj = {'a': rnd.random_sample(13), 'b': np.arange(7, dtype=np.int8),
+           'c': [rnd.random_sample((5, 3)), 'some data'],
+           'd': np.array([None, 'object'], dtype=object)}
+    numpy_pickle.dump(obj, filename, protocol=protocol, align=align)
+
+    for mmap_mode in [None, 'r']:
+        obj_reloaded = numpy_pickle.load(filename, mmap_mode=mmap_mode)
+        assert sorted(obj_reloaded) == sorted(obj)
+        for key in 'abd':
+            np.testing.assert_array_equal(obj_reloaded[key], obj[key])
+        np.testing.assert_array_equal(obj_reloaded['c'][0], obj['c'][0])
+        assert obj_reloaded['c'][1] == obj['c'][1]
+        if mmap_mode is not None:
+            for array in (obj_reloaded['a'], obj_reloaded['b'],
+                          obj_reloaded['c'][0]):
+                assert isinstance(array, np.memmap)
+                assert array.offset % align == 0
+                assert array.ctypes.data % align == 0
+
+    # Alignment is also honoured in file objects.
+    f = io.BytesIO()
+    numpy_pickle.dump(obj, f, protocol=protocol, align=align)
+    f.seek(0)
+    obj_reloaded = numpy_pickle.load(f)
+    np.testing.assert_array_equal(obj_reloaded['c'][0], obj['c'][0])
+
+
+@with_numpy
+def test_auto_compress(tmpdir):
+    filename = tmpdir.join('test.pkl').strpath
+    raw_filename = tmpdir.join('test_raw.pkl').strpath
+    rnd = np.random.RandomState(0)
+    obj = {'noise': np.frombuffer(rnd.bytes(800000), dtype=np.int64),
+           'ints': np.arange(200000).reshape(1000, 200),
+           'fortran': np.asfortranarray(np.ones((300, 200))),
+           'small': np.arange(10),
+           'object': np.array([None, 'object'], dtype=object)}
+    numpy_pickle.dump(obj, filename, compress='auto')
+    numpy_pickle.dump(obj, raw_filename)
+
+    # The container itself is not compressed so that uncompressed arrays
+    # can still be memory mapped.
+    with open(filename, 'rb') as f:
+        assert _detect_compressor(f) == 'not-compressed'
+    assert os.stat(filename).st_size < os.stat(raw_filename).st_size
+
+    for mmap_mode in [None, 'r']:
+        obj_reloaded = numpy_pickle.load(filename, mmap_mode=mmap_mode)
+        for key in obj:
+            np.testing.assert_array_equal(obj_reloaded[key], obj[key])
+        assert obj_reloaded['fortran'].flags.f_contiguous
+        if mmap_mode is not None:
+            noise = obj_reloaded['noise']
+            assert isinstance(noise, np.memmap)
+            assert noise.offset % 4096 == 0
+            assert not isinstance(obj_reloaded['ints'], np.memmap)
+
+
+@parametrize('align', [0, -64, 1.5, '64'])
+def test_align_argument_error(tmpdir, align):
+    filename = tmpdir.join('test.pkl').strpath
+    with raises(ValueError) as excinfo:
+        numpy_pickle.dump('some data', filename, align=align)
+    excinfo.match('Non valid align value given')
+
+
+@with_numpy
+@parametrize('mmap_mode', [None, 'r'])
+def test_lazy_load_with_toc(tmpdir, mmap_mode):
+    filename = tmpdir.join('test.pkl').strpath
+    rnd = np.random.RandomState(0)
+    array = rnd.random_sample(10)
+    obj = {'a': array,
+           'b': [np.asfortranarray(rnd.random_sample((3, 4))), 'x', array],
+           'c': 'some data',
+           'd': np.array([None, 'object'], dtype=object),
+           'e': np.matrix([0, 1, 2])}
+    numpy_pickle.dump(obj, filename, toc=True)
+
+    # The table of contents does not prevent regular loads.
+    obj_reloaded = numpy_pickle.load(filename)
+    np.testing.assert_array_equal(obj_reloaded['b'][0], obj['b'][0])
+
+    lazy = numpy_pickle.load(filename, lazy=True, mmap_mode=mmap_mode)
+    assert isinstance(lazy, numpy_pickle.LazyPickle)
+    assert lazy.keys() == ['a', 'b', 'e']
+    assert lazy['b'].keys() == [0, 2]
+    for array_reloaded, expected in [(lazy['a'], obj['a']),
+                                     (lazy['b'][0], obj['b'][0]),
+                                     (lazy['b'][2], obj['b'][2]),
+                                     (lazy['e'], obj['e'])]:
+        assert type(array_reloaded) is (
+            np.memmap if mmap_mode and type(expected) is np.ndarray
+            else type(expected))
+        np.testing.assert_array_equal(array_reloaded, expected)
+    assert lazy['b'][2].flags.f_contiguous == obj['b'][2].flags.f_contiguous
+    # Arrays were read without unpickling the file.
+    assert not lazy._loaded
+
+    # Other members are loaded from the whole object.
+    assert lazy['b'][1] == 'x'
+    assert lazy['c'] == 'some data'
+    np.testing.assert_array_equal(lazy['d'], obj['d'])
+    assert lazy._loaded
+    with raises(KeyError):
+        lazy['missing']
+
+
+@with_numpy
+def test_lazy_load_errors(tmpdir):
+    filename = tmpdir.join('test.pkl').strpath
+    numpy_pickle.dump(np.arange(3), filename)
+    with raises(ValueError) as excinfo:
+        numpy_pickle.load(filename, lazy=True)
+    excinfo.match('has no table of contents')
+
+    with raises(ValueError) as excinfo:
+        numpy_pickle.load(io.BytesIO(), lazy=True)
+    excinfo.match('Lazy loading requires a filename')
+
+    with raises(ValueError) as excinfo:
+        numpy_pickle.dump(np.arange(3), filename, compress=3, toc=True)
+    excinfo.match('table of contents can only be appended to uncompressed '
+                  'or block compressed files')
+
+    with raises(ValueError) as excinfo:
+        numpy_pickle.dump(np.arange(3), io.BytesIO(), toc=True)
+    excinfo.match('table of contents can only be appended to a file given '
+                  'by its filename')
+
+
+@with_numpy
+@parametrize('filters', [False, True])
+def test_lazy_load_block_compressed(tmpdir, filters):
+    filename = tmpdir.join('test.pkl').strpath
+    rnd = np.random.RandomState(0)
+    array = rnd.random_sample((3000, 300))
+    obj = {'a': array, 'b': [np.asfortranarray(array[:10]), 'x'],
+           'c': np.matrix([0, 1, 2])}
+    numpy_pickle.dump(obj, filename, compress=('zlib-mt', 1), toc=True,
+                      filters=filters)
+    np.testing.assert_array_equal(numpy_pickle.load(filename)['a'], array)
+
+    with warns(UserWarning):
+        lazy = numpy_pickle.load(filename, lazy=True, mmap_mode='r')
+    assert lazy.mmap_mode is None
+    lazy_array = lazy['a']
+    assert isinstance(lazy_array, numpy_pickle.LazyArray)
+    assert lazy_array.shape == array.shape
+    assert lazy_array.dtype == array.dtype
+    assert len(lazy_array) == len(array)
+    # Row indexing only decompresses the requested rows, other indexing
+    # the whole array.
+    for key in [5, -1, np.int64(2999), slice(2000, 2010), slice(-5, None),
+                slice(10, 5), (7, slice(3, 8)), (slice(100, 120), 4),
+                slice(None, None, 7), (Ellipsis, 2), [1, 5]]:
+        np.testing.assert_array_equal(lazy_array[key], array[key])
+    with raises(IndexError):
+        lazy_array[3000]
+    np.testing.assert_array_equal(np.asarray(lazy_array), array)
+    np.testing.assert_array_equal(lazy['b'][0][3:5], array[3:5])
+    assert isinstance(lazy['c'].read(), np.matrix)
+    assert not lazy._loaded
+    assert lazy['b'][1] == 'x'
+
+
+@with_numpy
+@parametrize('compress, mmap_mode', [(0, None), (0, 'r'), (3, None),
+                                     (('zlib-mt', 1), None)])
+def test_string_array_persistence(tmpdir, compress, mmap_mode):
+    filename = tmpdir.join('test.pkl').strpath
+    words = [u'', u'joblib', u'caf\xe9', u'\u65e5\u672c', u'\U0001f600']
+    if PY3_OR_LATER:
+        # Lone surrogates, e.g. from undecodable file names.
+        words.append(u'\udcff')
+    text = np.array(words * 50, dtype=object)
+    obj = {'text': text,
+           'fortran': np.asfortranarray(text[:60].reshape(6, 10)),
+           'strided': text[::7],
+           'bytes': np.array([b'', b'a', b'\xff'] * 10, dtype=object),
+           # Strings holding the NUL separator are written with offsets.
+           'nul': np.array([u'', u'a\x00b', u'\x00'] * 10, dtype=object),
+           'nul_bytes': np.array([b'\x00', b'', b'c'], dtype=object),
+           'mixed': np.array([u'a', b'b', None, 1], dtype=object),
+           'scalar': np.array(u'caf\xe9', dtype=object),
+           'empty': np.array([], dtype=object)}
+    numpy_pickle.dump(obj, filename, compress=compress, toc=not compress)
+    obj_reloaded = numpy_pickle.load(filename, mmap_mode=mmap_mode)
+    for key, array in obj.items():
+        array_reloaded = obj_reloaded[key]
+        assert type(array_reloaded) is np.ndarray
+        assert array_reloaded.dtype == object
+        assert array_reloaded.shape == array.shape
+        assert array_reloaded.tolist() == array.tolist()
+        assert ([type(item) for item in array_reloaded.flat] ==
+                [type(item) for item in array.flat])
+    assert obj_reloaded['fortran'].flags.f_contiguous
+
+    if not compress:
+        # Arrays of strings have an entry in the table of contents.
+        lazy = numpy_pickle.load(filename, lazy=True, mmap_mode=mmap_mode)
+        assert sorted(lazy.keys()) == ['bytes', 'fortran', 'nul',
+                                       'nul_bytes', 'scalar', 'strided',
+                                       'text']
+        assert lazy['text'].tolist() == text.tolist()
+        assert lazy['fortran'].tolist() == obj['fortran'].tolist()
+
+    # The strings are not pickled one by one: without the per item opcodes
+    # and memo entries of pickle, distinct strings take less space.
+    words = np.array([u'word_%d' % i for i in range(1000)], dtype=object)
+    numpy_pickle.dump(words, filename)
+    assert os.stat(filename).st_size < len(pickle.dumps(words, protocol=2))
+
+
+@with_pandas
+def test_dataframe_persistence_with_mmap(tmpdir):
+    filename = tmpdir.join('test.pkl').strpath
+    n = 1000
+    df = pd.DataFrame({'floats': np.linspace(0, 1, n),
+                       'ints': np.arange(n),
+                       'dates': pd.date_range('2000', periods=n),
+                       'categories': pd.Categorical(np.arange(n) % 3),
+                       'text': ['row {}'.format(i) for i in range(n)]},
+                      index=pd.Index(np.arange(n) * 2))
+    numpy_pickle.dump(df, filename)
+    df_reloaded = numpy_pickle.load(filename, mmap_mode='r')
+    assert df_reloaded.equals(df)
+
+    # The blocks of the frame and its index are memory mapped.
+    for values in [df_reloaded['floats'].values, df_reloaded['ints'].values,
+                   df_reloaded['dates'].values,
+                   df_reloaded['categories'].values.codes,
+                   df_reloaded.index.values]:
+        assert has_shareable_memory(values)
+        assert not values.flags.writeable
+
+
+@with_scipy
+@parametrize('fmt', ['csr', 'csc', 'coo', 'bsr'])
+def test_sparse_matrix_persistence_with_mmap(tmpdir, fmt):
+    filename = tmpdir.join('test.pkl').strpath
+    matrix = sp.random(300, 200, density=0.1, format=fmt, random_state=0)
+    numpy_pickle.dump(matrix, filename)
+    matrix_reloaded = numpy_pickle.load(filename, mmap_mode='r')
+    assert matrix_reloaded.format == fmt
+    np.testing.assert_array_equal(matrix_reloaded.toarray(),
+                                  matrix.toarray())
+
+    # The arrays of the matrix are memory mapped. Recent scipy versions hold
+    # the row and column indices of the COO format in a coords tuple.
+    components = []
+    for value in vars(matrix_reloaded).values():
+        values = value if isinstance(value, tuple) else [value]
+        components.extend(item for item in values
+                          if isinstance(item, np.ndarray))
+    assert len(components) == 3
+    for values in components:
+        assert has_shareable_memory(values)
+        assert not values.flags.writeable
+
+
+@with_numpy
+@parametrize('compress, mmap_mode, protocol',
+             [(0, None, None), (0, 'r', None), (0, 'r+', 2),
+              (3, None, None), (('zlib-mt', 1), None, None), (0, None, 0)])
+def test_packed_arrays_persistence(tmpdir, compress, mmap_mode, protocol):
+    filename = tmpdir.join('test.pkl').strpath
+    rnd = np.random.RandomState(0)
+    ragged = [rnd.random_sample(rnd.randint(0, 20)) for _ in range(100)]
+    shared = np.arange(3, dtype=np.int16)
+    obj = {'ragged': ragged,
+           'mixed': (np.float32(1) * np.ones((2, 3)), np.array(5),
+                     np.asfortranarray(np.arange(6).reshape(2, 3)),
+                     np.arange(20)[::3], np.zeros(0, dtype=np.uint8),
+                     np.array([1 + 2j, 3j]), np.array([True, False]),
+                     np.arange(3).astype('>i4'),
+                     np.array([(1, 2.)], dtype='i1,f8'),
+                     np.arange(2).astype('M8[D]')),
+           'shared': [shared, shared],
+           'large': np.arange(1000),
+           'objects': np.array([None, 1], dtype=object),
+           'matrix': np.matrix([[1, 2]])}
+    numpy_pickle.dump(obj, filename, compress=compress, protocol=protocol,
+                      pack_size=1024, toc=not compress)
+    obj_reloaded = numpy_pickle.load(filename, mmap_mode=mmap_mode)
+    for array_reloaded, expected in zip(
+            obj_reloaded['ragged'] + list(obj_reloaded['mixed']) +
+            [obj_reloaded[key] for key in ['large', 'objects', 'matrix']],
+            ragged + list(obj['mixed']) +
+            [obj[key] for key in ['large', 'objects', 'matrix']]):
+        assert isinstance(array_reloaded, type(expected))
+        assert array_reloaded.dtype == expected.dtype
+        assert array_reloaded.shape == expected.shape
+        np.testing.assert_array_equal(array_reloaded, expected)
+    assert obj_reloaded['mixed'][2].flags.f_contiguous
+    shared_reloaded = obj_reloaded['shared']
+    np.testing.assert_array_equal(shared_reloaded[0], shared)
+
+    if protocol != 0:
+        # The small arrays are views of one buffer, memory mapped if the
+        # file is not compressed.
+        arena = obj_reloaded['ragged'][0].base
+        for array_reloaded in obj_reloaded['ragged'] + list(
+                obj_reloaded['mixed']):
+            assert array_reloaded.base is arena
+            assert array_reloaded.flags.aligned
+        assert isinstance(arena, np.memmap) == (mmap_mode is not None and
+                                                not compress)
+        assert shared_reloaded[0] is shared_reloaded[1]
+        assert obj_reloaded['large'].base is not arena
+        assert (obj_reloaded['ragged'][0].flags.writeable ==
+                (mmap_mode != 'r'))
+
+    if not compress:
+        # Packed arrays are not listed in the table of contents.
+        lazy = numpy_pickle.load(filename, lazy=True)
+        assert sorted(lazy.keys()) == (
+            ['large', 'matrix'] if protocol != 0
+            else ['large', 'matrix', 'mixed', 'ragged', 'shared'])
+        np.testing.assert_array_equal(lazy['ragged'][3], ragged[3])
+
+    with raises(ValueError) as excinfo:
+        numpy_pickle.dump(obj, filename, pack_size=0)
+    excinfo.match('Non valid pack_size value given')
+
+
+@with_numpy
+def test_string_array_corrupted(tmpdir):
+    filename = tmpdir.join('test.pkl').strpath
+    cases = [([u'abc', u'de'], ('<Q?', 6, True)),
+             ([u'a\x00c', u'de'], ('<Q?3q', 5, False, 0, 3, 5))]
+    for strings, header in cases:
+        numpy_pickle.dump(np.array(strings, dtype=object), filename)
+        with open(filename, 'rb') as f:
+            data = f.read()
+        # Shrink the size of the strings in the header.
+        marker = struct.pack(*header)
+        assert data.count(marker) == 1
+        corrupted = struct.pack(header[0], header[1] - 3, *header[2:])
+        with open(filename, 'wb') as f:
+            f.write(data.replace(marker, corrupted))
+        with raises(ValueError) as excinfo:
+            numpy_pickle.load(filename)
+        excinfo.match('Corrupted object array of strings')
+
+
+@with_numpy
+@parametrize('array, filters',
+             [(np.arange(1000, dtype=np.int64), ('delta', 'shuffle')),
+              (np.arange(1000, dtype=np.uint16)[::-1].copy(), ('shuffle',)),
+              (np.array([5, -3, 2 ** 62, -2 ** 63]), ('shuffle',)),
+              (np.arange(100).astype('M8[s]'), ('delta', 'shuffle')),
+              (np.linspace(0, 1, 1000, dtype=np.float32), ('shuffle',)),
+              (np.ones(10, dtype=np.complex128), ('shuffle',)),
+              (np.arange(100, dtype=np.int8), ()),
+              (np.zeros(10, dtype='i4,f8'), ())])
+def test_array_filters(array, filters):
+    assert _select_filters(array) == filters
+    if not filters:
+        return
+    # Blocks of 7 items are filtered independently.
+    block_size = 7 * array.itemsize
+    data = np.concatenate([_encode_filters(array[i:i + 7], filters)
+                           for i in range(0, array.size, 7)])
+    assert data.dtype == np.uint8
+    assert data.nbytes == array.nbytes
+    _decode_filters(data, array.itemsize, filters, block_size)
+    np.testing.assert_array_equal(data.view(array.dtype), array)
+
+
+@with_numpy
+@parametrize('compress', [('zlib', 3), ('zlib-mt', 3)])
+def test_filtered_array_persistence(tmpdir, compress):
+    filename = tmpdir.join('test.pkl').strpath
+    rnd = np.random.RandomState(0)
+    obj = {'sorted': np.arange(300000).reshape(1000, 300),
+           'floats': np.linspace(0, 1, 300000),
+           'strided': np.linspace(0, 1, 400000).reshape(400, 1000)[::3, ::7],
+           'fortran': np.asfortranarray(rnd.randint(0, 100, (300, 500))),
+           'bytes': rnd.randint(0, 10, 1000).astype(np.int8)}
+    numpy_pickle.dump(obj, filename, compress=compress, filters=True)
+    obj_reloaded = numpy_pickle.load(filename)
+    for key, array in obj.items():
+        np.testing.assert_array_equal(obj_reloaded[key], array)
+    assert obj_reloaded['fortran'].flags.f_contiguous
+
+    # Byte shuffling and delta coding make the arrays more compressible.
+    filtered_size = os.stat(filename).st_size
+    numpy_pickle.dump(obj, filename, compress=compress)
+    assert filtered_size < os.stat(filename).st_size / 2
+
+    # The filters are opt-in, as older joblib versions cannot undo them.
+    with raises(ValueError) as excinfo:
+        numpy_pickle.dump(obj, filename, filters=True)
+    excinfo.match('Filters can only be applied to the arrays of compressed '
+                  'files')
+
+
+@with_zstd
+def test_zstd_compression(tmpdir):
+    # Check that zstandard can be used when dependency is available.
+    compressor = 'zstd'
+    assert compressor in _COMPRESSORS
+    assert _COMPRESSORS[compressor].fileobj_factory == ZstdFile
+
+    fname = tmpdir.join('test.pkl').strpath
+    data = ['test data', list(range(1000))]
+    for compress in ['zstd', ('zstd', 9), 'zstd-mt']:
+        numpy_pickle.dump(data, fname, compress=compress)
+        with open(fname, 'rb') as f:
+            assert f.read(len(_ZSTD_PREFIX)) == _ZSTD_PREFIX
+        assert numpy_pickle.load(fname) == data
+
+    # Test that zstandard is applied based on file extension
+    numpy_pickle.dump(data, fname + '.zst')
+    with open(fname + '.zst', 'rb') as f:
+        assert f.read(len(_ZSTD_PREFIX)) == _ZSTD_PREFIX
+    assert numpy_pickle.load(fname + '.zst') == data
+
+    with raises(ValueError) as excinfo:
+        ZstdFile(fname, 'wb', compresslevel=23)
+    excinfo.match("'compresslevel' must be an integer between 1 and 22")
+
+
+@with_zstd
+def test_zstd_dictionary(tmpdir):
+    import zstandard
+    from joblib.compressor import _ZSTD_DICTIONARIES
+    samples = [pickle.dumps({'name': 'subject_{}'.format(i),
+                             'values': list(range(i % 20))})
+               for i in range(500)]
+    dict_data = zstandard.train_dictionary(2048, samples)
+    fname = tmpdir.join('test.pkl').strpath
+    with ZstdFile(fname, 'wb', dict_data=dict_data) as f:
+        f.write(samples[0])
+    with ZstdFile(fname, 'rb', dict_data=dict_data) as f:
+        assert f.read() == samples[0]
+
+    # Reading requires the dictionary identified in the file.
+    _ZSTD_DICTIONARIES.pop(dict_data.dict_id(), None)
+    with raises(ValueError) as excinfo:
+        with ZstdFile(fname, 'rb') as f:
+            f.read()
+    excinfo.match('unknown zstandard dictionary {}'
+                  .format(dict_data.dict_id()))
+
+    # Wrapping the dictionary in a compressor makes it known.
+    register_compressor('zstd-test-dict',
+                        ZstdCompressorWrapper(dict_data=dict_data))
+    try:
+        numpy_pickle.dump(samples, fname, compress=('zstd-test-dict', 3))
+        assert numpy_pickle.load(fname) == samples
+    finally:
+        _COMPRESSORS.pop('zstd-test-dict')
+        _ZSTD_DICTIONARIES.pop(dict_data.dict_id())
+
+
+@without_zstd
+def test_zstd_compression_without_zstd(tmpdir):
+    # Check that zstandard cannot be used when dependency is not available.
+    fname = tmpdir.join('test.nozstd').strpath
+    data = 'test data'
+    with raises(ValueError) as excinfo:
+        numpy_pickle.dump(data, fname, compress='zstd')
+    excinfo.match(re.escape(ZSTD_NOT_INSTALLED_ERROR))
+
+    with raises(ValueError) as excinfo:
+        numpy_pickle.dump(data, fname + '.zst')
+    excinfo.match(re.escape(ZSTD_NOT_INSTALLED_ERROR))
+
+
 @with_numpy
 def test_pickle_in_socket():
     # test that joblib can pickle in sockets
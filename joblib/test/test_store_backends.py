@@ -12,6 +12,7 @@ from joblib.test.common import with_multiprocessing
 from joblib.backports import concurrency_safe_rename
 from joblib import Parallel, delayed
 from joblib._store_backends import concurrency_safe_write
+from joblib._store_backends import FileSystemStoreBackend, StoreBackendMixin
 
 
 def write_func(output, filename):
@@ -54,3 +55,16 @@ def test_concurrency_safe_write(tmpdir, backend):
              if i % 3 != 2 else load_func for i in range(12)]
     Parallel(n_jobs=2, backend=backend)(
         delayed(func)(obj, filename) for func in funcs)
+
+
+def test_prefetch_item(tmpdir):
+    backend = FileSystemStoreBackend()
+    backend.configure(tmpdir.strpath)
+    backend.dump_item(['func', 'args'], list(range(10)), verbose=0)
+
+    assert backend.prefetch_item(['func', 'args'])
+    assert not backend.prefetch_item(['func', 'missing'])
+    # The generic implementation reads the item through _open_item
+    assert StoreBackendMixin.prefetch_item(backend, ['func', 'args'])
+    assert not StoreBackendMixin.prefetch_item(backend, ['func', 'missing'])
+    assert backend.load_item(['func', 'args'], verbose=0) == list(range(10))